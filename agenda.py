@@ -0,0 +1,192 @@
+import argparse
+from datetime import datetime, timedelta
+
+from conexion import RUTA_BD, abrir_conexion, transaccion
+from consultas_sesiones import consultas
+from migraciones import aplicar_migraciones
+
+FORMATO = '%Y-%m-%d %H:%M'
+DURACION_CITA = 60  # minutos
+# Hasta cuántos días hacia adelante busca siguiente_hueco
+DIAS_BUSQUEDA = 60
+# Los huecos empiezan en múltiplos de estos minutos
+PASO_MINUTOS = 15
+DIAS_SEMANA = ("lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo")
+
+
+def leer_hora(texto):
+    return datetime.strptime(texto, '%H:%M').strftime('%H:%M')
+
+
+def horario_asistente(asistente_id, conn=None):
+    # dia_semana -> [(hora_inicio, hora_fin), ...] ordenados
+    horario = {}
+    for dia, inicio, fin in consultas.consultar("horario_asistente", (asistente_id,), conn):
+        horario.setdefault(dia, []).append((inicio, fin))
+    return horario
+
+
+def guardar_horario(asistente_id, bloques, conn=None):
+    # bloques: [(dia_semana, 'HH:MM', 'HH:MM'), ...]; reemplaza el horario completo
+    filas = []
+    for dia, inicio, fin in bloques:
+        inicio, fin = leer_hora(inicio), leer_hora(fin)
+        if not 0 <= int(dia) <= 6 or fin <= inicio:
+            raise ValueError(f"Bloque de horario inválido: {dia} {inicio}-{fin}")
+        filas.append((asistente_id, int(dia), inicio, fin))
+    with transaccion(conn) as conn:
+        consultas.ejecutar("borrar_horario", (asistente_id,), conn)
+        consultas.ejecutar_lote("insertar_horario", filas, conn)
+
+
+def conflictos(asistente_id, inicio, fin, conn=None):
+    # Citas programadas del asistente que se superponen con [inicio, fin)
+    return consultas.consultar("conflictos_cita", (asistente_id, inicio, fin, inicio), conn)
+
+
+def dentro_del_horario(horario, inicio, fin):
+    dia = datetime.strptime(inicio, FORMATO).weekday()
+    hora_inicio, hora_fin = inicio[11:], fin[11:]
+    return any(desde <= hora_inicio and hora_fin <= hasta for desde, hasta in horario.get(dia, ()))
+
+
+def reservar_cita(asistente_id, inicio, duracion=DURACION_CITA, tratamiento_id=None,
+                  nombre_componente=None, conn=None):
+    # inicio: 'AAAA-MM-DD HH:MM'. Devuelve el id de la cita. La revisión y la
+    # inserción van en la misma transacción; el trigger de citas rechaza
+    # igual cualquier superposición que llegue por otro camino.
+    comienzo = datetime.strptime(inicio, FORMATO)
+    inicio = comienzo.strftime(FORMATO)
+    fin = (comienzo + timedelta(minutes=duracion)).strftime(FORMATO)
+    if fin[:10] != inicio[:10]:
+        raise ValueError("La cita debe terminar el mismo día")
+
+    with transaccion(conn) as conn:
+        horario = horario_asistente(asistente_id, conn)
+        if horario and not dentro_del_horario(horario, inicio, fin):
+            raise ValueError("La cita queda fuera del horario del asistente")
+        if conflictos(asistente_id, inicio, fin, conn):
+            raise ValueError("El asistente ya tiene una cita en ese horario")
+        return consultas.ejecutar("insertar_cita", (
+            asistente_id, tratamiento_id, nombre_componente, inicio, fin,
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        ), conn).lastrowid
+
+
+def cancelar_cita(cita_id, conn=None):
+    with transaccion(conn) as conn:
+        consultas.ejecutar("cancelar_cita", (cita_id,), conn)
+
+
+def agenda_dia(fecha, asistente_id=None, conn=None):
+    # (id, inicio, fin, asistente, paciente, tratamiento, componente)
+    siguiente = (datetime.strptime(fecha, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    if asistente_id is None:
+        return consultas.consultar("agenda", (fecha, siguiente), conn)
+    return consultas.consultar("agenda_asistente", (fecha, siguiente, asistente_id), conn)
+
+
+def proximas_citas(desde, hasta, conn=None):
+    # Sesiones con proxima_cita entre desde y hasta (inclusive):
+    # (proxima_cita, paciente, tratamiento, componente, numero_sesion, asistente)
+    siguiente = (datetime.strptime(hasta, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    return consultas.consultar("proximas_citas", (desde, siguiente), conn)
+
+
+def minutos(texto):
+    # 'HH:MM' o 'AAAA-MM-DD HH:MM' -> minutos desde la medianoche
+    return int(texto[-5:-3]) * 60 + int(texto[-2:])
+
+
+def siguiente_hueco(asistente_id, desde, duracion=DURACION_CITA, dias=DIAS_BUSQUEDA, conn=None):
+    # Primer inicio libre ('AAAA-MM-DD HH:MM') a partir de `desde` dentro del
+    # horario del asistente, o None si no hay horario o lugar en `dias` días.
+    # Las citas del rango se leen en orden del índice y solo hasta el día en
+    # que aparece el hueco.
+    horario = horario_asistente(asistente_id, conn)
+    if not horario:
+        return None
+
+    desde = datetime.strptime(desde, FORMATO) if isinstance(desde, str) else desde
+    resto = desde.minute % PASO_MINUTOS
+    if resto or desde.second or desde.microsecond:
+        desde = desde.replace(second=0, microsecond=0) + timedelta(minutes=PASO_MINUTOS - resto)
+    hasta = desde + timedelta(days=dias)
+
+    cursor = consultas.ejecutar("citas_asistente_rango", (
+        asistente_id, desde.strftime('%Y-%m-%d'), hasta.strftime('%Y-%m-%d')), conn)
+    try:
+        cita = cursor.fetchone()
+        for n in range(dias):
+            dia = desde.date() + timedelta(days=n)
+            texto_dia = dia.strftime('%Y-%m-%d')
+            ocupado = []
+            while cita is not None and cita[0][:10] <= texto_dia:
+                if cita[0][:10] == texto_dia:
+                    ocupado.append((minutos(cita[0]), minutos(cita[1])))
+                cita = cursor.fetchone()
+
+            for hora_inicio, hora_fin in horario.get(dia.weekday(), ()):
+                candidato = minutos(hora_inicio)
+                if n == 0:
+                    candidato = max(candidato, desde.hour * 60 + desde.minute)
+                limite = minutos(hora_fin)
+                for inicio, fin in ocupado:
+                    if fin <= candidato:
+                        continue
+                    if inicio >= limite or inicio - candidato >= duracion:
+                        break
+                    candidato = fin
+                if limite - candidato >= duracion:
+                    return f"{texto_dia} {candidato // 60:02d}:{candidato % 60:02d}"
+    finally:
+        cursor.close()
+    return None
+
+
+def agendar_proxima_cita(conn, asistente_id, tratamiento_id, nombre_componente, desde):
+    # Reserva la próxima cita del tratamiento en el primer hueco del
+    # asistente a partir de `desde`. Devuelve el inicio, o None si el
+    # asistente no tiene horario cargado o no hay lugar.
+    inicio = siguiente_hueco(asistente_id, desde, conn=conn)
+    if inicio is not None:
+        reservar_cita(asistente_id, inicio, tratamiento_id=tratamiento_id,
+                      nombre_componente=nombre_componente, conn=conn)
+    return inicio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agenda de citas")
+    parser.add_argument("--bd", default=RUTA_BD, help="Ruta de la base de datos")
+    parser.add_argument("--dia", help="Mostrar la agenda de un día (AAAA-MM-DD)")
+    parser.add_argument("--asistente", type=int, help="ID del asistente")
+    parser.add_argument("--siguiente", metavar="DESDE",
+                        help="Con --asistente, primer hueco libre desde 'AAAA-MM-DD HH:MM'")
+    parser.add_argument("--horario", nargs=3, action="append", metavar=("DIA", "INICIO", "FIN"),
+                        help="Con --asistente, reemplazar su horario (0 = lunes; repetible)")
+    parser.add_argument("--proximas", nargs=2, metavar=("DESDE", "HASTA"),
+                        help="Sesiones con próxima cita entre dos fechas AAAA-MM-DD")
+    args = parser.parse_args()
+
+    aplicar_migraciones(args.bd)
+    conn = abrir_conexion(args.bd)
+    try:
+        if args.horario:
+            guardar_horario(args.asistente, args.horario, conn)
+            for dia, bloques in sorted(horario_asistente(args.asistente, conn).items()):
+                print(f"{DIAS_SEMANA[dia]}: {', '.join(f'{i}-{f}' for i, f in bloques)}")
+
+        if args.siguiente:
+            print(siguiente_hueco(args.asistente, args.siguiente, conn=conn) or "Sin lugar en los próximos días")
+
+        if args.dia:
+            for _, inicio, fin, asistente, paciente, tratamiento, componente in agenda_dia(args.dia, args.asistente, conn):
+                detalle = f"{tratamiento} - {componente}" if componente else (tratamiento or "")
+                print(f"{inicio[11:]}-{fin[11:]}  {asistente}  {paciente or ''}  {detalle}")
+
+        if args.proximas:
+            for fecha, paciente, tratamiento, componente, numero, asistente in proximas_citas(*args.proximas, conn=conn):
+                detalle = f"{tratamiento} - {componente}" if componente else tratamiento
+                print(f"{fecha}  {paciente}  {detalle} (sesión {numero})  {asistente or 'Sin asistente'}")
+    finally:
+        conn.close()
@@ -0,0 +1,302 @@
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+import conexion
+import servicio_sesiones as servicio
+from comisiones import TOLERANCIA, verificar_tratamientos
+from conexion import RUTA_BD, cerrar_conexiones, obtener_conexion
+from consultas_sesiones import consultas
+from detalle_sesiones import cargar_detalle
+from generador_datos import APELLIDOS
+from migraciones import aplicar_migraciones
+
+# Mide las consultas y escrituras que usa ControlSesiones, a través de
+# servicio_sesiones, sobre una base llenada con generador_datos. Cada
+# medición se repite y se guarda en JSON (mínimo, mediana, p95, máximo)
+# junto con las estadísticas por consulta, para comparar corridas.
+
+REPETICIONES = 50
+# Llamadas sin medir antes de cada medición, para que la caché de páginas y
+# la de sentencias no cuenten en la primera repetición
+CALENTAMIENTO = 3
+PAGINAS_RECORRIDAS = 10
+DIAS_RANGO = 30
+IDS_REFRESCO = 5
+
+# Una fila al azar con id >= ?; se buscan con un id al azar entre 1 y el
+# máximo, sin recorrer la tabla
+MUESTRAS = {
+    "tratamiento": """
+        SELECT id FROM tratamientos_asignados WHERE id >= ? ORDER BY id LIMIT 1
+    """,
+    "individual": """
+        SELECT ta.id
+        FROM tratamientos_asignados ta
+        JOIN tratamientos t ON ta.tratamiento_id = t.id
+        WHERE ta.id >= ? AND NOT t.es_promocion
+        ORDER BY ta.id LIMIT 1
+    """,
+    "promocion": """
+        SELECT ta.id
+        FROM tratamientos_asignados ta
+        JOIN tratamientos t ON ta.tratamiento_id = t.id
+        WHERE ta.id >= ? AND t.es_promocion
+        ORDER BY ta.id LIMIT 1
+    """,
+    "individual_con_restantes": """
+        SELECT ta.id
+        FROM tratamientos_asignados ta
+        JOIN tratamientos t ON ta.tratamiento_id = t.id
+        WHERE ta.id >= ? AND NOT t.es_promocion
+        AND ta.estado = 'ACTIVO' AND ta.estado_inicio = 'INICIADO' AND ta.sesiones_restantes > 0
+        ORDER BY ta.id LIMIT 1
+    """,
+    "componente_con_restantes": """
+        SELECT tratamiento_asignado_id, tratamiento_id
+        FROM promocion_componentes
+        WHERE id >= ? AND sesiones_restantes > 0
+        ORDER BY id LIMIT 1
+    """,
+    "sesion_individual": """
+        SELECT tratamiento_asignado_id, numero_sesion, asistente_id, fecha_sesion, estado_pago
+        FROM sesiones_realizadas
+        WHERE id >= ? AND nombre_componente IS NULL
+        ORDER BY id LIMIT 1
+    """,
+    "sesion_promocion": """
+        SELECT tratamiento_asignado_id, nombre_componente, numero_sesion, asistente_id, fecha_sesion, estado_pago
+        FROM sesiones_realizadas
+        WHERE id >= ? AND nombre_componente IS NOT NULL
+        ORDER BY id LIMIT 1
+    """,
+    "activo": """
+        SELECT id FROM tratamientos_asignados WHERE id >= ? AND estado = 'ACTIVO' ORDER BY id LIMIT 1
+    """,
+}
+
+TABLA_MUESTRA = {
+    "componente_con_restantes": "promocion_componentes",
+    "sesion_individual": "sesiones_realizadas",
+    "sesion_promocion": "sesiones_realizadas",
+}
+
+
+class Muestras:
+    def __init__(self, conn, azar):
+        self.conn = conn
+        self.azar = azar
+        self.maximos = {}
+        self.asistentes = [fila[0] for fila in conn.execute("SELECT id FROM asistentes")]
+
+    def maximo(self, tabla):
+        if tabla not in self.maximos:
+            self.maximos[tabla] = self.conn.execute(f"SELECT IFNULL(MAX(id), 0) FROM {tabla}").fetchone()[0]
+        return self.maximos[tabla]
+
+    def una(self, nombre):
+        maximo = self.maximo(TABLA_MUESTRA.get(nombre, "tratamientos_asignados"))
+        for _ in range(20 if maximo else 0):
+            fila = self.conn.execute(MUESTRAS[nombre], (self.azar.randint(1, maximo),)).fetchone()
+            if fila is not None:
+                return fila
+        # Hacia el final de la tabla puede no quedar ninguna; desde el principio
+        fila = self.conn.execute(MUESTRAS[nombre], (0,)).fetchone()
+        if fila is None:
+            raise LookupError(f"La base no tiene filas para '{nombre}'")
+        return fila
+
+    def fecha(self):
+        return (date.today() - timedelta(days=self.azar.randint(0, 3 * 365))).isoformat()
+
+
+def recorrer_paginas():
+    despues_de = None
+    for _ in range(PAGINAS_RECORRIDAS):
+        _, despues_de = servicio.listar_tratamientos(despues_de)
+        if despues_de is None:
+            break
+
+
+def mediciones(muestras, escrituras=True):
+    # nombre -> (función, preparar); preparar elige los argumentos al azar
+    # fuera del tiempo medido
+    azar = muestras.azar
+
+    def rango_fechas():
+        desde = date.fromisoformat(muestras.fecha())
+        return {"fecha_desde": desde.isoformat(), "fecha_hasta": (desde + timedelta(days=DIAS_RANGO)).isoformat()}
+
+    def sesion_individual():
+        tratamiento_id, numero, asistente_id, fecha, estado_pago = muestras.una("sesion_individual")
+        return (tratamiento_id, numero, fecha, asistente_id or azar.choice(muestras.asistentes),
+                azar.choice((10, 15, 20)), 'Pendiente' if estado_pago == 'PAGADO' else 'PAGADO', True)
+
+    def sesion_promocion():
+        tratamiento_id, componente, numero, asistente_id, fecha, estado_pago = muestras.una("sesion_promocion")
+        return (tratamiento_id, componente, numero, fecha, asistente_id or azar.choice(muestras.asistentes),
+                azar.choice((10, 15, 20)), 'Pendiente' if estado_pago == 'PAGADO' else 'PAGADO', True)
+
+    def nueva_sesion_promocion():
+        tratamiento_id, componente = muestras.una("componente_con_restantes")
+        return (tratamiento_id, azar.choice(muestras.asistentes), muestras.fecha(), azar.choice((10, 15, 20)),
+                azar.choice(('PAGADO', 'Pendiente')), True, componente)
+
+    lista = {
+        "lista_primera_pagina": (servicio.listar_tratamientos, lambda: ((), {})),
+        "lista_paginas": (recorrer_paginas, lambda: ((), {})),
+        "lista_busqueda": (servicio.listar_tratamientos, lambda: ((), {"nombre": azar.choice(APELLIDOS)})),
+        "lista_fechas": (servicio.listar_tratamientos, lambda: ((), rango_fechas())),
+        "lista_refresco": (servicio.tratamientos_por_id, lambda: (
+            ({muestras.una("tratamiento")[0] for _ in range(IDS_REFRESCO)},), {})),
+        "detalle_individual": (cargar_detalle, lambda: ((muestras.una("individual")[0],), {})),
+        "detalle_promocion": (cargar_detalle, lambda: ((muestras.una("promocion")[0],), {})),
+    }
+    if not escrituras:
+        return lista
+
+    lista.update({
+        "registrar_sesion": (servicio.registrar_sesion, lambda: ((
+            muestras.una("individual_con_restantes")[0], azar.choice(muestras.asistentes), muestras.fecha(),
+            azar.choice((10, 15, 20)), azar.choice(('PAGADO', 'Pendiente')), True), {})),
+        "registrar_sesion_promocion": (servicio.registrar_sesion, lambda: (nueva_sesion_promocion(), {})),
+        "modificar_sesion": (servicio.modificar_sesion, lambda: (sesion_individual(), {})),
+        "modificar_sesion_promocion": (servicio.modificar_sesion_promocion, lambda: (sesion_promocion(), {})),
+        "completar_tratamiento": (servicio.completar_tratamiento, lambda: ((muestras.una("activo")[0],), {})),
+    })
+    return lista
+
+
+def verificar_comisiones(muestras):
+    # Registrar una sesión realizada y pagada y después cambiarle el
+    # porcentaje, quitarle el pago y volver a pagarla no debe mover
+    # comision_asistente respecto del libro de comisiones
+    conn = muestras.conn
+    tratamiento_id = muestras.una("individual_con_restantes")[0]
+    asistente_id = muestras.azar.choice(muestras.asistentes)
+    fecha = muestras.fecha()
+
+    def desfase():
+        fila = verificar_tratamientos(conn, [tratamiento_id])
+        return fila[0][1] - fila[0][2] if fila else 0
+
+    inicial = desfase()
+    numero = servicio.registrar_sesion(tratamiento_id, asistente_id, fecha, 20, 'PAGADO', True)
+    pasos = [("registrar", None)] + [
+        (f"modificar a {porcentaje}% {estado_pago}", (porcentaje, estado_pago))
+        for porcentaje, estado_pago in ((15, 'PAGADO'), (15, 'Pendiente'), (10, 'PAGADO'))]
+    for paso, cambio in pasos:
+        if cambio:
+            servicio.modificar_sesion(tratamiento_id, numero, fecha, asistente_id, cambio[0], cambio[1], True)
+        if abs(desfase() - inicial) >= TOLERANCIA:
+            raise AssertionError(f"Tratamiento {tratamiento_id}, sesión {numero}: después de {paso}, "
+                                 f"comision_asistente no coincide con el libro de comisiones")
+
+
+def resumir(tiempos):
+    ordenados = sorted(tiempos)
+    return {
+        "repeticiones": len(tiempos),
+        "min_ms": round(ordenados[0], 3),
+        "mediana_ms": round(statistics.median(ordenados), 3),
+        "p95_ms": round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))], 3),
+        "max_ms": round(ordenados[-1], 3),
+        "promedio_ms": round(statistics.fmean(ordenados), 3),
+    }
+
+
+def medir(funcion, preparar, repeticiones):
+    for _ in range(CALENTAMIENTO):
+        args, kwargs = preparar()
+        funcion(*args, **kwargs)
+    tiempos = []
+    for _ in range(repeticiones):
+        args, kwargs = preparar()
+        inicio = time.perf_counter()
+        funcion(*args, **kwargs)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return resumir(tiempos)
+
+
+def ejecutar(ruta_bd, repeticiones=REPETICIONES, semilla=1, escrituras=True, solo=None, al_medir=None):
+    # El servicio usa la conexión del hilo; se apunta a la base a medir
+    conexion.RUTA_BD = ruta_bd
+    cerrar_conexiones()
+    conn = obtener_conexion()
+    muestras = Muestras(conn, random.Random(semilla))
+    volumen = {tabla: conn.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+               for tabla in ("pacientes", "tratamientos_asignados", "sesiones_realizadas")}
+
+    # Antes de medir, para que una escritura descuadrada no pase inadvertida
+    if escrituras and not solo:
+        verificar_comisiones(muestras)
+
+    consultas.reiniciar_estadisticas()
+    resultados = {}
+    for nombre, (funcion, preparar) in mediciones(muestras, escrituras).items():
+        if solo and nombre not in solo:
+            continue
+        resultados[nombre] = medir(funcion, preparar, repeticiones)
+        if al_medir:
+            al_medir(nombre, resultados[nombre])
+
+    return {
+        "fecha": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "bd": ruta_bd,
+        "volumen": volumen,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "plataforma": platform.platform(),
+        "repeticiones": repeticiones,
+        "semilla": semilla,
+        "resultados": resultados,
+        "consultas": consultas.estadisticas(),
+    }
+
+
+def comparar(actual, anterior):
+    # Una línea por medición presente en las dos corridas: mediana anterior,
+    # actual y cambio
+    lineas = []
+    for nombre, medicion in actual["resultados"].items():
+        previa = anterior.get("resultados", {}).get(nombre)
+        if previa is None:
+            continue
+        antes, ahora = previa["mediana_ms"], medicion["mediana_ms"]
+        cambio = (ahora - antes) / antes * 100 if antes else 0
+        lineas.append(f"{nombre}: {antes:.2f} ms -> {ahora:.2f} ms ({cambio:+.1f}%)")
+    return "\n".join(lineas)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Medir las consultas y escrituras de Control de Sesiones")
+    parser.add_argument("--bd", required=True,
+                        help="Base generada con generador_datos.py; las escrituras medidas quedan guardadas")
+    parser.add_argument("--repeticiones", type=int, default=REPETICIONES)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--solo-lectura", action="store_true", help="Medir solo el listado y el detalle")
+    parser.add_argument("--medicion", action="append", help="Medir solo esta (repetible)")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmark_<fecha>.json)")
+    parser.add_argument("--comparar", metavar="JSON", help="Resultados anteriores contra los que comparar")
+    args = parser.parse_args()
+
+    if args.bd == RUTA_BD:
+        parser.error("use una copia de la base, no la de trabajo")
+    aplicar_migraciones(args.bd)
+
+    resultado = ejecutar(args.bd, args.repeticiones, args.semilla, not args.solo_lectura, args.medicion,
+                         lambda nombre, m: print(f"{nombre}: mediana {m['mediana_ms']:.2f} ms, "
+                                                 f"p95 {m['p95_ms']:.2f} ms, máx {m['max_ms']:.2f} ms"))
+    salida = args.salida or f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(salida, "w", encoding="utf-8") as archivo:
+        json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            print(comparar(resultado, json.load(archivo)))
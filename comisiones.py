@@ -0,0 +1,149 @@
+import argparse
+import json
+from datetime import datetime
+
+from conexion import RUTA_BD, abrir_conexion
+from consultas_sesiones import consultas
+from migraciones import aplicar_migraciones
+
+# Diferencias menores a medio centavo se consideran cero
+TOLERANCIA = 0.005
+
+
+def calcular_comision(monto, porcentaje, realizada, estado_pago):
+    # Solo generan comisión las sesiones realizadas y pagadas
+    if realizada and estado_pago == 'PAGADO':
+        return round(monto * porcentaje / 100, 2)
+    return 0
+
+
+def ajustar_comision_sesion(conn, sesion_id, tratamiento_id, asistente_id, fecha_sesion, monto, concepto):
+    # Deja la comisión neta de la sesión en `monto` para asistente_id en el
+    # periodo de fecha_sesion. Solo se agregan movimientos por la diferencia
+    # con lo ya registrado, así sirve igual para una sesión nueva, un cambio
+    # de porcentaje, de asistente o de fecha, o una comisión que se anula.
+    # Debe llamarse dentro de la transacción que guarda la sesión.
+    periodo = fecha_sesion[:7]
+    objetivo = {(asistente_id, periodo): round(monto, 2)} if monto else {}
+    actual = {(asistente, periodo_actual): total
+              for asistente, periodo_actual, total
+              in consultas.consultar("comision_neta_sesion", (sesion_id,), conn)}
+
+    registrado_en = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for asistente, periodo_mov in sorted(set(actual) | set(objetivo), key=str):
+        diferencia = round(objetivo.get((asistente, periodo_mov), 0) - actual.get((asistente, periodo_mov), 0), 2)
+        if abs(diferencia) >= TOLERANCIA:
+            consultas.ejecutar("insertar_movimiento_comision", (
+                asistente, tratamiento_id, sesion_id, periodo_mov, diferencia, concepto, registrado_en
+            ), conn)
+
+
+def saldo_asistente(asistente_id, periodo=None, conn=None):
+    # Saldo materializado: una sola fila. periodo None es el total histórico.
+    fila = consultas.consultar_uno("saldo_asistente", (asistente_id, periodo or ''), conn)
+    return fila[0] if fila else 0
+
+
+def saldos_periodo(periodo, conn=None):
+    return consultas.consultar("saldos_periodo", (periodo,), conn)
+
+
+def verificar_saldos(conn, reparar=False):
+    # Recalcula los saldos desde el libro y devuelve las filas que no
+    # coinciden como (asistente_id, periodo, esperado, guardado)
+    esperados = {}
+    for asistente, periodo, total, movimientos in conn.execute("""
+        SELECT asistente_id, periodo, SUM(monto), COUNT(*)
+        FROM comisiones_movimientos
+        GROUP BY asistente_id, periodo
+        UNION ALL
+        SELECT asistente_id, '', SUM(monto), COUNT(*)
+        FROM comisiones_movimientos
+        GROUP BY asistente_id
+    """):
+        esperados[(asistente, periodo)] = (total, movimientos)
+
+    guardados = {(asistente, periodo): (total, movimientos)
+                 for asistente, periodo, total, movimientos
+                 in conn.execute("SELECT asistente_id, periodo, total, movimientos FROM comisiones_saldos")}
+
+    diferencias = []
+    for clave in sorted(set(esperados) | set(guardados), key=str):
+        total_esperado, mov_esperados = esperados.get(clave, (0, 0))
+        total_guardado, mov_guardados = guardados.get(clave, (0, 0))
+        if abs(total_esperado - total_guardado) >= TOLERANCIA or mov_esperados != mov_guardados:
+            diferencias.append((clave[0], clave[1], total_esperado, total_guardado))
+
+    if diferencias and reparar:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM comisiones_saldos")
+            conn.executemany(
+                "INSERT INTO comisiones_saldos (asistente_id, periodo, total, movimientos) VALUES (?, ?, ?, ?)",
+                [(asistente, periodo, total, movimientos)
+                 for (asistente, periodo), (total, movimientos) in esperados.items()])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return diferencias
+
+
+def verificar_tratamientos(conn, ids=None):
+    # Compara comision_asistente de cada tratamiento individual con la
+    # comisión neta de sus sesiones en el libro y devuelve los que no
+    # coinciden como (tratamiento_id, comision_asistente, libro). Las
+    # promociones solo van al libro. Sin ids revisa todos.
+    filtro = "" if ids is None else "AND {columna} IN (SELECT value FROM json_each(:ids))"
+    filas = conn.execute(f"""
+        SELECT ta.id, IFNULL(ta.comision_asistente, 0), IFNULL(libro.total, 0)
+        FROM tratamientos_asignados ta
+        JOIN tratamientos t ON ta.tratamiento_id = t.id
+        LEFT JOIN (
+            SELECT tratamiento_asignado_id, SUM(monto) AS total
+            FROM comisiones_movimientos
+            WHERE 1 {filtro.format(columna="tratamiento_asignado_id")}
+            GROUP BY tratamiento_asignado_id
+        ) AS libro ON libro.tratamiento_asignado_id = ta.id
+        WHERE NOT t.es_promocion {filtro.format(columna="ta.id")}
+        ORDER BY ta.id
+    """, {"ids": json.dumps(list(ids or []))}).fetchall()
+    return [(id_, comision, libro) for id_, comision, libro in filas
+            if abs(comision - libro) >= TOLERANCIA]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Libro de comisiones de asistentes")
+    parser.add_argument("--bd", default=RUTA_BD, help="Ruta de la base de datos")
+    parser.add_argument("--verificar", action="store_true",
+                        help="Comparar los saldos guardados y la comisión de cada tratamiento "
+                             "con el libro de movimientos")
+    parser.add_argument("--reparar", action="store_true",
+                        help="Con --verificar, reconstruir los saldos desde el libro")
+    parser.add_argument("--periodo", help="Mostrar los saldos de un periodo (AAAA-MM)")
+    args = parser.parse_args()
+
+    aplicar_migraciones(args.bd)
+    conn = abrir_conexion(args.bd)
+    try:
+        if args.periodo:
+            for asistente_id, nombre, total, movimientos in saldos_periodo(args.periodo, conn):
+                print(f"{nombre or asistente_id}: ${total:.2f} ({movimientos} movimientos)")
+
+        if args.verificar:
+            diferencias = verificar_saldos(conn, args.reparar)
+            for asistente_id, periodo, esperado, guardado in diferencias:
+                print(f"Asistente {asistente_id}, periodo '{periodo or 'total'}': "
+                      f"libro ${esperado:.2f}, saldo ${guardado:.2f}")
+            if not diferencias:
+                print("Los saldos coinciden con el libro de comisiones")
+            elif args.reparar:
+                print(f"{len(diferencias)} saldos reconstruidos desde el libro")
+
+            descuadrados = verificar_tratamientos(conn)
+            for tratamiento_id, comision, libro in descuadrados:
+                print(f"Tratamiento {tratamiento_id}: comision_asistente ${comision:.2f}, libro ${libro:.2f}")
+            if not descuadrados:
+                print("La comisión de cada tratamiento coincide con el libro de comisiones")
+    finally:
+        conn.close()
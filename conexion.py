@@ -0,0 +1,113 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+RUTA_BD = 'spa_database.db'
+CACHE_SENTENCIAS = 512
+
+# Ajustes que se aplican a cada conexión al abrirla. WAL permite que otras
+# estaciones y procesos lean mientras se registra una sesión; con WAL,
+# synchronous=NORMAL sigue siendo seguro ante cortes y evita un fsync por commit.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -32000",        # 32 MB de caché de páginas
+    "PRAGMA mmap_size = 268435456",      # 256 MB de lectura por memoria mapeada
+    "PRAGMA temp_store = MEMORY",
+)
+
+_local = threading.local()
+_conexiones = []
+_candado = threading.Lock()
+
+
+def abrir_conexion(ruta_bd=RUTA_BD):
+    # isolation_level=None: sin transacciones implícitas, las escrituras de
+    # varias sentencias se agrupan con transaccion(). cached_statements amplio
+    # para que todas las consultas registradas se preparen una sola vez.
+    conn = sqlite3.connect(ruta_bd, timeout=10, isolation_level=None,
+                           check_same_thread=False, cached_statements=CACHE_SENTENCIAS)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def obtener_conexion():
+    # Una conexión por hilo, abierta una sola vez y reutilizada en cada llamada
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        # RUTA_BD se lee al abrir, así un script puede apuntar a otra base
+        conn = abrir_conexion(RUTA_BD)
+        _local.conn = conn
+        with _candado:
+            _conexiones.append(conn)
+    return conn
+
+
+def cerrar_conexiones():
+    with _candado:
+        for conn in _conexiones:
+            conn.close()
+        _conexiones.clear()
+    _local.__dict__.clear()
+
+
+@contextmanager
+def transaccion(conn=None):
+    # BEGIN IMMEDIATE toma el bloqueo de escritura al empezar, así dos
+    # estaciones no se bloquean a mitad de la transacción. Si ya hay una
+    # transacción abierta en la conexión, el bloque se suma a ella.
+    # Sin conn se usa la conexión del hilo.
+    conn = conn or obtener_conexion()
+    if conn.in_transaction:
+        yield conn
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+
+
+@contextmanager
+def lectura(conn=None):
+    # Transacción de solo lectura: BEGIN diferido no toma el bloqueo de
+    # escritura, y todas las consultas del bloque ven la misma versión de la
+    # base aunque otra estación escriba en el medio. Si ya hay una
+    # transacción abierta en la conexión, el bloque se suma a ella.
+    conn = conn or obtener_conexion()
+    if conn.in_transaction:
+        yield conn
+        return
+
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.execute("COMMIT")
+
+
+def ejecutar_consulta(query, params=(), fetch=False):
+    if fetch:
+        return obtener_conexion().execute(query, params).fetchall()
+
+    with transaccion() as conn:
+        conn.execute(query, params)
+
+
+def iterar_consulta(query, params=(), tamano=1000, conn=None):
+    # Como ejecutar_consulta(fetch=True) pero entrega las filas en bloques de
+    # fetchmany, sin armar la lista completa del resultado
+    cursor = (conn or obtener_conexion()).execute(query, params)
+    try:
+        while True:
+            bloque = cursor.fetchmany(tamano)
+            if not bloque:
+                return
+            yield bloque
+    finally:
+        cursor.close()
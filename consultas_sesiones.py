@@ -0,0 +1,726 @@
+import atexit
+import json
+import os
+
+from registro_cambios import RegistroCambios
+from registro_consultas import RegistroConsultas
+
+TAMANO_PAGINA = 100
+
+# Columnas del listado principal de Control de Sesiones
+SELECT_LISTA_TRATAMIENTOS = """
+    SELECT
+        ta.id,
+        p.nombre as nombre_paciente,
+        t.nombre as nombre_tratamiento,
+        t.es_promocion,
+        ta.fecha_asignacion as primera_sesion,
+        ta.sesiones_asignadas,
+        ta.sesiones_restantes,
+        CASE
+            WHEN t.es_promocion THEN ta.componentes_pendientes
+            ELSE ta.sesiones_restantes
+        END as componentes_pendientes,
+        ta.estado_inicio
+"""
+
+# Listado ordenado por (fecha_asignacion, id) descendente.
+# La paginación es por conjunto de claves: cada página continúa a partir de
+# la última fila de la anterior, así el costo no depende de cuántas filas
+# ya se hayan recorrido (a diferencia de OFFSET).
+CONSULTA_PAGINA_TRATAMIENTOS = SELECT_LISTA_TRATAMIENTOS + """
+    FROM tratamientos_asignados ta
+    JOIN pacientes p ON ta.paciente_id = p.id
+    JOIN tratamientos t ON ta.tratamiento_id = t.id
+    {where}
+    ORDER BY ta.fecha_asignacion DESC, ta.id DESC
+    LIMIT ?
+"""
+
+# Búsqueda de texto completo sobre busqueda_tratamientos (FTS5), ordenada por
+# relevancia. El nombre del paciente pesa más que el del tratamiento.
+CONSULTA_BUSQUEDA_TEXTO = SELECT_LISTA_TRATAMIENTOS + """
+    FROM busqueda_tratamientos
+    JOIN tratamientos_asignados ta ON ta.id = busqueda_tratamientos.rowid
+    JOIN pacientes p ON ta.paciente_id = p.id
+    JOIN tratamientos t ON ta.tratamiento_id = t.id
+    WHERE busqueda_tratamientos MATCH ?
+    ORDER BY bm25(busqueda_tratamientos, 10.0, 1.0), ta.id DESC
+    LIMIT ? OFFSET ?
+"""
+
+# Filas del listado para un conjunto de ids (lista JSON), para refrescar
+# solo los tratamientos que cambiaron sin volver a paginar
+CONSULTA_TRATAMIENTOS_POR_ID = SELECT_LISTA_TRATAMIENTOS + """
+    FROM tratamientos_asignados ta
+    JOIN pacientes p ON ta.paciente_id = p.id
+    JOIN tratamientos t ON ta.tratamiento_id = t.id
+    WHERE ta.id IN (SELECT value FROM json_each(?))
+"""
+
+# Detalle de un tratamiento: encabezado, todas sus sesiones y, si es una
+# promoción, sus componentes. detalle_sesiones.cargar_detalle las lee juntas
+DETALLE_TRATAMIENTO = """
+    SELECT
+        p.nombre,
+        t.nombre,
+        ta.costo_total,
+        ta.total_pagado,
+        ta.saldo_pendiente,
+        ta.sesiones_asignadas,
+        ta.sesiones_restantes,
+        t.es_promocion
+    FROM tratamientos_asignados ta
+    JOIN pacientes p ON ta.paciente_id = p.id
+    JOIN tratamientos t ON ta.tratamiento_id = t.id
+    WHERE ta.id = ?
+"""
+
+DETALLE_SESIONES = """
+    SELECT
+        sr.numero_sesion,
+        sr.fecha_sesion,
+        a.nombre as esteticista,
+        sr.monto_abonado,
+        sr.estado_pago,
+        sr.proxima_cita,
+        sr.estado_sesion,
+        sr.comision_sumada,
+        sr.realizada,
+        sr.nombre_componente
+    FROM sesiones_realizadas sr
+    LEFT JOIN asistentes a ON sr.asistente_id = a.id
+    WHERE sr.tratamiento_asignado_id = ?
+    ORDER BY sr.nombre_componente, sr.numero_sesion
+"""
+
+DETALLE_COMPONENTES = """
+    SELECT
+        pd.nombre_componente,
+        pc.id as componente_id,
+        pd.cantidad_sesiones,
+        COALESCE(pc.sesiones_restantes, pd.cantidad_sesiones) as sesiones_restantes,
+        pd.precio_componente
+    FROM tratamientos_asignados ta
+    JOIN promocion_detalles pd ON pd.promocion_id = ta.tratamiento_id
+    LEFT JOIN promocion_componentes pc ON pc.tratamiento_asignado_id = ta.id
+        AND pc.tratamiento_id = pd.nombre_componente
+    WHERE ta.id = ?
+    ORDER BY pd.nombre_componente
+"""
+
+# Componentes de promociones. El progreso lo mantienen los triggers de la
+# migración 13; no hace falta contar sesiones.
+COMPONENTE_PROMOCION = """
+    SELECT
+        pd.nombre_componente,
+        pd.cantidad_sesiones,
+        COALESCE(pc.sesiones_restantes, pd.cantidad_sesiones) as sesiones_restantes,
+        IFNULL(pc.sesiones_realizadas, 0) AS sesiones_realizadas,
+        pc.id as componente_id
+    FROM tratamientos_asignados ta
+    JOIN promocion_detalles pd ON pd.promocion_id = ta.tratamiento_id
+    LEFT JOIN promocion_componentes pc ON ta.id = pc.tratamiento_asignado_id
+        AND pd.nombre_componente = pc.tratamiento_id
+    WHERE ta.id = ? AND pd.nombre_componente = ?
+"""
+
+# Formularios de sesiones
+LISTA_ASISTENTES = "SELECT id, nombre FROM asistentes ORDER BY nombre"
+
+# Datos de referencia (ver datos_referencia)
+VERSION_REFERENCIA = "SELECT version FROM version_referencia WHERE id = 1"
+
+CATALOGO_TRATAMIENTOS = "SELECT id, nombre, precio, es_promocion FROM tratamientos"
+
+DEFINICIONES_PROMOCIONES = """
+    SELECT promocion_id, nombre_componente, cantidad_sesiones, precio_componente
+    FROM promocion_detalles
+    ORDER BY promocion_id, nombre_componente
+"""
+
+ES_PROMOCION = """
+    SELECT t.es_promocion
+    FROM tratamientos t
+    JOIN tratamientos_asignados ta ON t.id = ta.tratamiento_id
+    WHERE ta.id = ?
+"""
+
+SESIONES_RESTANTES = """
+    SELECT sesiones_restantes
+    FROM tratamientos_asignados
+    WHERE id = ?
+"""
+
+INFO_TRATAMIENTO_SESION = """
+    SELECT
+        p.nombre,
+        t.nombre,
+        ta.sesiones_restantes,
+        ta.costo_total / ta.sesiones_asignadas as costo_por_sesion,
+        ta.costo_total
+    FROM tratamientos_asignados ta
+    JOIN pacientes p ON ta.paciente_id = p.id
+    JOIN tratamientos t ON ta.tratamiento_id = t.id
+    WHERE ta.id = ?
+"""
+
+ESTADO_SESION = """
+    SELECT realizada, porcentaje_asistente, comision_sumada, id, asistente_id
+    FROM sesiones_realizadas
+    WHERE tratamiento_asignado_id = ? AND numero_sesion = ?
+"""
+
+DETALLE_SESION_PROMOCION = """
+    SELECT
+        sr.asistente_id,
+        sr.porcentaje_asistente,
+        sr.estado_pago,
+        sr.fecha_sesion,
+        sr.realizada,
+        sr.monto_abonado
+    FROM sesiones_realizadas sr
+    WHERE sr.tratamiento_asignado_id = ? AND sr.numero_sesion = ?
+"""
+
+# Datos para validar un lote de sesiones (ids como lista JSON)
+LOTE_TRATAMIENTOS = """
+    SELECT
+        ta.id,
+        t.es_promocion,
+        ta.sesiones_restantes,
+        ta.costo_total / ta.sesiones_asignadas as costo_por_sesion
+    FROM tratamientos_asignados ta
+    JOIN tratamientos t ON ta.tratamiento_id = t.id
+    WHERE ta.id IN (SELECT value FROM json_each(?))
+"""
+
+LOTE_COMPONENTES = """
+    SELECT
+        ta.id,
+        pd.nombre_componente,
+        COALESCE(pc.sesiones_restantes, pd.cantidad_sesiones) as sesiones_restantes,
+        pd.precio_componente,
+        pc.id as componente_id
+    FROM tratamientos_asignados ta
+    JOIN promocion_detalles pd ON pd.promocion_id = ta.tratamiento_id
+    LEFT JOIN promocion_componentes pc ON pc.tratamiento_asignado_id = ta.id
+        AND pc.tratamiento_id = pd.nombre_componente
+    WHERE ta.id IN (SELECT value FROM json_each(?))
+"""
+
+# Registro y modificación de sesiones. proxima_cita se calcula en SQL a
+# partir de la fecha de la sesión (una semana después).
+INSERTAR_SESION = """
+    INSERT INTO sesiones_realizadas (
+        tratamiento_asignado_id,
+        asistente_id,
+        fecha_sesion,
+        numero_sesion,
+        monto_abonado,
+        estado_pago,
+        estado_sesion,
+        porcentaje_asistente,
+        proxima_cita,
+        comision_sumada,
+        realizada
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, date(?, '+7 days'), ?, ?)
+"""
+
+INSERTAR_SESION_PROMOCION = """
+    INSERT INTO sesiones_realizadas (
+        tratamiento_asignado_id,
+        nombre_componente,
+        asistente_id,
+        fecha_sesion,
+        numero_sesion,
+        monto_abonado,
+        estado_pago,
+        estado_sesion,
+        porcentaje_asistente,
+        proxima_cita,
+        realizada
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, date(?, '+7 days'), ?)
+"""
+
+# Numeración de sesiones: reservar el siguiente número del tratamiento (o
+# componente) en secuencias_sesion. Debe ejecutarse en la misma transacción
+# BEGIN IMMEDIATE que inserta la sesión; el bloqueo de escritura evita que
+# dos estaciones obtengan el mismo número.
+RESERVAR_NUMEROS_SESION = """
+    INSERT INTO secuencias_sesion (tratamiento_asignado_id, nombre_componente, ultimo_numero)
+    VALUES (?, ?, ?)
+    ON CONFLICT (tratamiento_asignado_id, nombre_componente)
+    DO UPDATE SET ultimo_numero = ultimo_numero + excluded.ultimo_numero
+"""
+
+ULTIMO_NUMERO_SESION = """
+    SELECT ultimo_numero
+    FROM secuencias_sesion
+    WHERE tratamiento_asignado_id = ? AND nombre_componente = ?
+"""
+
+ACTUALIZAR_SESION = """
+    UPDATE sesiones_realizadas
+    SET fecha_sesion = ?,
+        asistente_id = ?,
+        monto_abonado = ?,
+        estado_pago = ?,
+        realizada = ?,
+        estado_sesion = ?,
+        porcentaje_asistente = ?,
+        comision_sumada = ?
+    WHERE tratamiento_asignado_id = ? AND numero_sesion = ?
+"""
+
+ACTUALIZAR_SESION_PROMOCION = """
+    UPDATE sesiones_realizadas
+    SET fecha_sesion = ?,
+        asistente_id = ?,
+        estado_pago = ?,
+        porcentaje_asistente = ?,
+        monto_abonado = ?,
+        proxima_cita = date(?, '+7 days'),
+        realizada = ?,
+        estado_sesion = ?
+    WHERE tratamiento_asignado_id = ?
+    AND nombre_componente = ?
+    AND numero_sesion = ?
+"""
+
+REGISTRAR_PAGO_SESION = """
+    UPDATE tratamientos_asignados
+    SET sesiones_restantes = sesiones_restantes - 1,
+        total_pagado = total_pagado + ?,
+        saldo_pendiente = saldo_pendiente - ?
+    WHERE id = ?
+"""
+
+DESCONTAR_SESION_RESTANTE = """
+    UPDATE tratamientos_asignados
+    SET sesiones_restantes = sesiones_restantes - 1
+    WHERE id = ?
+"""
+
+DEVOLVER_SESION_RESTANTE = """
+    UPDATE tratamientos_asignados
+    SET sesiones_restantes = sesiones_restantes + 1
+    WHERE id = ?
+"""
+
+SUMAR_COMISION_TRATAMIENTO = """
+    UPDATE tratamientos_asignados
+    SET comision_asistente = comision_asistente + ?
+    WHERE id = ?
+"""
+
+RESTAR_COMISION_TRATAMIENTO = """
+    UPDATE tratamientos_asignados
+    SET comision_asistente = comision_asistente - ?
+    WHERE id = ?
+"""
+
+INSERTAR_PAGO_ASISTENTE = """
+    INSERT INTO pagos_asistentes (
+        asistente_id,
+        tratamiento_asignado_id,
+        sesion_id,
+        monto,
+        fecha_pago,
+        tipo_comision,
+        detalle
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Pago al asistente de una sesión recién insertada, buscada por su número
+INSERTAR_PAGO_SESION_NUEVA = """
+    INSERT INTO pagos_asistentes (
+        asistente_id,
+        tratamiento_asignado_id,
+        sesion_id,
+        monto,
+        fecha_pago,
+        tipo_comision,
+        detalle
+    ) VALUES (?, ?, (
+        SELECT id
+        FROM sesiones_realizadas
+        WHERE tratamiento_asignado_id = ?
+        AND nombre_componente IS NULL
+        AND numero_sesion = ?
+    ), ?, ?, 'Sesion', ?)
+"""
+
+# Libro de comisiones (ver comisiones.py)
+INSERTAR_MOVIMIENTO_COMISION = """
+    INSERT INTO comisiones_movimientos (
+        asistente_id,
+        tratamiento_asignado_id,
+        sesion_id,
+        periodo,
+        monto,
+        concepto,
+        registrado_en
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+COMISION_NETA_SESION = """
+    SELECT asistente_id, periodo, SUM(monto)
+    FROM comisiones_movimientos
+    WHERE sesion_id = ?
+    GROUP BY asistente_id, periodo
+"""
+
+SALDO_ASISTENTE = """
+    SELECT total, movimientos
+    FROM comisiones_saldos
+    WHERE asistente_id = ? AND periodo = ?
+"""
+
+SALDOS_PERIODO = """
+    SELECT cs.asistente_id, a.nombre, cs.total, cs.movimientos
+    FROM comisiones_saldos cs
+    LEFT JOIN asistentes a ON a.id = cs.asistente_id
+    WHERE cs.periodo = ?
+    ORDER BY a.nombre
+"""
+
+# Resúmenes por periodo. Los periodos diarios ('AAAA-MM-DD') y mensuales
+# ('AAAA-MM') comparten tabla; el largo del periodo elige cuáles se leen.
+RESUMEN_SESIONES = """
+    SELECT
+        rs.periodo,
+        t.nombre as tratamiento,
+        a.nombre as asistente,
+        rs.sesiones,
+        rs.sesiones_completas,
+        rs.monto_abonado,
+        rs.monto_cobrado
+    FROM resumen_sesiones rs
+    LEFT JOIN tratamientos t ON t.id = rs.tratamiento_id
+    LEFT JOIN asistentes a ON a.id = rs.asistente_id
+    WHERE rs.periodo >= ? AND rs.periodo <= ? AND length(rs.periodo) = ?
+    ORDER BY rs.periodo, t.nombre, a.nombre
+"""
+
+RESUMEN_TRATAMIENTOS = """
+    SELECT
+        rt.periodo,
+        t.nombre as tratamiento,
+        rt.tratamientos,
+        rt.costo_total,
+        rt.total_pagado,
+        rt.saldo_pendiente
+    FROM resumen_tratamientos rt
+    LEFT JOIN tratamientos t ON t.id = rt.tratamiento_id
+    WHERE rt.periodo >= ? AND rt.periodo <= ? AND length(rt.periodo) = ?
+    ORDER BY rt.periodo, t.nombre
+"""
+
+RESUMEN_REPORTES = """
+    SELECT periodo, concepto, movimientos, ingreso, egreso
+    FROM resumen_reportes
+    WHERE periodo >= ? AND periodo <= ? AND length(periodo) = ?
+    ORDER BY periodo, concepto
+"""
+
+# Comisión de una sesión recién insertada, ubicada por su número; para
+# registrar lotes con executemany sin leer el id de cada sesión
+INSERTAR_COMISION_SESION_NUEVA = """
+    INSERT INTO comisiones_movimientos (
+        asistente_id,
+        tratamiento_asignado_id,
+        sesion_id,
+        periodo,
+        monto,
+        concepto,
+        registrado_en
+    ) VALUES (?, ?, (
+        SELECT id
+        FROM sesiones_realizadas
+        WHERE tratamiento_asignado_id = ?
+        AND IFNULL(nombre_componente, '') = ?
+        AND numero_sesion = ?
+    ), ?, ?, ?, ?)
+"""
+
+ID_SESION_COMPONENTE = """
+    SELECT id
+    FROM sesiones_realizadas
+    WHERE tratamiento_asignado_id = ? AND nombre_componente = ? AND numero_sesion = ?
+"""
+
+# Agenda de citas. Las fechas y horas van en 'AAAA-MM-DD HH:MM', así el
+# orden del texto es el orden cronológico.
+HORARIO_ASISTENTE = """
+    SELECT dia_semana, hora_inicio, hora_fin
+    FROM horarios_asistentes
+    WHERE asistente_id = ?
+    ORDER BY dia_semana, hora_inicio
+"""
+
+BORRAR_HORARIO = "DELETE FROM horarios_asistentes WHERE asistente_id = ?"
+
+INSERTAR_HORARIO = """
+    INSERT INTO horarios_asistentes (asistente_id, dia_semana, hora_inicio, hora_fin)
+    VALUES (?, ?, ?, ?)
+"""
+
+CITAS_ASISTENTE_RANGO = """
+    SELECT inicio, fin
+    FROM citas
+    WHERE asistente_id = ? AND estado = 'PROGRAMADA'
+    AND inicio >= ? AND inicio < ?
+    ORDER BY inicio
+"""
+
+# Citas que se superponen con [inicio, fin); params (asistente, inicio, fin,
+# inicio). Las citas no cruzan de un día a otro, así que basta buscar desde
+# el comienzo del día
+CONFLICTOS_CITA = """
+    SELECT id, inicio, fin
+    FROM citas
+    WHERE asistente_id = ? AND estado = 'PROGRAMADA'
+    AND inicio >= substr(?, 1, 10) AND inicio < ? AND fin > ?
+"""
+
+INSERTAR_CITA = """
+    INSERT INTO citas (
+        asistente_id,
+        tratamiento_asignado_id,
+        nombre_componente,
+        inicio,
+        fin,
+        creada_en
+    ) VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+CANCELAR_CITA = "UPDATE citas SET estado = 'CANCELADA' WHERE id = ?"
+
+AGENDA = """
+    SELECT
+        c.id,
+        c.inicio,
+        c.fin,
+        a.nombre as asistente,
+        p.nombre as paciente,
+        t.nombre as tratamiento,
+        c.nombre_componente
+    FROM citas c
+    LEFT JOIN asistentes a ON c.asistente_id = a.id
+    LEFT JOIN tratamientos_asignados ta ON c.tratamiento_asignado_id = ta.id
+    LEFT JOIN pacientes p ON ta.paciente_id = p.id
+    LEFT JOIN tratamientos t ON ta.tratamiento_id = t.id
+    WHERE c.estado = 'PROGRAMADA' AND c.inicio >= ? AND c.inicio < ?
+    {filtro}
+    ORDER BY c.inicio, a.nombre
+"""
+
+ACTUALIZAR_PROXIMA_CITA = """
+    UPDATE sesiones_realizadas
+    SET proxima_cita = ?
+    WHERE tratamiento_asignado_id = ?
+    AND IFNULL(nombre_componente, '') = ?
+    AND numero_sesion = ?
+"""
+
+# Sesiones cuya próxima cita cae en [desde, hasta); usa idx_sesiones_proxima_cita
+PROXIMAS_CITAS = """
+    SELECT
+        sr.proxima_cita,
+        p.nombre,
+        t.nombre,
+        sr.nombre_componente,
+        sr.numero_sesion,
+        a.nombre
+    FROM sesiones_realizadas sr
+    JOIN tratamientos_asignados ta ON sr.tratamiento_asignado_id = ta.id
+    JOIN pacientes p ON ta.paciente_id = p.id
+    JOIN tratamientos t ON ta.tratamiento_id = t.id
+    LEFT JOIN asistentes a ON sr.asistente_id = a.id
+    WHERE sr.proxima_cita >= ? AND sr.proxima_cita < ?
+    ORDER BY sr.proxima_cita, p.nombre
+"""
+
+# Tratamientos completados
+INACTIVAR_TRATAMIENTO = "UPDATE tratamientos_asignados SET estado = 'INACTIVO' WHERE id = ?"
+
+INFO_REPORTE_TRATAMIENTO = """
+    SELECT p.nombre, t.nombre, t.precio
+    FROM tratamientos_asignados ta
+    JOIN pacientes p ON ta.paciente_id = p.id
+    JOIN tratamientos t ON ta.tratamiento_id = t.id
+    WHERE ta.id = ?
+"""
+
+INSERTAR_REPORTE = """
+    INSERT INTO reportes (
+        fecha,
+        concepto,
+        ingreso,
+        egreso,
+        detalle
+    )
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+
+# Filtros del listado: cada combinación es una consulta registrada aparte
+FILTRO_FECHAS = "ta.fecha_asignacion >= ? AND ta.fecha_asignacion <= ?"
+FILTRO_SIGUIENTE_PAGINA = "(ta.fecha_asignacion, ta.id) < (?, ?)"
+# Los tratamientos sin iniciar (fecha_asignacion NULL) van al final del
+# listado; la comparación por (fecha, id) no los incluye, así que se
+# recorren aparte por id
+FILTRO_SIN_INICIAR = "ta.fecha_asignacion IS NULL"
+FILTRO_SIN_INICIAR_SIGUIENTE_PAGINA = "ta.fecha_asignacion IS NULL AND ta.id < ?"
+
+# Todas las consultas que usa Control de Sesiones, por nombre. Las variantes
+# del listado se incluyen ya armadas para poder revisar su plan de ejecución.
+CONSULTAS = {
+    "listado": CONSULTA_PAGINA_TRATAMIENTOS.format(where=""),
+    "listado_siguiente_pagina": CONSULTA_PAGINA_TRATAMIENTOS.format(
+        where=f"WHERE {FILTRO_SIGUIENTE_PAGINA}"),
+    "listado_por_fechas": CONSULTA_PAGINA_TRATAMIENTOS.format(
+        where=f"WHERE {FILTRO_FECHAS}"),
+    "listado_por_fechas_siguiente_pagina": CONSULTA_PAGINA_TRATAMIENTOS.format(
+        where=f"WHERE {FILTRO_FECHAS} AND {FILTRO_SIGUIENTE_PAGINA}"),
+    "listado_sin_iniciar": CONSULTA_PAGINA_TRATAMIENTOS.format(
+        where=f"WHERE {FILTRO_SIN_INICIAR}"),
+    "listado_sin_iniciar_siguiente_pagina": CONSULTA_PAGINA_TRATAMIENTOS.format(
+        where=f"WHERE {FILTRO_SIN_INICIAR_SIGUIENTE_PAGINA}"),
+    "busqueda_texto": CONSULTA_BUSQUEDA_TEXTO,
+    "listado_por_ids": CONSULTA_TRATAMIENTOS_POR_ID,
+    "detalle_tratamiento": DETALLE_TRATAMIENTO,
+    "detalle_sesiones": DETALLE_SESIONES,
+    "detalle_componentes": DETALLE_COMPONENTES,
+    "componente_promocion": COMPONENTE_PROMOCION,
+    "lista_asistentes": LISTA_ASISTENTES,
+    "version_referencia": VERSION_REFERENCIA,
+    "catalogo_tratamientos": CATALOGO_TRATAMIENTOS,
+    "definiciones_promociones": DEFINICIONES_PROMOCIONES,
+    "es_promocion": ES_PROMOCION,
+    "sesiones_restantes": SESIONES_RESTANTES,
+    "info_tratamiento_sesion": INFO_TRATAMIENTO_SESION,
+    "estado_sesion": ESTADO_SESION,
+    "detalle_sesion_promocion": DETALLE_SESION_PROMOCION,
+    "lote_tratamientos": LOTE_TRATAMIENTOS,
+    "lote_componentes": LOTE_COMPONENTES,
+    "insertar_sesion": INSERTAR_SESION,
+    "insertar_sesion_promocion": INSERTAR_SESION_PROMOCION,
+    "reservar_numeros_sesion": RESERVAR_NUMEROS_SESION,
+    "ultimo_numero_sesion": ULTIMO_NUMERO_SESION,
+    "actualizar_sesion": ACTUALIZAR_SESION,
+    "actualizar_sesion_promocion": ACTUALIZAR_SESION_PROMOCION,
+    "registrar_pago_sesion": REGISTRAR_PAGO_SESION,
+    "descontar_sesion_restante": DESCONTAR_SESION_RESTANTE,
+    "devolver_sesion_restante": DEVOLVER_SESION_RESTANTE,
+    "sumar_comision_tratamiento": SUMAR_COMISION_TRATAMIENTO,
+    "restar_comision_tratamiento": RESTAR_COMISION_TRATAMIENTO,
+    "insertar_pago_asistente": INSERTAR_PAGO_ASISTENTE,
+    "insertar_pago_sesion_nueva": INSERTAR_PAGO_SESION_NUEVA,
+    "insertar_movimiento_comision": INSERTAR_MOVIMIENTO_COMISION,
+    "comision_neta_sesion": COMISION_NETA_SESION,
+    "saldo_asistente": SALDO_ASISTENTE,
+    "saldos_periodo": SALDOS_PERIODO,
+    "resumen_sesiones": RESUMEN_SESIONES,
+    "resumen_tratamientos": RESUMEN_TRATAMIENTOS,
+    "resumen_reportes": RESUMEN_REPORTES,
+    "insertar_comision_sesion_nueva": INSERTAR_COMISION_SESION_NUEVA,
+    "id_sesion_componente": ID_SESION_COMPONENTE,
+    "horario_asistente": HORARIO_ASISTENTE,
+    "borrar_horario": BORRAR_HORARIO,
+    "insertar_horario": INSERTAR_HORARIO,
+    "citas_asistente_rango": CITAS_ASISTENTE_RANGO,
+    "conflictos_cita": CONFLICTOS_CITA,
+    "insertar_cita": INSERTAR_CITA,
+    "cancelar_cita": CANCELAR_CITA,
+    "agenda": AGENDA.format(filtro=""),
+    "agenda_asistente": AGENDA.format(filtro="AND c.asistente_id = ?"),
+    "actualizar_proxima_cita": ACTUALIZAR_PROXIMA_CITA,
+    "proximas_citas": PROXIMAS_CITAS,
+    "inactivar_tratamiento": INACTIVAR_TRATAMIENTO,
+    "info_reporte_tratamiento": INFO_REPORTE_TRATAMIENTO,
+    "insertar_reporte": INSERTAR_REPORTE,
+}
+
+
+consultas = RegistroConsultas(CONSULTAS)
+
+# Tratamientos asignados modificados por las escrituras de este proceso
+cambios_tratamientos = RegistroCambios()
+
+# SPA_ESTADISTICAS_CONSULTAS=<archivo.json> guarda al salir cuántas veces se
+# ejecutó cada consulta y su histograma de latencias
+if os.environ.get("SPA_ESTADISTICAS_CONSULTAS"):
+    atexit.register(consultas.guardar_estadisticas, os.environ["SPA_ESTADISTICAS_CONSULTAS"])
+
+def construir_consulta_fts(texto):
+    # Cada palabra se busca como prefijo ("jos" encuentra "José"); las
+    # comillas dobles se duplican para que el texto no se lea como sintaxis FTS5
+    terminos = [t.replace('"', '""') for t in texto.split()]
+    return " ".join(f'"{t}"*' for t in terminos)
+
+
+def buscar_tratamientos_por_texto(texto, desde=0, limite=TAMANO_PAGINA):
+    consulta = construir_consulta_fts(texto)
+    if not consulta:
+        return [], None
+
+    filas = consultas.consultar("busqueda_texto", (consulta, limite, desde))
+
+    # Los resultados por relevancia se paginan por posición
+    siguiente = desde + limite if len(filas) == limite else None
+    return filas, siguiente
+
+
+def obtener_pagina_tratamientos(despues_de=None, limite=TAMANO_PAGINA,
+                                nombre=None, fecha_desde=None, fecha_hasta=None):
+    # despues_de: valor devuelto por la página anterior (None para la primera)
+    if nombre:
+        return buscar_tratamientos_por_texto(nombre, despues_de or 0, limite)
+
+    nombre_consulta = "listado"
+    params = []
+
+    # Rango de fechas en formato ISO; usa idx_tratamientos_asignados_fecha_id.
+    # Los tratamientos sin iniciar quedan fuera de cualquier rango.
+    if fecha_desde or fecha_hasta:
+        nombre_consulta += "_por_fechas"
+        params.extend((fecha_desde or "0000-00-00", fecha_hasta or "9999-12-31"))
+
+    # Continuar después de la última (fecha_asignacion, id) ya mostrada. Si
+    # esa fila ya era un tratamiento sin iniciar, seguir solo por id.
+    if despues_de is not None:
+        if despues_de[0] is None:
+            nombre_consulta = "listado_sin_iniciar_siguiente_pagina"
+            params = [despues_de[1]]
+        else:
+            nombre_consulta += "_siguiente_pagina"
+            params.extend(despues_de)
+
+    params.append(limite)
+    filas = consultas.consultar(nombre_consulta, tuple(params))
+
+    # Al terminar los tratamientos con fecha, completar la página con los
+    # sin iniciar (el listado sin filtro de fechas los incluye)
+    if nombre_consulta == "listado_siguiente_pagina" and len(filas) < limite:
+        filas += consultas.consultar("listado_sin_iniciar", (limite - len(filas),))
+
+    # Clave para pedir la página siguiente; None si ya no quedan filas
+    siguiente = (filas[-1][4], filas[-1][0]) if len(filas) == limite else None
+    return filas, siguiente
+
+
+def reservar_numeros_sesion(conn, tratamiento_id, nombre_componente=None, cantidad=1):
+    # Reserva `cantidad` números consecutivos y devuelve el primero. conn debe
+    # tener abierta la transacción que inserta las sesiones.
+    params = (tratamiento_id, nombre_componente or "")
+    consultas.ejecutar("reservar_numeros_sesion", params + (cantidad,), conn)
+    return consultas.consultar_uno("ultimo_numero_sesion", params, conn)[0] - cantidad + 1
+
+
+def obtener_tratamientos_por_id(ids):
+    # Filas actuales del listado para los ids indicados; los que ya no
+    # existen simplemente no aparecen en el resultado
+    return consultas.consultar("listado_por_ids", (json.dumps(sorted(ids)),))
@@ -1,9 +1,20 @@
 import customtkinter as ctk
 from tkinter import ttk, messagebox
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import date
+from functools import partial
 from tkcalendar import DateEntry
-from database import execute_query, obtener_id_asistente_por_nombre
+from database import obtener_id_asistente_por_nombre
+from consultas_sesiones import consultas, cambios_tratamientos
+from migraciones import aplicar_migraciones
+from detalle_sesiones import cache_detalles
+from datos_referencia import cache_referencia
+import servicio_sesiones as servicio
+import instrumentacion
+from lista_virtual import ListaVirtual
+from ejecutor_consultas import EjecutorConsultas
+
+RETARDO_BUSQUEDA_MS = 300
 
 class ControlSesiones:
     def __init__(self, root, main_system):
@@ -11,7 +22,19 @@ class ControlSesiones:
         self.main_system = main_system
         self.ventana_detalle = None
         self.ventana_sesiones = None
-
+        self.tree = None
+        self.version_lista = 0
+        self.siguiente_pagina = None
+        self.cargando_pagina = False
+        self.filtros_lista = {}
+        self.busqueda_pendiente = None
+        self.estado_carga = None
+        aplicar_migraciones()
+        # Las consultas corren fuera del hilo de Tk para que la interfaz no se
+        # congele mientras SQLite espera un bloqueo o lee mucho
+        self.ejecutor = EjecutorConsultas(root, al_cambiar_ocupado=self.mostrar_cargando)
+
+    @instrumentacion.medir("show_menu")
     def show_menu(self):
         for widget in self.root.winfo_children():
             widget.destroy()
@@ -48,6 +71,7 @@ class ControlSesiones:
         self.search_name = ctk.CTkEntry(name_frame, width=200, height=32,
                                     placeholder_text="Ingrese nombre")
         self.search_name.pack(side="left", padx=(10, 10))
+        self.search_name.bind("<KeyRelease>", self.programar_busqueda)
         ctk.CTkButton(name_frame, text="Buscar por Nombre",
                     command=self.search_by_name, **btn_style).pack(side="left")
 
@@ -98,12 +122,21 @@ class ControlSesiones:
             foreground=[("selected", "#000000")],
         )
 
+        # Indicador de carga mientras hay consultas en curso
+        self.estado_carga = ctk.CTkLabel(main_frame, text="", font=("Helvetica", 12),
+                                         text_color="#676767")
+        self.estado_carga.pack(anchor="e", padx=40)
+
         # Tabla mejorada
         table_frame = ctk.CTkFrame(main_frame, fg_color="#FFFFFF", border_width=1)
         table_frame.pack(fill="both", expand=True, pady=(10, 20), padx=40)
 
         columns = ("ID", "Paciente", "Tratamiento", "Primera Sesión", "Estado")
-        self.tree = ttk.Treeview(table_frame, columns=columns, show="headings", style="Treeview")
+        # Solo se crean en Tk las filas visibles; las páginas ya cargadas
+        # quedan en memoria y se muestran al desplazarse
+        self.tree = ListaVirtual(table_frame, columns=columns, show="headings", style="Treeview",
+                                 formatear=self.formatear_tratamiento,
+                                 al_llegar_al_final=self.cargar_mas_tratamientos)
 
         # Configurar columnas con anchos apropiados
         column_widths = {
@@ -118,17 +151,25 @@ class ControlSesiones:
             self.tree.heading(col, text=col, anchor="w")
             self.tree.column(col, width=column_widths[col], anchor="w")
 
+        # Colores de estado de los tratamientos individuales
+        self.tree.tag_configure('completado', foreground='green')
+        self.tree.tag_configure('sin_iniciar', foreground='red')
+        self.tree.tag_configure('en_progreso', foreground='blue')
+
         # Add scrollbars
-        y_scroll = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
+        self.y_scroll = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
         x_scroll = ttk.Scrollbar(table_frame, orient="horizontal", command=self.tree.xview)
-        self.tree.configure(yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
+        self.tree.configure(yscrollcommand=self.y_scroll.set, xscrollcommand=x_scroll.set)
 
         # Pack table and scrollbars
-        y_scroll.pack(side="right", fill="y")
+        self.y_scroll.pack(side="right", fill="y")
         x_scroll.pack(side="bottom", fill="x")
         self.tree.pack(fill="both", expand=True)
 
         self.tree.bind("<Double-1>", self.registrar_sesion)
+        # Al seleccionar una fila se lee su detalle en segundo plano, así el
+        # doble clic abre la ventana con el detalle ya en la caché
+        self.tree.bind("<<TreeviewSelect>>", self.precargar_detalle, add="+")
         
         close_btn_style = btn_style.copy()
         close_btn_style.update(
@@ -145,102 +186,145 @@ class ControlSesiones:
 
         self.actualizar_lista()
 
-    def search_by_name(self):
-        search_term = self.search_name.get().lower()
-        for item in self.tree.get_children():
-            values = self.tree.item(item)['values']
-            paciente = str(values[1]).lower()
-            if search_term in paciente:
-                self.tree.reattach(item, "", 0)
-            else:
-                self.tree.detach(item)
+    def programar_busqueda(self, event=None):
+        # Búsqueda mientras se escribe: esperar una pausa antes de consultar
+        if self.busqueda_pendiente is not None:
+            self.root.after_cancel(self.busqueda_pendiente)
+        self.busqueda_pendiente = self.root.after(RETARDO_BUSQUEDA_MS, self.search_by_name)
 
-    def search_by_date(self):
-        date_from = self.date_from.get_date()
-        date_to = self.date_to.get_date()
+    def search_by_name(self):
+        if self.busqueda_pendiente is not None:
+            self.root.after_cancel(self.busqueda_pendiente)
+            self.busqueda_pendiente = None
 
-        for item in self.tree.get_children():
-            values = self.tree.item(item)['values']
-            fecha_sesion = datetime.strptime(values[3], '%Y-%m-%d').date()
+        # La búsqueda se resuelve en el índice de texto completo; la tabla
+        # muestra solo las coincidencias ordenadas por relevancia
+        texto = self.search_name.get().strip()
+        self.filtros_lista = {"nombre": texto} if texto else {}
+        self.recargar_lista()
 
-            if date_from <= fecha_sesion <= date_to:
-                self.tree.reattach(item, "", 0)
-            else:
-                self.tree.detach(item)
+    def search_by_date(self):
+        self.filtros_lista = {
+            "fecha_desde": self.date_from.get_date().strftime('%Y-%m-%d'),
+            "fecha_hasta": self.date_to.get_date().strftime('%Y-%m-%d'),
+        }
+        self.recargar_lista()
 
+    @instrumentacion.medir("actualizar_lista")
     def actualizar_lista(self):
-        # Limpiar la tabla
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        query = """
-            SELECT
-                ta.id,
-                p.nombre as nombre_paciente,
-                t.nombre as nombre_tratamiento,
-                t.es_promocion,
-                ta.fecha_asignacion as primera_sesion,
-                ta.sesiones_asignadas,
-                ta.sesiones_restantes,
-                CASE
-                    WHEN t.es_promocion THEN (
-                        SELECT COUNT(*)
-                        FROM promocion_componentes pc
-                        WHERE pc.tratamiento_asignado_id = ta.id
-                        AND pc.sesiones_restantes > 0
-                    )
-                    ELSE ta.sesiones_restantes
-                END as componentes_pendientes
-            FROM tratamientos_asignados ta
-            JOIN pacientes p ON ta.paciente_id = p.id
-            JOIN tratamientos t ON ta.tratamiento_id = t.id
-            ORDER BY primera_sesion DESC
-        """
-        results = execute_query(query, fetch=True)
-
-        for row in results:
-            es_promocion = row[3]
+        # "Mostrar Todos": quitar cualquier filtro de búsqueda
+        self.filtros_lista = {}
+        self.recargar_lista()
+
+    def recargar_lista(self):
+        # Reiniciar la paginación, limpiar la tabla y cargar solo la primera página.
+        # Lo que cambie desde aquí se refresca con refrescar_cambios.
+        self.version_lista = cambios_tratamientos.version
+        self.siguiente_pagina = None
+        self.tree.limpiar()
+        self.cargar_pagina_tratamientos(primera=True)
+
+    def cargar_mas_tratamientos(self):
+        # La lista avisa cuando la vista se acerca al final de lo cargado
+        if self.siguiente_pagina is not None:
+            self.cargar_pagina_tratamientos()
+
+    def cargar_pagina_tratamientos(self, primera=False):
+        # Una recarga reemplaza a la página que se estuviera pidiendo (por
+        # ejemplo, al seguir escribiendo en la búsqueda)
+        if self.cargando_pagina and not primera:
+            return
+
+        self.cargando_pagina = True
+        self.ejecutor.enviar(
+            partial(servicio.listar_tratamientos,
+                    None if primera else self.siguiente_pagina, **self.filtros_lista),
+            al_terminar=self.mostrar_pagina_tratamientos,
+            al_fallar=self.error_pagina_tratamientos,
+            grupo="lista", reemplazar=primera)
+
+    def mostrar_pagina_tratamientos(self, resultado):
+        results, self.siguiente_pagina = resultado
+        self.cargando_pagina = False
+        self.tree.agregar(results)
+
+    def error_pagina_tratamientos(self, error):
+        self.cargando_pagina = False
+        messagebox.showerror("Error", f"Error al cargar los tratamientos: {str(error)}", parent=self.root)
+
+    def refrescar_cambios(self):
+        # Después de una escritura: volver a leer solo los tratamientos que
+        # cambiaron y actualizar sus filas, sin tocar el resto de la lista
+        ids, self.version_lista = cambios_tratamientos.cambios_desde(self.version_lista)
+        if not ids or self.tree is None or not self.tree.winfo_exists():
+            return
+
+        tree = self.tree
+        self.ejecutor.enviar(
+            partial(servicio.tratamientos_por_id, ids),
+            al_terminar=lambda filas: tree.reemplazar_filas(filas, ids) if tree.winfo_exists() else None,
+            grupo="lista")
+
+    def mostrar_cargando(self, ocupado):
+        if self.estado_carga is not None and self.estado_carga.winfo_exists():
+            self.estado_carga.configure(text="Cargando..." if ocupado else "")
+
+    def cancelar_al_cerrar(self, widget):
+        # Al cerrar una ventana se descartan las consultas que pidió y que
+        # todavía no terminaron; sus resultados ya no tienen dónde mostrarse
+        def al_destruir(event):
+            if str(event.widget) == str(widget):
+                self.ejecutor.cancelar_grupo(widget)
+        widget.bind("<Destroy>", al_destruir, add="+")
+
+    def guardar_en_segundo_plano(self, guardar, boton, al_guardar, mensaje_error):
+        # La escritura corre fuera del hilo de Tk; el botón queda deshabilitado
+        # hasta que termina para no registrar dos veces la misma sesión
+        boton.configure(state="disabled")
+
+        def al_fallar(error):
+            if boton.winfo_exists():
+                boton.configure(state="normal")
+            with instrumentacion.sin_medir():
+                messagebox.showerror("Error", f"{mensaje_error}: {str(error)}", parent=self.root)
+
+        self.ejecutor.enviar(guardar, al_terminar=lambda resultado: al_guardar(),
+                             al_fallar=al_fallar, interrumpible=False)
+
+    def formatear_tratamiento(self, row):
+        es_promocion = row[3]
 
-            if es_promocion:
-                estado = "PROMOCION"
-                color_tag = None  # No aplicar color a promociones
-            else:
-                if row[6] <= 0:
-                    estado = "Completado"
-                    color_tag = "completado"
-                elif row[4] == 'Sin iniciar':
-                    estado = "Sin iniciar"
-                    color_tag = "sin_iniciar"
-                else:
-                    estado = "En progreso"
-                    color_tag = "en_progreso"
-
-            # Insertar datos en la tabla
-            item_id = self.tree.insert("", "end", values=(
-                row[0],      # ID (oculto)
-                row[1],      # Paciente
-                f"{'🎁 ' if es_promocion else ''}{row[2]}",  # Tratamiento (con emoji si es promoción)
-                row[4],      # Primera sesión
-                estado      # Estado
-            ))
-
-            # Aplicar colores según el estado solo a tratamientos individuales
-            if not es_promocion:
-                self.tree.tag_configure(color_tag, foreground={
-                    'completado': 'green',
-                    'sin_iniciar': 'red',
-                    'en_progreso': 'blue'
-                }[color_tag])
-                self.tree.item(item_id, tags=(color_tag,))
-
-    def search_pacientes(self, event):
-        search_term = self.search_entry.get().lower()
-        for item in self.tree.get_children():
-            paciente = self.tree.item(item)['values'][1].lower()
-            if search_term not in paciente:
-                self.tree.detach(item)
-            else:
-                self.tree.reattach(item, "", 0)
+        if es_promocion:
+            estado = "PROMOCION"
+            etiquetas = ()  # No aplicar color a promociones
+        elif row[6] <= 0:
+            estado = "Completado"
+            etiquetas = ('completado',)
+        elif row[8] == 'SIN_INICIAR':
+            estado = "Sin iniciar"
+            etiquetas = ('sin_iniciar',)
+        else:
+            estado = "En progreso"
+            etiquetas = ('en_progreso',)
+
+        return (
+            row[0],      # ID (oculto)
+            row[1],      # Paciente
+            f"{'🎁 ' if es_promocion else ''}{row[2]}",  # Tratamiento (con emoji si es promoción)
+            row[4] or "Sin iniciar",      # Primera sesión
+            estado      # Estado
+        ), etiquetas
+
+    def precargar_detalle(self, event=None):
+        seleccion = self.tree.selection()
+        if not seleccion:
+            return
+        tratamiento_id = self.tree.item(seleccion[0])['values'][0]
+        if cache_detalles.vigente(tratamiento_id) is None:
+            # Al recorrer la lista con el teclado solo importa la última fila
+            self.ejecutor.enviar(partial(servicio.detalle_tratamiento, tratamiento_id),
+                                 al_fallar=lambda error: None,
+                                 grupo="precarga", reemplazar=True)
 
     def registrar_sesion(self, event):
         try:
@@ -252,71 +336,28 @@ class ControlSesiones:
 
 
 
+    @instrumentacion.medir("cargar_sesiones")
     def cargar_sesiones(self, tree_sesiones, tratamiento_id, componente_id=None):
-        # Limpiar la tabla
-        for item in tree_sesiones.get_children():
-            tree_sesiones.delete(item)
-
-        if componente_id:
-            query = """
-                SELECT
-                    sr.numero_sesion,
-                    sr.fecha_sesion,
-                    a.nombre as esteticista,
-                    sr.monto_abonado,
-                    sr.estado_pago,
-                    sr.proxima_cita,
-                    sr.estado_sesion,
-                    sr.comision_sumada,
-                    sr.realizada,
-                    ta.sesiones_asignadas,
-                    ta.sesiones_restantes
-                FROM sesiones_realizadas sr
-                LEFT JOIN asistentes a ON sr.asistente_id = a.id
-                JOIN tratamientos_asignados ta ON sr.tratamiento_asignado_id = ta.id
-                WHERE sr.tratamiento_asignado_id = ? AND sr.nombre_componente = ?
-                ORDER BY sr.numero_sesion
-            """
-            params = (tratamiento_id, componente_id)
-        else:
-            query = """
-                SELECT
-                    sr.numero_sesion,
-                    sr.fecha_sesion,
-                    a.nombre as esteticista,
-                    sr.monto_abonado,
-                    sr.estado_pago,
-                    sr.proxima_cita,
-                    sr.estado_sesion,
-                    sr.comision_sumada,
-                    sr.realizada,
-                    ta.sesiones_asignadas,
-                    ta.sesiones_restantes
-                FROM sesiones_realizadas sr
-                LEFT JOIN asistentes a ON sr.asistente_id = a.id
-                JOIN tratamientos_asignados ta ON sr.tratamiento_asignado_id = ta.id
-                WHERE sr.tratamiento_asignado_id = ?
-                ORDER BY sr.numero_sesion
-            """
-            params = (tratamiento_id,)
-
-        sesiones = execute_query(query, params, fetch=True)
-
-        # Obtener información del tratamiento
-        query = """
-            SELECT sesiones_asignadas, sesiones_restantes
-            FROM tratamientos_asignados
-            WHERE id = ?
-        """
-        info_tratamiento = execute_query(query, (tratamiento_id,), fetch=True)[0]
-
-        if info_tratamiento:
-            sesiones_totales = info_tratamiento[0]
-            sesiones_restantes = info_tratamiento[1]
+        self.ejecutor.enviar(partial(servicio.detalle_tratamiento, tratamiento_id),
+                             al_terminar=lambda detalle: self.llenar_sesiones(tree_sesiones, detalle, componente_id),
+                             grupo=tree_sesiones, reemplazar=True)
+
+    def llenar_sesiones(self, tree_sesiones, detalle, componente_id=None):
+        if not tree_sesiones.winfo_exists():
+            return
+
+        filas = []
+        sesiones = []
+        if detalle is not None:
+            sesiones = detalle.sesiones
+            if componente_id:
+                sesiones = [s for s in sesiones if s.nombre_componente == componente_id]
+            sesiones_totales = detalle.sesiones_asignadas
+            sesiones_restantes = detalle.sesiones_restantes
             estado = "COMPLETADO" if sesiones_restantes == 0 else f"Faltan {sesiones_restantes} sesiones"
 
-            # Insertar información de progreso como primer elemento
-            tree_sesiones.insert("", 0, values=(
+            # Información de progreso como primer elemento
+            filas.append(((
                 "PROGRESO",
                 f"Total: {sesiones_totales}",
                 f"Realizadas: {sesiones_totales - sesiones_restantes}",
@@ -325,34 +366,33 @@ class ControlSesiones:
                 "",
                 "",
                 ""
-            ), tags=('info',))
-
-            # Configurar estilo para la fila de información
-            tree_sesiones.tag_configure('info', background='#f0f0f0', foreground='#000000')
+            ), ('info',)))
 
         for sesion in sesiones:
-            item_id = tree_sesiones.insert("", "end", values=(
-                f"Sesión {sesion[0]}",
-                sesion[1],
-                sesion[2] or "No asignado",
-                f"${sesion[3]:.2f}" if sesion[3] else "$0.00",
-                sesion[4] or "Pendiente",
-                sesion[5] or "No programada",
-                sesion[6] or "Pendiente",
-                "Sí" if sesion[8] else "No"  # Mostrar si la sesión fue realizada
-            ))
-
             # Aplicar estilos
-            if sesion[8] and sesion[4] == 'PAGADO':  # realizada y pagada
-                tree_sesiones.tag_configure('completada', foreground='green')
-                tree_sesiones.item(item_id, tags=('completada',))
-            elif sesion[6] == 'Cancelada':
-                tree_sesiones.tag_configure('cancelada', foreground='red')
-                tree_sesiones.item(item_id, tags=('cancelada',))
-            elif sesion[4] == 'Pendiente':
-                tree_sesiones.tag_configure('pendiente', foreground='orange')
-                tree_sesiones.item(item_id, tags=('pendiente',))
-
+            if sesion.realizada and sesion.estado_pago == 'PAGADO':
+                etiquetas = ('completada',)
+            elif sesion.estado_sesion == 'Cancelada':
+                etiquetas = ('cancelada',)
+            elif sesion.estado_pago == 'Pendiente':
+                etiquetas = ('pendiente',)
+            else:
+                etiquetas = ()
+
+            filas.append(((
+                f"Sesión {sesion.numero}",
+                sesion.fecha,
+                sesion.esteticista or "No asignado",
+                f"${sesion.monto_abonado:.2f}" if sesion.monto_abonado else "$0.00",
+                sesion.estado_pago or "Pendiente",
+                sesion.proxima_cita or "No programada",
+                sesion.estado_sesion or "Pendiente",
+                "Sí" if sesion.realizada else "No"  # Mostrar si la sesión fue realizada
+            ), etiquetas))
+
+        tree_sesiones.cargar(filas)
+
+    @instrumentacion.medir("mostrar_detalle_sesiones")
     def mostrar_detalle_sesiones(self, tratamiento_id):
         try:
             self.ventana_detalle = ctk.CTkToplevel(self.root)
@@ -362,28 +402,42 @@ class ControlSesiones:
             main_frame = ctk.CTkFrame(self.ventana_detalle, fg_color="#FFFFFF")
             main_frame.pack(fill="both", expand=True, padx=20, pady=20)
 
-            # Obtener información del tratamiento
-            query = """
-                SELECT
-                    p.nombre,
-                    t.nombre,
-                    ta.costo_total,
-                    ta.total_pagado,
-                    ta.saldo_pendiente,
-                    ta.sesiones_asignadas,
-                    ta.sesiones_restantes,
-                    t.es_promocion
-                FROM tratamientos_asignados ta
-                JOIN pacientes p ON ta.paciente_id = p.id
-                JOIN tratamientos t ON ta.tratamiento_id = t.id
-                WHERE ta.id = ?
-            """
-            info = execute_query(query, (tratamiento_id,), fetch=True)[0]
-
-            if not info:
+            cargando = ctk.CTkLabel(main_frame, text="Cargando...", font=("Helvetica", 14))
+            cargando.pack(pady=40)
+
+            # Todo el detalle (sesiones y componentes incluidos) en una sola
+            # lectura, sin bloquear la ventana. Si la selección ya lo dejó en
+            # la caché, la ventana se arma enseguida.
+            ventana = self.ventana_detalle
+            self.cancelar_al_cerrar(ventana)
+            detalle = cache_detalles.vigente(tratamiento_id)
+            if detalle is not None:
+                self.llenar_detalle_sesiones(ventana, main_frame, cargando, detalle)
+                return
+
+            self.ejecutor.enviar(
+                partial(servicio.detalle_tratamiento, tratamiento_id),
+                al_terminar=lambda detalle: self.llenar_detalle_sesiones(
+                    ventana, main_frame, cargando, detalle),
+                al_fallar=lambda error: self.error_detalle(ventana, error),
+                grupo=ventana)
+
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al mostrar detalles: {str(e)}", parent=self.root)
+            if hasattr(self, 'ventana_detalle'):
+                self.ventana_detalle.destroy()
+
+    def error_detalle(self, ventana, error):
+        messagebox.showerror("Error", f"Error al mostrar detalles: {str(error)}", parent=self.root)
+        ventana.destroy()
+
+    def llenar_detalle_sesiones(self, ventana, main_frame, cargando, detalle):
+        try:
+            if detalle is None:
                 raise Exception("No se encontró información del tratamiento")
-                    
-            es_promocion = info[7]
+
+            cargando.destroy()
+            es_promocion = detalle.es_promocion
 
             # Panel de información principal
             info_frame = ctk.CTkFrame(main_frame, fg_color="#F0F0F0", border_width=1)
@@ -394,11 +448,11 @@ class ControlSesiones:
             header_frame.pack(fill="x", padx=20, pady=(15,5))
 
             ctk.CTkLabel(header_frame,
-                        text=info[0],  # Nombre del paciente
+                        text=detalle.paciente,
                         font=("Helvetica", 20, "bold")).pack(side="left")
 
             tipo_label = ctk.CTkLabel(header_frame,
-                        text=f"{'Promoción' if es_promocion else 'Tratamiento'}: {info[1]}",
+                        text=f"{'Promoción' if es_promocion else 'Tratamiento'}: {detalle.tratamiento}",
                         font=("Helvetica", 14))
             tipo_label.pack(side="right")
 
@@ -408,9 +462,9 @@ class ControlSesiones:
 
             # Dividir la información financiera en tres columnas
             for i, (label, value) in enumerate([
-                ("Monto Total", f"${info[2]:.2f}"),
-                ("Total Pagado", f"${info[3]:.2f}"),
-                ("Saldo Pendiente", f"${info[4]:.2f}")
+                ("Monto Total", f"${detalle.costo_total:.2f}"),
+                ("Total Pagado", f"${detalle.total_pagado:.2f}"),
+                ("Saldo Pendiente", f"${detalle.saldo_pendiente:.2f}")
             ]):
                 column = ctk.CTkFrame(financial_frame, fg_color="transparent")
                 column.pack(side="left", expand=True, padx=10, pady=10)
@@ -421,35 +475,15 @@ class ControlSesiones:
                             font=("Helvetica", 16, "bold")).pack()
  
             if es_promocion:
-                self.mostrar_componentes_promocion(main_frame, tratamiento_id)
+                self.mostrar_componentes_promocion(main_frame, detalle)
             else:
-                self.mostrar_lista_sesiones(main_frame, tratamiento_id, self.ventana_detalle)
+                self.mostrar_lista_sesiones(main_frame, detalle.id, ventana, detalle=detalle)
 
         except Exception as e:
-            messagebox.showerror("Error", f"Error al mostrar detalles: {str(e)}", parent=self.root)
-            if hasattr(self, 'ventana_detalle'):
-                self.ventana_detalle.destroy()
+            self.error_detalle(ventana, e)
 
-    def mostrar_componentes_promocion(self, main_frame, tratamiento_id):
+    def mostrar_componentes_promocion(self, main_frame, detalle):
         try:
-            query = """
-                SELECT
-                    pd.nombre_componente,
-                    pd.cantidad_sesiones,
-                    COALESCE(pc.sesiones_restantes, pd.cantidad_sesiones) as sesiones_restantes,
-                    COUNT(sr.id) AS sesiones_realizadas,
-                    pc.id as componente_id
-                FROM promocion_detalles pd
-                JOIN tratamientos_asignados ta ON pd.promocion_id = ta.tratamiento_id
-                LEFT JOIN promocion_componentes pc ON ta.id = pc.tratamiento_asignado_id
-                    AND pd.nombre_componente = pc.tratamiento_id
-                LEFT JOIN sesiones_realizadas sr ON sr.tratamiento_asignado_id = ta.id
-                    AND sr.nombre_componente = pd.nombre_componente
-                WHERE ta.id = ?
-                GROUP BY pd.nombre_componente
-            """
-            componentes = execute_query(query, (tratamiento_id,), fetch=True)
-
             componentes_frame = ctk.CTkFrame(main_frame, fg_color="#FFFFFF")
             componentes_frame.pack(fill="both", expand=True, pady=10, padx=5)
 
@@ -476,79 +510,56 @@ class ControlSesiones:
             inner_frame = ctk.CTkFrame(canvas, fg_color="transparent")
             canvas.create_window((0, 0), window=inner_frame, anchor="nw")
 
-            for comp in componentes:
-                self.crear_componente_ui(inner_frame, comp, tratamiento_id)
+            # Los componentes ya vienen en el detalle
+            for componente in detalle.componentes:
+                self.crear_componente_ui(inner_frame, componente, detalle)
 
         except Exception as e:
             raise Exception(f"Error al cargar componentes: {str(e)}")
 
-    def crear_componente_ui(self, parent_frame, comp_data, tratamiento_id):
-        nombre_componente = comp_data[0]
-        sesiones_asignadas = comp_data[1]
-        sesiones_realizadas = comp_data[3]
-        componente_id = comp_data[4]
-        
+    def crear_componente_ui(self, parent_frame, componente, detalle):
         comp_frame = ctk.CTkFrame(parent_frame, fg_color="#F8F8F8", border_width=1)
         comp_frame.pack(fill="x", pady=5)
 
         info_frame = ctk.CTkFrame(comp_frame, fg_color="transparent")
         info_frame.pack(side="left", padx=20, pady=15, expand=True)
 
-        ctk.CTkLabel(info_frame, text=nombre_componente,
+        ctk.CTkLabel(info_frame, text=componente.nombre,
                     font=("Helvetica", 14, "bold")).pack(anchor="w")
 
         progress_frame = ctk.CTkFrame(info_frame, fg_color="transparent")
         progress_frame.pack(fill="x", pady=(5, 0))
 
         ctk.CTkLabel(progress_frame,
-                    text=f"{sesiones_realizadas}/{sesiones_asignadas} sesiones",
+                    text=f"{componente.sesiones_realizadas}/{componente.cantidad_sesiones} sesiones",
                     font=("Helvetica", 12)).pack(side="left")
 
         ctk.CTkButton(comp_frame,
                     text="Ver Detalle",
-                    command=lambda: self.mostrar_sesiones_componente_promocion(
-                        tratamiento_id, nombre_componente),
+                    command=lambda: self.mostrar_sesiones_componente_promocion(detalle, componente),
                     width=120,
                     height=32,
                     fg_color="#191919",
                     hover_color="#676767").pack(side="right", padx=20)
         
 
-    def mostrar_sesiones_componente_promocion(self, tratamiento_id, nombre_componente):
+    def mostrar_sesiones_componente_promocion(self, detalle, componente):
         self.ventana_sesiones = ctk.CTkToplevel(self.root)
-        self.ventana_sesiones.title(f"Sesiones de {nombre_componente}")
+        self.ventana_sesiones.title(f"Sesiones de {componente.nombre}")
         self.ventana_sesiones.geometry("900x600")
         self.ventana_sesiones.wm_attributes("-topmost", True)  # Mostrar siempre delante
 
         main_frame = ctk.CTkFrame(self.ventana_sesiones, fg_color="#FFFFFF")
         main_frame.pack(fill="both", expand=True, padx=20, pady=20)
 
-        # Obtener información del componente
-        query = """
-            SELECT
-                pd.cantidad_sesiones,
-                pc.id as componente_id,
-                p.nombre as nombre_paciente,
-                t.nombre as nombre_promocion,
-                pd.precio_componente,
-                (
-                    SELECT COUNT(*)
-                    FROM sesiones_realizadas sr
-                    WHERE sr.tratamiento_asignado_id = pc.tratamiento_asignado_id
-                    AND sr.nombre_componente = pd.nombre_componente
-                ) as sesiones_realizadas
-            FROM promocion_componentes pc
-            JOIN tratamientos_asignados ta ON pc.tratamiento_asignado_id = ta.id
-            JOIN tratamientos t ON ta.tratamiento_id = t.id
-            JOIN promocion_detalles pd ON pd.promocion_id = t.id
-            JOIN pacientes p ON ta.paciente_id = p.id
-            WHERE pc.tratamiento_asignado_id = ?
-            AND pd.nombre_componente = ?
-        """
-        info_componente = execute_query(query, (tratamiento_id, nombre_componente), fetch=True)[0]
-
-        if not info_componente:
-            raise Exception("No se encontró información del componente")
+        # El componente y sus sesiones ya vienen en el detalle del tratamiento
+        ventana = self.ventana_sesiones
+        self.cancelar_al_cerrar(ventana)
+        self.llenar_sesiones_componente(ventana, main_frame, detalle, componente)
+
+    def llenar_sesiones_componente(self, ventana, main_frame, detalle, componente):
+        tratamiento_id = detalle.id
+        nombre_componente = componente.nombre
 
         # Panel de información mejorado
         info_frame = ctk.CTkFrame(main_frame, fg_color="#F0F0F0", border_width=1)
@@ -559,7 +570,7 @@ class ControlSesiones:
         header_frame.pack(fill="x", padx=20, pady=(15,5))
 
         ctk.CTkLabel(header_frame,
-                    text=info_componente[2],  # nombre_paciente
+                    text=detalle.paciente,
                     font=("Helvetica", 20, "bold")).pack(side="left")
 
         ctk.CTkLabel(header_frame,
@@ -572,9 +583,9 @@ class ControlSesiones:
 
         # Crear grid de estadísticas
         stats = [
-            ("Sesiones Realizadas", f"{info_componente[5]}/{info_componente[0]}"),
-            ("Sesiones Restantes", str(info_componente[0]-info_componente[5])),
-            ("Precio por Sesión", f"${info_componente[4]:.2f}")
+            ("Sesiones Realizadas", f"{componente.sesiones_realizadas}/{componente.cantidad_sesiones}"),
+            ("Sesiones Restantes", str(componente.cantidad_sesiones - componente.sesiones_realizadas)),
+            ("Precio por Sesión", f"${componente.precio:.2f}")
         ]
 
         for i, (label, value) in enumerate(stats):
@@ -603,15 +614,15 @@ class ControlSesiones:
         ctk.CTkButton(btn_frame,
                     text="Nueva Sesión",
                     command=lambda: self.registrar_nueva_sesion_promocion(
-                        tratamiento_id, tree_sesiones, self.ventana_sesiones,
-                        info_componente[1], nombre_componente, precio_componente=info_componente[4]),
+                        tratamiento_id, tree_sesiones, ventana,
+                        componente.componente_id, nombre_componente, precio_componente=componente.precio),
                     **btn_style).pack(side="left", padx=5)
 
         ctk.CTkButton(btn_frame,
                     text="Modificar Sesión",
                     command=lambda: self.modificar_sesion_promocion(
                         tratamiento_id, tree_sesiones,
-                        info_componente[1], nombre_componente, info_componente[4]),
+                        componente.componente_id, nombre_componente, componente.precio),
                     **btn_style).pack(side="left", padx=5)
 
         # Tabla mejorada
@@ -635,7 +646,7 @@ class ControlSesiones:
             padding=5
         )
 
-        tree_sesiones = ttk.Treeview(
+        tree_sesiones = ListaVirtual(
             tree_container,
             columns=("Sesion", "Fecha", "Esteticista", "Estado", "Pago"),
             show="headings"
@@ -645,6 +656,7 @@ class ControlSesiones:
         tree_sesiones.heading("Esteticista", text="Esteticista")
         tree_sesiones.heading("Estado", text="Estado")
         tree_sesiones.heading("Pago", text="Pago")
+        self.cancelar_al_cerrar(tree_sesiones)
 
         # Scrollbars
         vsb = ttk.Scrollbar(tree_container, orient="vertical", command=tree_sesiones.yview)
@@ -657,73 +669,39 @@ class ControlSesiones:
         tree_sesiones.pack(side="top", fill="both", expand=True)
 
 
-        # Modificar la llamada a cargar_sesiones_promocion
-        self.cargar_sesiones_promocion(tree_sesiones, tratamiento_id,
-                                 info_componente[1], nombre_componente)
+        self.llenar_sesiones_promocion(tree_sesiones, componente.sesiones)
+
+    def llenar_sesiones_promocion(self, tree_sesiones, sesiones):
+        tree_sesiones.cargar(((
+            f"Sesión {sesion.numero}",
+            sesion.fecha,
+            sesion.esteticista,
+            sesion.estado_pago or "Pendiente",
+            "Realizada" if sesion.realizada else "Pendiente",
+            sesion.realizada
+        ), ()) for sesion in sesiones)
+
+    def cargar_sesiones_promocion(self, tree_sesiones, tratamiento_id, componente_id, nombre_componente):
+        def leer_sesiones():
+            # Solo lectura: el progreso y la completitud del componente los
+            # mantienen los triggers al escribir sus sesiones
+            detalle = servicio.detalle_tratamiento(tratamiento_id)
+            return [s for s in detalle.sesiones if s.nombre_componente == nombre_componente] if detalle else []
+
+        def llenar(sesiones):
+            self.refrescar_cambios()
+            if not tree_sesiones.winfo_exists():
+                return
+            self.llenar_sesiones_promocion(tree_sesiones, sesiones)
 
-    def cargar_sesiones_promocion(self, tree_sesiones, tratamiento_id, componente_id, nombre_componente, external_conn=None):
-        conn = external_conn
-        should_close_conn = False
+        def al_fallar(error):
+            if isinstance(error, sqlite3.Error):
+                messagebox.showerror("Error", f"Error en la base de datos: {str(error)}", parent=self.root)
+            else:
+                raise error
 
-        try:
-            if conn is None:
-                conn = sqlite3.connect('spa_database.db', timeout=10)
-                should_close_conn = True
-                
-            c = conn.cursor()
-            for item in tree_sesiones.get_children():
-                tree_sesiones.delete(item)
-            c.execute("""
-                SELECT sr.numero_sesion, sr.fecha_sesion, a.nombre, sr.estado_pago, sr.realizada
-                FROM sesiones_realizadas sr
-                JOIN asistentes a ON sr.asistente_id = a.id
-                WHERE sr.tratamiento_asignado_id = ? AND sr.nombre_componente = ?
-                ORDER BY sr.numero_sesion
-            """, (tratamiento_id, nombre_componente))
-            sesiones = c.fetchall()
-
-            for sesion in sesiones:
-                tree_sesiones.insert("", "end", values=(
-                    f"Sesión {sesion[0]}",
-                    sesion[1],
-                    sesion[2],
-                    "PAGADO" if sesion[3] else "Pendiente",
-                    "Realizada" if sesion[4] else "Pendiente",
-                    sesion[4]
-                ))
-
-            # Verificar si todas las sesiones están realizadas Y pagadas
-            c.execute("""
-                SELECT COUNT(*) as total_sesiones,
-                    SUM(CASE WHEN realizada = 1 AND estado_pago = 'PAGADO' THEN 1 ELSE 0 END) as sesiones_completas
-                FROM sesiones_realizadas
-                WHERE tratamiento_asignado_id = ? AND nombre_componente = ?
-            """, (tratamiento_id, nombre_componente))
-            total_sesiones, sesiones_completas = c.fetchone()
-
-            if total_sesiones == sesiones_completas:
-                c.execute("""
-                    UPDATE promocion_componentes
-                    SET sesiones_restantes = 0
-                    WHERE tratamiento_asignado_id = ? AND tratamiento_id = ?
-                """, (tratamiento_id, componente_id))
-
-            if should_close_conn:
-                conn.commit()
-
-        except sqlite3.Error as e:
-            messagebox.showerror("Error", f"Error en la base de datos: {str(e)}", parent=self.root)
-        finally:
-            if should_close_conn and conn:
-                conn.close()
-
-    def get_db_connection(self):
-        try:
-            conn = sqlite3.connect('spa_database.db')
-            return conn
-        except sqlite3.Error as e:
-            messagebox.showerror("Error", f"Error al conectar con la base de datos: {str(e)}", parent=self.root)
-            return None
+        self.ejecutor.enviar(leer_sesiones, al_terminar=llenar, al_fallar=al_fallar,
+                             grupo=tree_sesiones, reemplazar=True)
 
     def modificar_sesion_promocion(self, tratamiento_id, tree_sesiones, componente_id, nombre_componente, precio_componente ):
         try:
@@ -738,30 +716,10 @@ class ControlSesiones:
             frame = ctk.CTkFrame(window, fg_color="#FFFFFF")
             frame.pack(padx=20, pady=20, fill="both", expand=True)
 
-            conn = None
             try:
-                conn = self.get_db_connection()
-                if not conn:
-                    return
-                c = conn.cursor()
-                
-                c.execute("SELECT id, nombre FROM asistentes ORDER BY nombre")
-                esteticistas = c.fetchall()
-
-                c.execute("""
-                    SELECT
-                        sr.asistente_id,
-                        sr.porcentaje_asistente,
-                        sr.estado_pago,
-                        sr.fecha_sesion,
-                        sr.realizada,
-                        sr.monto_abonado
-                    FROM sesiones_realizadas sr
-                    WHERE sr.tratamiento_asignado_id = ? AND sr.numero_sesion = ?
-                """, (tratamiento_id, int(sesion_data[0].split()[1])))
-                detalles_sesion = c.fetchone()
-                conn.close()
-
+                referencia = cache_referencia.obtener()
+                detalles_sesion = consultas.consultar_uno(
+                    "detalle_sesion_promocion", (tratamiento_id, int(sesion_data[0].split()[1])))
 
                 if not detalles_sesion:
                     raise Exception("No se encontraron los detalles de la sesión")
@@ -772,14 +730,14 @@ class ControlSesiones:
                 ctk.CTkLabel(frame, text="Fecha de la sesión:").pack(pady=5)
                 fecha_sesion = DateEntry(frame, width=12, background='black', foreground='white', borderwidth=2, date_pattern='yyyy-mm-dd')
                 fecha_sesion.pack(pady=5)
-                fecha_sesion.set_date(datetime.strptime(detalles_sesion[3], '%Y-%m-%d').date())
+                fecha_sesion.set_date(date.fromisoformat(detalles_sesion[3]))
 
                 # Esteticista
                 ctk.CTkLabel(frame, text="Esteticista:").pack(pady=5)
                 esteticista_var = ctk.StringVar()
-                esteticista_combo = ctk.CTkComboBox(frame, values=[e[1] for e in esteticistas], variable=esteticista_var)
+                esteticista_combo = ctk.CTkComboBox(frame, values=referencia.nombres_asistentes, variable=esteticista_var)
                 esteticista_combo.pack(pady=5)
-                esteticista_actual = next(e[1] for e in esteticistas if e[0] == detalles_sesion[0])
+                esteticista_actual = referencia.nombre_asistente.get(detalles_sesion[0], "")
                 esteticista_var.set(esteticista_actual)
 
                 # Porcentaje del asistente
@@ -807,90 +765,36 @@ class ControlSesiones:
             except Exception as e:
                 messagebox.showerror("Error", f"Error en la base de datos: {str(e)}", parent=self.root)
             finally:
-                if conn:
-                    conn.close()
-
                 def guardar_cambios():
-                    conn = None
                     try:
-                        conn = self.get_db_connection()
-                        if not conn:
-                            return
-
-                        c = conn.cursor()
-
                         # Obtener ID del esteticista
                         esteticista_nombre = esteticista_var.get()
-                        asistente_id = next(e[0] for e in esteticistas if e[1] == esteticista_nombre)
-
-                        # Validar porcentaje
-                        porcentaje = float(porcentaje_entry.get())
-                        if porcentaje < 0 or porcentaje > 100:
-                            raise ValueError("El porcentaje debe estar entre 0 y 100")
-
-                        # Realizar la actualización
-                        query = """
-                            UPDATE sesiones_realizadas
-                            SET fecha_sesion = ?,
-                                asistente_id = ?,
-                                estado_pago = ?,
-                                porcentaje_asistente = ?,
-                                monto_abonado = ?,
-                                proxima_cita = ?,
-                                realizada = ?,
-                                estado_sesion = ?
-                            WHERE tratamiento_asignado_id = ?
-                            AND nombre_componente = ?
-                            AND numero_sesion = ?
-                        """
-                        params = (
-                            fecha_sesion.get_date().strftime('%Y-%m-%d'),
-                            asistente_id,
-                            estado_pago_var.get(),
-                            porcentaje,
-                            precio_componente,
-                            (datetime.strptime(fecha_sesion.get_date().strftime('%Y-%m-%d'), '%Y-%m-%d') + timedelta(days=7)).strftime('%Y-%m-%d'),
-                            1 if realizada_var.get() else 0,
-                            'Realizada' if realizada_var.get() else 'Pendiente',
-                            tratamiento_id,
-                            nombre_componente,
-                            int(sesion_data[0].split()[1])
-                        )
-                        
-                        c.execute(query, params)
-                        conn.commit()
-
-                        # Verificar si todas las sesiones están realizadas Y pagadas
-                        c.execute("""
-                            SELECT COUNT(*) as total_sesiones,
-                                SUM(CASE WHEN realizada = 1 AND estado_pago = 'PAGADO' THEN 1 ELSE 0 END) as sesiones_completas
-                            FROM sesiones_realizadas
-                            WHERE tratamiento_asignado_id = ? AND nombre_componente = ?
-                        """, (tratamiento_id, nombre_componente))
-                        
-                        total_sesiones, sesiones_completas = c.fetchone()
-
-                        if total_sesiones == sesiones_completas:
-                            c.execute("""
-                                UPDATE promocion_componentes
-                                SET sesiones_restantes = 0
-                                WHERE tratamiento_asignado_id = ? AND tratamiento_id = ?
-                            """, (tratamiento_id, componente_id))
-                            conn.commit()
+                        asistente_id = referencia.id_asistente(esteticista_nombre)
+
+                        # Leer y validar el formulario en el hilo de Tk antes de guardar
+                        fecha = fecha_sesion.get_date().strftime('%Y-%m-%d')
+                        estado_pago = estado_pago_var.get()
+                        porcentaje = servicio.validar_cambios(fecha, porcentaje_entry.get(), estado_pago)
+
+                        guardar = partial(servicio.modificar_sesion_promocion, tratamiento_id, nombre_componente,
+                                          int(sesion_data[0].split()[1]), fecha, asistente_id, porcentaje,
+                                          estado_pago, realizada_var.get())
+                    except Exception as e:
+                        messagebox.showerror("Error", f"Error al modificar la sesión: {str(e)}", parent=self.root)
+                        return
 
+                    def al_guardar():
                         self.cargar_sesiones_promocion(tree_sesiones, tratamiento_id, componente_id, nombre_componente)
+                        self.refrescar_cambios()
                         window.destroy()
                         self.ventana_detalle.withdraw()
                         self.ventana_sesiones.withdraw()
-                        messagebox.showinfo("Éxito", "Sesión modificada correctamente", parent=self.root)
+                        with instrumentacion.sin_medir():
+                            messagebox.showinfo("Éxito", "Sesión modificada correctamente", parent=self.root)
 
-                    except Exception as e:
-                        if conn:
-                            conn.rollback()
-                        messagebox.showerror("Error", f"Error al modificar la sesión: {str(e)}", parent=self.root)
-                    finally:
-                        if conn:
-                            conn.close()
+                    with instrumentacion.accion("modificar_sesion_promocion.guardar", tratamiento_id=tratamiento_id):
+                        self.guardar_en_segundo_plano(guardar, boton_guardar, al_guardar,
+                                                      "Error al modificar la sesión")
 
                 btn_style = {
                     "corner_radius": 10,
@@ -900,7 +804,8 @@ class ControlSesiones:
                     "text_color": "white"
                 }
 
-                ctk.CTkButton(frame, text="Guardar cambios", command=guardar_cambios, **btn_style).pack(pady=10)
+                boton_guardar = ctk.CTkButton(frame, text="Guardar cambios", command=guardar_cambios, **btn_style)
+                boton_guardar.pack(pady=10)
                 ctk.CTkButton(frame, text="Cancelar", command=window.destroy, **btn_style).pack(pady=5)
 
         except IndexError:
@@ -912,23 +817,8 @@ class ControlSesiones:
 
     def registrar_nueva_sesion_promocion(self, tratamiento_id, tree_sesiones, ventana_parent, componente_id, nombre_componente, precio_componente):
         try:
-            query = """
-                SELECT
-                    pd.nombre_componente,
-                    pd.cantidad_sesiones,
-                    COALESCE(pc.sesiones_restantes, pd.cantidad_sesiones) as sesiones_restantes,
-                    COUNT(sr.id) AS sesiones_realizadas,
-                    pc.id as componente_id
-                FROM promocion_detalles pd
-                JOIN tratamientos_asignados ta ON pd.promocion_id = ta.tratamiento_id
-                LEFT JOIN promocion_componentes pc ON ta.id = pc.tratamiento_asignado_id
-                    AND pd.nombre_componente = pc.tratamiento_id
-                LEFT JOIN sesiones_realizadas sr ON sr.tratamiento_asignado_id = ta.id
-                    AND sr.nombre_componente = pd.nombre_componente
-                WHERE ta.id = ? AND pd.nombre_componente = ?
-                GROUP BY pd.nombre_componente
-            """
-            componente_info = execute_query(query, (tratamiento_id, nombre_componente), fetch=True)[0]
+            query = "componente_promocion"
+            componente_info = consultas.consultar(query, (tratamiento_id, nombre_componente))[0]
 
             if not componente_info:
                 raise Exception("No se encontró información del componente")
@@ -950,14 +840,13 @@ class ControlSesiones:
             title = ctk.CTkLabel(frame, text=f"Registrar Nueva Sesión - {nombre_componente}", font=("Helvetica", 20, "bold"))
             title.pack(pady=10)
             # Obtener lista de esteticistas
-            query = "SELECT id, nombre FROM asistentes ORDER BY nombre"
-            esteticistas = execute_query(query, fetch=True)
+            referencia = cache_referencia.obtener()
 
             # Selector de esteticista
             ctk.CTkLabel(frame, text="Esteticista:").pack(pady=5)
             esteticista_var = ctk.StringVar()
             esteticista_combo = ctk.CTkComboBox(frame,
-                                                values=[e[1] for e in esteticistas],
+                                                values=referencia.nombres_asistentes,
                                                 variable=esteticista_var)
             esteticista_combo.pack(pady=5)
 
@@ -1004,63 +893,41 @@ class ControlSesiones:
 
                     # Obtener ID del esteticista
                     esteticista_nombre = esteticista_var.get()
-                    asistente_id = next(e[0] for e in esteticistas if e[1] == esteticista_nombre)
+                    asistente_id = referencia.id_asistente(esteticista_nombre)
 
                     fecha = fecha_sesion.get_date().strftime('%Y-%m-%d')
 
-                    query = """
-                        INSERT INTO sesiones_realizadas (
-                            tratamiento_asignado_id,
-                            nombre_componente,
-                            asistente_id,
-                            fecha_sesion,
-                            numero_sesion,
-                            monto_abonado,
-                            estado_pago,
-                            estado_sesion,
-                            porcentaje_asistente,
-                            proxima_cita,
-                            realizada
-                        ) VALUES (?, ?, ?, ?, (
-                            SELECT COALESCE(MAX(numero_sesion), 0) + 1
-                            FROM sesiones_realizadas
-                            WHERE tratamiento_asignado_id = ? AND nombre_componente = ?
-                        ), ?, ?, ?, ?, ?, ?)
-                    """
-                    params = (
-                        tratamiento_id,
-                        nombre_componente,
-                        asistente_id,
-                        fecha,
-                        tratamiento_id,
-                        nombre_componente,
-                        precio_componente,
-                        estado_pago_var.get(),
-                        'Realizada' if realizada_var.get() else 'Pendiente',
-                        porcentaje,
-                        (datetime.strptime(fecha, '%Y-%m-%d') + timedelta(days=7)).strftime('%Y-%m-%d'),
-                        realizada_var.get()
-                    )
-                    execute_query(query, params)
+                    # El número de sesión se reserva al guardar, dentro de la transacción
+                    guardar = partial(servicio.registrar_sesion, tratamiento_id, asistente_id, fecha, porcentaje,
+                                      estado_pago_var.get(), realizada_var.get(), nombre_componente)
+                except Exception as e:
+                    messagebox.showerror("Error", f"Error al guardar la sesión: {str(e)}", parent=self.root)
+                    return
+
+                def al_guardar():
                     self.cargar_sesiones_promocion(tree_sesiones, tratamiento_id, componente_id, nombre_componente)
+                    self.refrescar_cambios()
                     window.destroy()
                     self.ventana_sesiones.withdraw()
                     self.ventana_detalle.withdraw()
-                    messagebox.showinfo("Éxito", "Sesión registrada correctamente", parent=self.root)
+                    with instrumentacion.sin_medir():
+                        messagebox.showinfo("Éxito", "Sesión registrada correctamente", parent=self.root)
 
-                except Exception as e:
-                    messagebox.showerror("Error", f"Error al guardar la sesión: {str(e)}", parent=self.root)
+                with instrumentacion.accion("registrar_nueva_sesion_promocion.guardar", tratamiento_id=tratamiento_id):
+                    self.guardar_en_segundo_plano(guardar, boton_guardar, al_guardar,
+                                                  "Error al guardar la sesión")
 
             btn_style = {"corner_radius": 10, "fg_color": "#000000", "hover_color": "#676767",
                          "border_width": 2, "text_color": "white"}
 
-            ctk.CTkButton(frame, text="Guardar", command=guardar_sesion, **btn_style).pack(pady=10)
+            boton_guardar = ctk.CTkButton(frame, text="Guardar", command=guardar_sesion, **btn_style)
+            boton_guardar.pack(pady=10)
             ctk.CTkButton(frame, text="Cancelar", command=window.destroy, **btn_style).pack(pady=5)
 
         except Exception as e:
             messagebox.showerror("Error", f"Error al preparar el formulario: {str(e)}", parent=self.root)
 
-    def mostrar_lista_sesiones(self, parent_frame, tratamiento_id, ventana_parent, componente_id=None):
+    def mostrar_lista_sesiones(self, parent_frame, tratamiento_id, ventana_parent, componente_id=None, detalle=None):
         # Frame para la lista de sesiones
         sesiones_frame = ctk.CTkFrame(parent_frame)
         sesiones_frame.pack(fill="both", expand=True, pady=10)
@@ -1068,13 +935,20 @@ class ControlSesiones:
         # Crear Treeview para las sesiones
         columns = ("Sesión #", "Fecha", "Esteticista", "Monto Abonado",
                   "Estado de Pago", "Próxima Cita", "Estado")
-        tree_sesiones = ttk.Treeview(sesiones_frame, columns=columns,
+        tree_sesiones = ListaVirtual(sesiones_frame, columns=columns,
                                    show="headings", height=5)
 
         # Configurar columnas
         for col in columns:
             tree_sesiones.heading(col, text=col)
             tree_sesiones.column(col, width=100)
+        self.cancelar_al_cerrar(tree_sesiones)
+
+        # Estilos de las filas que arma cargar_sesiones
+        tree_sesiones.tag_configure('info', background='#f0f0f0', foreground='#000000')
+        tree_sesiones.tag_configure('completada', foreground='green')
+        tree_sesiones.tag_configure('cancelada', foreground='red')
+        tree_sesiones.tag_configure('pendiente', foreground='orange')
 
         # Agregar scrollbars
         vsb = ttk.Scrollbar(sesiones_frame, orient="vertical",
@@ -1113,8 +987,11 @@ class ControlSesiones:
                          tratamiento_id, tree_sesiones, componente_id),
                      **btn_style).pack(side="left", padx=5)
 
-        # Cargar las sesiones
-        self.cargar_sesiones(tree_sesiones, tratamiento_id, componente_id)
+        # Las sesiones ya leídas con el detalle se muestran sin volver a consultar
+        if detalle is not None:
+            self.llenar_sesiones(tree_sesiones, detalle, componente_id)
+        else:
+            self.cargar_sesiones(tree_sesiones, tratamiento_id, componente_id)
         ventana_parent.lift()  # Mantener ventana detalle al frente
 
     def modificar_sesion_seleccionada(self, tratamiento_id, tree_sesiones, componente_id=None):
@@ -1138,40 +1015,17 @@ class ControlSesiones:
         frame.pack(padx=20, pady=20, fill="both", expand=True)
 
         # Obtener lista de esteticistas
-        conn = sqlite3.connect('spa_database.db')
-        c = conn.cursor()
-        c.execute("SELECT id, nombre FROM asistentes ORDER BY nombre")
-        esteticistas = c.fetchall()
+        referencia = cache_referencia.obtener()
 
         # Obtener el estado actual de la sesión
-        c.execute("""
-            SELECT realizada, porcentaje_asistente, comision_sumada, id, asistente_id
-            FROM sesiones_realizadas
-            WHERE tratamiento_asignado_id = ? AND numero_sesion = ?
-        """, (tratamiento_id, int(sesion_data[0].split()[1])))
-        sesion_actual = c.fetchone()
+        sesion_actual = consultas.consultar_uno("estado_sesion", (tratamiento_id, int(sesion_data[0].split()[1])))
         esta_realizada = sesion_actual[0]
         porcentaje_anterior = sesion_actual[1]
-        comision_sumada = sesion_actual[2]
-        sesion_id = sesion_actual[3]
 
         # Obtener información del tratamiento asignado
-        c.execute("""
-            SELECT
-                p.nombre,
-                t.nombre,
-                ta.sesiones_restantes,
-                ta.costo_total / ta.sesiones_asignadas as costo_por_sesion,
-                ta.costo_total
-            FROM tratamientos_asignados ta
-            JOIN pacientes p ON ta.paciente_id = p.id
-            JOIN tratamientos t ON ta.tratamiento_id = t.id
-            WHERE ta.id = ?
-        """, (tratamiento_id,))
-        info_tratamiento = c.fetchone()
+        info_tratamiento = consultas.consultar_uno("info_tratamiento_sesion", (tratamiento_id,))
         monto = info_tratamiento[3]
 
-        conn.close()
 
         # Campos de modificación
         ctk.CTkLabel(frame, text=f"Modificar {sesion_data[0]}",
@@ -1183,13 +1037,13 @@ class ControlSesiones:
                             foreground='white', borderwidth=2,
                             date_pattern='yyyy-mm-dd')
         fecha_sesion.pack(pady=5)
-        fecha_sesion.set_date(datetime.strptime(sesion_data[1], '%Y-%m-%d').date())
+        fecha_sesion.set_date(date.fromisoformat(sesion_data[1]))
 
         # Esteticista
         ctk.CTkLabel(frame, text="Esteticista:").pack(pady=5)
         esteticista_var = ctk.StringVar(value=sesion_data[2])
         esteticista_combo = ctk.CTkComboBox(frame,
-                                        values=[e[1] for e in esteticistas],
+                                        values=referencia.nombres_asistentes,
                                         variable=esteticista_var)
         esteticista_combo.pack(pady=5)
 
@@ -1221,116 +1075,34 @@ class ControlSesiones:
     
         def guardar_cambios():
             try:
-                conn = sqlite3.connect('spa_database.db')
-                c = conn.cursor()
-
+                # Leer el formulario en el hilo de Tk antes de guardar
                 # Obtener ID del esteticista
                 esteticista_nombre = esteticista_var.get()
-                asistente_id = next(e[0] for e in esteticistas if e[1] == esteticista_nombre)
+                asistente_id = referencia.id_asistente(esteticista_nombre)
 
-                # Obtener el monto actual
-                porcentaje_asistente = float(porcentaje_asistente_entry.get())
-
-                # Determinar si se debe sumar o restar la comisión
-                estado_sesion = 'Realizada' if realizada_var.get() else 'Pendiente'
+                fecha = fecha_sesion.get_date().strftime('%Y-%m-%d')
                 estado_pago = estado_pago_var.get()
-                debe_sumar_comision = estado_sesion == 'Realizada' and estado_pago == 'PAGADO'
-
-                # Si hay cambio en la comisión, actualizar tratamientos_asignados
-                comision_calculada = monto * porcentaje_asistente / 100 if debe_sumar_comision else 0
-
-                if comision_sumada and not debe_sumar_comision:
-                    # Restar la comisión anterior
-                    c.execute("""
-                        UPDATE tratamientos_asignados
-                        SET comision_asistente = comision_asistente - ?
-                        WHERE id = ?
-                    """, (comision_calculada, tratamiento_id))
-
-                elif not comision_sumada and debe_sumar_comision:
-                    # Sumar la nueva comisión
-                    c.execute("""
-                        UPDATE tratamientos_asignados
-                        SET comision_asistente = comision_asistente + ?
-                        WHERE id = ?
-                    """, (comision_calculada, tratamiento_id))
-
-                # Registrar el pago de comisión si corresponde
-                if debe_sumar_comision and not comision_sumada:
-                    c.execute("""
-                        INSERT INTO pagos_asistentes (
-                            asistente_id,
-                            tratamiento_asignado_id,
-                            sesion_id,
-                            monto,
-                            fecha_pago,
-                            tipo_comision,
-                            detalle
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        asistente_id,
-                        tratamiento_id,
-                        sesion_id,
-                        comision_calculada,
-                        fecha_sesion.get_date().strftime('%Y-%m-%d'),
-                        'Sesion',
-                        f'Comisión por sesión {sesion_data[0]}'
-                    ))
-
-                sesion_anterior_completada = comision_sumada == 1
-                sesion_nueva_completada = estado_pago == "PAGADO" and realizada_var.get()
-                
-                # Actualizar sesiones_restantes solo si hay un cambio real en el estado
-                if not sesion_anterior_completada and sesion_nueva_completada:
-                    # La sesión pasa de no completada a completada
-                    c.execute("""
-                        UPDATE tratamientos_asignados
-                        SET sesiones_restantes = sesiones_restantes - 1
-                        WHERE id = ?
-                    """, (tratamiento_id,))
-                elif sesion_anterior_completada and not sesion_nueva_completada:
-                    # La sesión pasa de completada a no completada
-                    c.execute("""
-                        UPDATE tratamientos_asignados
-                        SET sesiones_restantes = sesiones_restantes + 1
-                        WHERE id = ?
-                    """, (tratamiento_id,))
-
-                # Actualizar la sesión
-                c.execute("""
-                    UPDATE sesiones_realizadas
-                    SET fecha_sesion = ?,
-                        asistente_id = ?,
-                        monto_abonado = ?,
-                        estado_pago = ?,
-                        realizada = ?,
-                        estado_sesion = ?,
-                        porcentaje_asistente = ?,
-                        comision_sumada = ?
-                    WHERE tratamiento_asignado_id = ? AND numero_sesion = ?
-                """, (
-                    fecha_sesion.get_date().strftime('%Y-%m-%d'),
-                    asistente_id,
-                    monto,
-                    estado_pago_var.get(),
-                    realizada_var.get(),
-                    estado_sesion,
-                    porcentaje_asistente,
-                    1 if debe_sumar_comision else 0,
-                    tratamiento_id,
-                    int(sesion_data[0].split()[1])
-                ))
-
-                conn.commit()
-                conn.close()
-
-                self.cargar_sesiones(tree_sesiones, tratamiento_id, componente_id)
-                window.destroy()
-                messagebox.showinfo("Éxito", "Sesión modificada correctamente", parent=self.root)
+                porcentaje_asistente = servicio.validar_cambios(fecha, porcentaje_asistente_entry.get(), estado_pago)
 
+                # La comisión, las sesiones restantes y el pago al asistente
+                # se ajustan al guardar, según el estado actual de la sesión
+                guardar = partial(servicio.modificar_sesion, tratamiento_id, int(sesion_data[0].split()[1]),
+                                  fecha, asistente_id, porcentaje_asistente, estado_pago, realizada_var.get())
             except Exception as e:
                 print(f"Debug - Error detallado: {str(e)}")
                 messagebox.showerror("Error", f"Error al modificar la sesión: {str(e)}", parent=self.root)
+                return
+
+            def al_guardar():
+                self.cargar_sesiones(tree_sesiones, tratamiento_id, componente_id)
+                self.refrescar_cambios()
+                window.destroy()
+                with instrumentacion.sin_medir():
+                    messagebox.showinfo("Éxito", "Sesión modificada correctamente", parent=self.root)
+
+            with instrumentacion.accion("ventana_modificar_sesion.guardar", tratamiento_id=tratamiento_id):
+                self.guardar_en_segundo_plano(guardar, boton_guardar, al_guardar,
+                                              "Error al modificar la sesión")
 
 
 
@@ -1342,8 +1114,9 @@ class ControlSesiones:
             "text_color": "white"
         }
 
-        ctk.CTkButton(frame, text="Guardar cambios",
-                    command=guardar_cambios, **btn_style).pack(pady=10)
+        boton_guardar = ctk.CTkButton(frame, text="Guardar cambios",
+                    command=guardar_cambios, **btn_style)
+        boton_guardar.pack(pady=10)
         ctk.CTkButton(frame, text="Cancelar",
                     command=window.destroy, **btn_style).pack(pady=5)
 
@@ -1368,31 +1141,16 @@ class ControlSesiones:
 
     def registrar_nueva_sesion(self, tratamiento_id, tree_sesiones, ventana_detalle, componente_id=None):
         # Primero verificar si quedan sesiones disponibles
-        conn = sqlite3.connect('spa_database.db')
-        c = conn.cursor()
-
         # Verificar si es una promoción
-        c.execute("""
-            SELECT t.es_promocion
-            FROM tratamientos t
-            JOIN tratamientos_asignados ta ON t.id = ta.tratamiento_id
-            WHERE ta.id = ?
-        """, (tratamiento_id,))
-        es_promocion = c.fetchone()[0]
+        es_promocion = consultas.consultar_uno("es_promocion", (tratamiento_id,))[0]
 
         if es_promocion:
             pass
         else:
             # Verificar sesiones restantes en tratamiento normal
-            c.execute("""
-                SELECT sesiones_restantes
-                FROM tratamientos_asignados
-                WHERE id = ?
-            """, (tratamiento_id,))
-            sesiones_restantes = c.fetchone()[0]
+            sesiones_restantes = consultas.consultar_uno("sesiones_restantes", (tratamiento_id,))[0]
 
             if sesiones_restantes <= 0:
-                conn.close()
                 self.ventana_detalle.withdraw()
                 messagebox.showwarning("Aviso", "Todas las sesiones del tratamiento han sido completadas.", parent=self.root)
                 return
@@ -1408,40 +1166,14 @@ class ControlSesiones:
         frame.pack(padx=20, pady=20, fill="both", expand=True)
 
         # Obtener información del tratamiento
-        conn = sqlite3.connect('spa_database.db')
-        c = conn.cursor()
-
         # Verificar si es una promoción
-        c.execute("""
-            SELECT t.es_promocion
-            FROM tratamientos t
-            JOIN tratamientos_asignados ta ON t.id = ta.tratamiento_id
-            WHERE ta.id = ?
-        """, (tratamiento_id,))
-        es_promocion = c.fetchone()[0]
+        es_promocion = consultas.consultar_uno("es_promocion", (tratamiento_id,))[0]
 
-            
         # Modificada la consulta para incluir información básica del tratamiento
-        c.execute("""
-            SELECT
-                p.nombre,
-                t.nombre,
-                ta.sesiones_restantes,
-                ta.costo_total / ta.sesiones_asignadas as costo_por_sesion,
-                ta.costo_total
-            FROM tratamientos_asignados ta
-            JOIN pacientes p ON ta.paciente_id = p.id
-            JOIN tratamientos t ON ta.tratamiento_id = t.id
-            WHERE ta.id = ?
-        """, (tratamiento_id,))
-        
-        info_tratamiento = c.fetchone()
-        monto = info_tratamiento[3]
+        info_tratamiento = consultas.consultar_uno("info_tratamiento_sesion", (tratamiento_id,))
 
         # Obtener lista de esteticistas
-        c.execute("SELECT id, nombre FROM asistentes ORDER BY nombre")
-        esteticistas = c.fetchall()
-        conn.close()
+        referencia = cache_referencia.obtener()
 
         title = ctk.CTkLabel(frame, text="Registrar Nueva Sesión",
                             font=("Helvetica", 20, "bold"))
@@ -1455,7 +1187,7 @@ class ControlSesiones:
         ctk.CTkLabel(frame, text="Esteticista:").pack(pady=5)
         esteticista_var = ctk.StringVar()
         esteticista_combo = ctk.CTkComboBox(frame,
-                                        values=[e[1] for e in esteticistas],
+                                        values=referencia.nombres_asistentes,
                                         variable=esteticista_var)
         esteticista_combo.pack(pady=5)
 
@@ -1499,91 +1231,36 @@ class ControlSesiones:
 
                 # Obtener ID del esteticista seleccionado
                 esteticista_nombre = esteticista_var.get()
-                asistente_sesion_id = next(e[0] for e in esteticistas if e[1] == esteticista_nombre)
-
-                conn = sqlite3.connect('spa_database.db')
-                c = conn.cursor()
+                asistente_sesion_id = referencia.id_asistente(esteticista_nombre)
 
+                # Leer el formulario en el hilo de Tk antes de guardar
                 fecha_actual = fecha_sesion.get_date().strftime('%Y-%m-%d')
-                estado_sesion = 'Realizada' if realizada_var.get() else 'Pendiente'
+                realizada = realizada_var.get()
                 estado_pago = estado_pago_var.get()
 
-                # Calcular si se debe sumar la comisión
-                debe_sumar_comision = estado_sesion == 'Realizada' and estado_pago == 'Pagado'
-                comision_calculada = (monto * porcentaje_asistente / 100) if debe_sumar_comision else 0
-
-                if es_promocion:
-                    pass
-
-                else:
-                    # Si se debe sumar la comisión, actualizar la comisión del esteticista
-                    if debe_sumar_comision:
-                        c.execute("""
-                            UPDATE esteticistas
-                            SET comision = comision + ?
-                            WHERE id = ?
-                        """, (comision_calculada, asistente_sesion_id))
-
-                    # Insertar la sesión para tratamientos normales
-                    c.execute("""
-                        INSERT INTO sesiones_realizadas (
-                            tratamiento_asignado_id,
-                            asistente_id,
-                            fecha_sesion,
-                            numero_sesion,
-                            monto_abonado,
-                            estado_pago,
-                            estado_sesion,
-                            porcentaje_asistente,
-                            proxima_cita,
-                            comision_sumada,
-                            realizada
-                        )
-                        VALUES (?, ?, ?, (
-                            SELECT COUNT(*) + 1
-                            FROM sesiones_realizadas
-                            WHERE tratamiento_asignado_id = ?
-                        ), ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        tratamiento_id,
-                        asistente_sesion_id,
-                        fecha_actual,
-                        tratamiento_id,
-                        monto,
-                        estado_pago,
-                        estado_sesion,
-                        porcentaje_asistente,
-                        (datetime.strptime(fecha_actual, '%Y-%m-%d') + timedelta(days=7)).strftime('%Y-%m-%d'),
-                        1 if debe_sumar_comision else 0,
-                        realizada_var.get()
-                    ))
-
-                    # Actualizar el tratamiento asignado
-                    estado_sesion = 'Realizada' if realizada_var.get() else 'Pendiente'
-                    estado_pago = estado_pago_var.get()
-
-                    # Solo actualizar sesiones restantes si está pagada Y realizada
-                    if estado_pago == "PAGADO" and estado_sesion == "Realizada":
-                        c.execute("""
-                            UPDATE tratamientos_asignados
-                            SET sesiones_restantes = sesiones_restantes - 1,
-                                total_pagado = total_pagado + ?,
-                                saldo_pendiente = saldo_pendiente - ?
-                            WHERE id = ?
-                        """, (monto, monto, tratamiento_id))
-
-                
-
-                conn.commit()
-                conn.close()
+                registrar = partial(servicio.registrar_sesion, tratamiento_id, asistente_sesion_id,
+                                    fecha_actual, porcentaje_asistente, estado_pago, realizada)
+            except Exception as e:
+                print(f"Debug - Error detallado: {str(e)}")
+                messagebox.showerror("Error", f"Error al registrar la sesión: {str(e)}", parent=self.root)
+                return
+
+            def guardar():
+                # Las promociones se registran por componente
+                if not es_promocion:
+                    registrar()
 
+            def al_guardar():
                 self.cargar_sesiones(tree_sesiones, tratamiento_id, componente_id if es_promocion else None)
+                self.refrescar_cambios()
                 window.destroy()
                 self.ventana_detalle.lift()  # Mantener ventana detalle al frente
-                messagebox.showinfo("Éxito", "Sesión registrada correctamente", parent=self.root)
-            except Exception as e:
-                print(f"Debug - Error detallado: {str(e)}")
-                messagebox.showerror("Error", f"Error al registrar la sesión: {str(e)}", parent=self.root)
+                with instrumentacion.sin_medir():
+                    messagebox.showinfo("Éxito", "Sesión registrada correctamente", parent=self.root)
+
+            with instrumentacion.accion("registrar_nueva_sesion.guardar", tratamiento_id=tratamiento_id):
+                self.guardar_en_segundo_plano(guardar, boton_confirmar, al_guardar,
+                                              "Error al registrar la sesión")
     #...
 
         btn_style = {
@@ -1594,40 +1271,21 @@ class ControlSesiones:
             "text_color": "white"
         }
 
-        ctk.CTkButton(frame, text="Confirmar",
-                    command=confirmar_sesion, **btn_style).pack(pady=10)
+        boton_confirmar = ctk.CTkButton(frame, text="Confirmar",
+                    command=confirmar_sesion, **btn_style)
+        boton_confirmar.pack(pady=10)
         ctk.CTkButton(frame, text="Cancelar",
                     command=window.destroy, **btn_style).pack(pady=5)
     
             
     def marcar_como_completado(self, tratamiento_id):
-        # Actualizar el estado del tratamiento a INACTIVO
-        execute_query("UPDATE tratamientos_asignados SET estado = 'INACTIVO' WHERE id = ?", (tratamiento_id,))
-
-        # Obtener información del tratamiento para registrar en reportes
-        tratamiento_info = execute_query("SELECT p.nombre, t.nombre, t.precio FROM tratamientos_asignados ta JOIN pacientes p ON ta.paciente_id = p.id JOIN tratamientos t ON ta.tratamiento_id = t.id WHERE ta.id = ?", (tratamiento_id,), fetch=True)[0]
-
-        # Registrar en reportes
-        execute_query("""
-            INSERT INTO reportes (
-                fecha,
-                concepto,
-                ingreso,
-                egreso,
-                detalle
-            )
-            VALUES (?, ?, ?, ?, ?)
-        """, (
-            datetime.now().strftime("%Y-%m-%d"),
-            "Tratamiento completado",
-            tratamiento_info[2],  # Precio del tratamiento
-            0,  # Egreso (puedes ajustar esto si hay algún costo asociado)
-            f"Tratamiento completado - {tratamiento_info[1]} - {tratamiento_info[0]}"
-        ))
-
-        # Actualizar la lista para reflejar los cambios
-        self.actualizar_lista()
+        # Pasa a INACTIVO y queda registrado en reportes
+        servicio.completar_tratamiento(tratamiento_id)
+
+        # Actualizar solo la fila de este tratamiento en la lista
+        self.refrescar_cambios()
 
     def volver_menu_principal(self):
+        self.ejecutor.cancelar_grupo("lista")
         self.main_system.show_main_menu()
         
\ No newline at end of file
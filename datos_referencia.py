@@ -0,0 +1,88 @@
+import threading
+from collections import namedtuple
+
+from conexion import lectura, obtener_conexion
+from consultas_sesiones import consultas
+
+# Catálogos que usan todos los formularios (asistentes, tratamientos y
+# definiciones de promociones), leídos una vez por proceso y compartidos por
+# todos los hilos. Abrir un diálogo no consulta la base: para saber si la
+# caché sigue vigente alcanza con PRAGMA data_version (cambia cuando otra
+# conexión escribe) y total_changes de la conexión (cuando escribe ella
+# misma). Solo si alguno cambió se lee version_referencia, que los triggers
+# de la migración 12 suben con cada escritura en esas tablas.
+
+Tratamiento = namedtuple("Tratamiento", "id nombre precio es_promocion")
+ComponentePromocion = namedtuple("ComponentePromocion", "nombre cantidad_sesiones precio")
+
+
+class DatosReferencia:
+    def __init__(self, version, asistentes, tratamientos, componentes):
+        self.version = version
+        # [(id, nombre)] ordenados por nombre, como los muestran los combos
+        self.asistentes = asistentes
+        self.nombres_asistentes = [nombre for _, nombre in asistentes]
+        self.nombre_asistente = dict(asistentes)
+        # Con nombres repetidos queda el primero, como hacían los formularios
+        self.ids_asistentes = {}
+        for id_, nombre in asistentes:
+            self.ids_asistentes.setdefault(nombre, id_)
+        self.tratamientos = {fila[0]: Tratamiento(*fila) for fila in tratamientos}
+        # promocion_id -> {nombre_componente: ComponentePromocion}
+        self.promociones = {}
+        for promocion_id, nombre, cantidad, precio in componentes:
+            self.promociones.setdefault(promocion_id, {})[nombre] = ComponentePromocion(nombre, cantidad, precio)
+
+    def id_asistente(self, nombre):
+        id_ = self.ids_asistentes.get(nombre)
+        if id_ is None:
+            raise ValueError("Debe seleccionar un esteticista")
+        return id_
+
+    def componente(self, promocion_id, nombre):
+        # ComponentePromocion o None si la promoción no lo incluye
+        return self.promociones.get(promocion_id, {}).get(nombre)
+
+
+def cargar_referencia(conn=None):
+    # La versión se lee en la misma transacción que los datos
+    with lectura(conn) as conn:
+        version = consultas.consultar_uno("version_referencia", (), conn)[0]
+        return DatosReferencia(
+            version,
+            consultas.consultar("lista_asistentes", (), conn),
+            consultas.consultar("catalogo_tratamientos", (), conn),
+            consultas.consultar("definiciones_promociones", (), conn))
+
+
+class CacheReferencia:
+    def __init__(self):
+        self._datos = None
+        self._candado = threading.Lock()
+        # Lo último que vio cada hilo de su conexión: (conn, data_version,
+        # total_changes). Las conexiones son una por hilo (ver conexion).
+        self._local = threading.local()
+
+    def obtener(self, conn=None):
+        conn = conn or obtener_conexion()
+        marca = (conn, conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        datos = self._datos
+        if datos is not None and getattr(self._local, "marca", None) == marca:
+            return datos
+
+        version = consultas.consultar_uno("version_referencia", (), conn)[0]
+        with self._candado:
+            datos = self._datos
+            if datos is None or datos.version != version:
+                datos = self._datos = cargar_referencia(conn)
+        self._local.marca = marca
+        return datos
+
+    def invalidar(self):
+        # Para escrituras que no pasan por los triggers (por ejemplo, con los
+        # triggers suspendidos durante una importación)
+        with self._candado:
+            self._datos = None
+
+
+cache_referencia = CacheReferencia()
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+
+from conexion import lectura
+from consultas_sesiones import consultas, cambios_tratamientos
+
+# Detalles guardados en la caché y cuánto tiempo se confía en uno. Las
+# escrituras de este proceso lo invalidan en el momento; la edad máxima
+# acota lo que puede tardar en verse una escritura de otra estación.
+TAMANO_CACHE_DETALLES = 64
+EDAD_MAXIMA_DETALLE = 30  # segundos
+
+# Una sesión del detalle. nombre_componente es None en tratamientos individuales.
+SesionDetalle = namedtuple(
+    "SesionDetalle",
+    "numero fecha esteticista monto_abonado estado_pago proxima_cita estado_sesion "
+    "comision_sumada realizada nombre_componente")
+
+# Un componente de una promoción con su progreso y sus sesiones.
+# sesiones_realizadas cuenta todas las sesiones registradas del componente;
+# sesiones_completas, las realizadas y pagadas.
+ComponenteDetalle = namedtuple(
+    "ComponenteDetalle",
+    "nombre componente_id cantidad_sesiones sesiones_restantes precio "
+    "sesiones_realizadas sesiones_completas sesiones")
+
+DetalleTratamiento = namedtuple(
+    "DetalleTratamiento",
+    "id paciente tratamiento es_promocion costo_total total_pagado saldo_pendiente "
+    "sesiones_asignadas sesiones_restantes sesiones componentes")
+
+
+def cargar_detalle(tratamiento_id, conn=None):
+    # Todo lo que muestra la ventana de detalle, leído en una sola transacción
+    # de lectura: encabezado, sesiones y, en promociones, los componentes con
+    # su progreso y sus sesiones (agrupadas acá, sin una consulta por
+    # componente). None si el tratamiento no existe.
+    with lectura(conn) as conn:
+        fila = consultas.consultar_uno("detalle_tratamiento", (tratamiento_id,), conn)
+        if fila is None:
+            return None
+        sesiones = [SesionDetalle(*s) for s in consultas.consultar("detalle_sesiones", (tratamiento_id,), conn)]
+        filas_componentes = consultas.consultar("detalle_componentes", (tratamiento_id,), conn) if fila[7] else []
+
+    por_componente = defaultdict(list)
+    for sesion in sesiones:
+        por_componente[sesion.nombre_componente].append(sesion)
+
+    componentes = []
+    for nombre, componente_id, cantidad, restantes, precio in filas_componentes:
+        propias = por_componente.get(nombre, [])
+        completas = sum(1 for s in propias if s.realizada and s.estado_pago == 'PAGADO')
+        componentes.append(ComponenteDetalle(
+            nombre, componente_id, cantidad, restantes, precio, len(propias), completas, propias))
+
+    paciente, tratamiento, costo, pagado, saldo, asignadas, restantes, es_promocion = fila
+    return DetalleTratamiento(tratamiento_id, paciente, tratamiento, bool(es_promocion), costo, pagado,
+                              saldo, asignadas, restantes, sesiones, componentes)
+
+
+class CacheDetalles:
+    # Caché LRU de cargar_detalle por tratamiento_asignado_id. Cada entrada
+    # recuerda la versión de cambios_tratamientos leída antes de cargarla; si
+    # después se marcó una escritura sobre ese tratamiento, la entrada ya no
+    # sirve y se vuelve a leer.
+    def __init__(self, tamano=TAMANO_CACHE_DETALLES, edad_maxima=EDAD_MAXIMA_DETALLE):
+        self.tamano = tamano
+        self.edad_maxima = edad_maxima
+        self._entradas = OrderedDict()
+        self._candado = threading.Lock()
+
+    def vigente(self, tratamiento_id):
+        # Detalle guardado si sigue vigente, sin tocar la base; None si no
+        with self._candado:
+            entrada = self._entradas.get(tratamiento_id)
+            if entrada is None:
+                return None
+            detalle, version, cargado_en = entrada
+            if (cambios_tratamientos.version_de(tratamiento_id) > version
+                    or time.monotonic() - cargado_en > self.edad_maxima):
+                del self._entradas[tratamiento_id]
+                return None
+            self._entradas.move_to_end(tratamiento_id)
+            return detalle
+
+    def obtener(self, tratamiento_id):
+        detalle = self.vigente(tratamiento_id)
+        if detalle is not None:
+            return detalle
+
+        # La versión se lee antes de cargar: una escritura que se marque
+        # mientras tanto deja la entrada vencida
+        version = cambios_tratamientos.version
+        cargado_en = time.monotonic()
+        detalle = cargar_detalle(tratamiento_id)
+        if detalle is not None:
+            with self._candado:
+                self._entradas[tratamiento_id] = (detalle, version, cargado_en)
+                self._entradas.move_to_end(tratamiento_id)
+                while len(self._entradas) > self.tamano:
+                    self._entradas.popitem(last=False)
+        return detalle
+
+    def invalidar(self, *ids):
+        with self._candado:
+            if not ids:
+                self._entradas.clear()
+            for id_ in ids:
+                self._entradas.pop(id_, None)
+
+
+cache_detalles = CacheDetalles()
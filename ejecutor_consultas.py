@@ -0,0 +1,167 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentacion
+from conexion import obtener_conexion
+
+HILOS = 2
+# Cada cuánto revisa el hilo de Tk si hay resultados mientras queden tareas
+INTERVALO_MS = 25
+
+
+class Tarea:
+    def __init__(self, funcion, al_terminar, al_fallar, grupo, interrumpible):
+        self.funcion = funcion
+        self.al_terminar = al_terminar
+        self.al_fallar = al_fallar
+        self.grupo = grupo
+        self.interrumpible = interrumpible
+        self.cancelada = False
+        # Acción medida que envió la tarea (ver instrumentacion); sigue
+        # abierta hasta que la tarea entrega su resultado o se descarta
+        self.accion = instrumentacion.accion_actual()
+        if self.accion is not None:
+            self.accion.agregar_parte()
+        self._futuro = None
+        self._conn = None
+        self._candado = threading.Lock()
+
+    def cancelar(self):
+        # Una tarea cancelada nunca entrega su resultado. Si todavía no empezó
+        # se descarta; si es una lectura en curso se interrumpe la consulta.
+        with self._candado:
+            self.cancelada = True
+            if self._futuro is not None:
+                self._futuro.cancel()
+            if self._conn is not None and self.interrumpible:
+                self._conn.interrupt()
+
+
+class EjecutorConsultas:
+    # Ejecuta las consultas fuera del hilo de Tk. Los resultados vuelven por
+    # una cola que el hilo de Tk revisa con root.after, así los callbacks
+    # siempre corren en el hilo de la interfaz y pueden tocar widgets.
+    def __init__(self, root, hilos=HILOS, al_cambiar_ocupado=None):
+        self.root = root
+        self.al_cambiar_ocupado = al_cambiar_ocupado
+        self._hilos = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="consultas")
+        self._resultados = queue.SimpleQueue()
+        self._pendientes = set()
+        self._revision = None
+
+    @property
+    def ocupado(self):
+        return any(not tarea.cancelada for tarea in self._pendientes)
+
+    def enviar(self, funcion, al_terminar=None, al_fallar=None, grupo=None,
+               reemplazar=False, interrumpible=True):
+        # grupo: widget o clave a la que pertenece la tarea, para cancelar
+        # todo lo de una ventana al cerrarla. reemplazar=True cancela antes
+        # las tareas anteriores del mismo grupo (búsqueda mientras se escribe).
+        if reemplazar and grupo is not None:
+            self.cancelar_grupo(grupo)
+
+        ocupado_antes = self.ocupado
+        tarea = Tarea(funcion, al_terminar, al_fallar, grupo, interrumpible)
+        self._pendientes.add(tarea)
+        tarea._futuro = self._hilos.submit(self._ejecutar, tarea)
+
+        if self._revision is None:
+            self._revision = self.root.after(INTERVALO_MS, self._revisar)
+        if not ocupado_antes:
+            self._avisar_ocupado()
+        return tarea
+
+    def cancelar_grupo(self, grupo):
+        ocupado_antes = self.ocupado
+        for tarea in list(self._pendientes):
+            if tarea.grupo == grupo:
+                tarea.cancelar()
+        if ocupado_antes and not self.ocupado:
+            self._avisar_ocupado()
+
+    def cancelar_todo(self):
+        ocupado_antes = self.ocupado
+        for tarea in list(self._pendientes):
+            tarea.cancelar()
+        if ocupado_antes:
+            self._avisar_ocupado()
+
+    def cerrar(self):
+        self.cancelar_todo()
+        self._hilos.shutdown(wait=False)
+
+    def _ejecutar(self, tarea):
+        # Corre en un hilo del pool; cada hilo usa su propia conexión
+        conn = obtener_conexion()
+        with tarea._candado:
+            if tarea.cancelada:
+                self._resultados.put((tarea, None, None))
+                return
+            tarea._conn = conn
+        try:
+            if tarea.accion is None:
+                resultado, error = tarea.funcion(), None
+            else:
+                with instrumentacion.parte(tarea.accion, tk=False):
+                    resultado, error = tarea.funcion(), None
+        except Exception as e:
+            resultado, error = None, e
+        finally:
+            with tarea._candado:
+                tarea._conn = None
+        self._resultados.put((tarea, resultado, error))
+
+    def _revisar(self):
+        self._revision = None
+        ocupado_antes = self.ocupado
+
+        while True:
+            try:
+                tarea, resultado, error = self._resultados.get_nowait()
+            except queue.Empty:
+                break
+            self._pendientes.discard(tarea)
+            if tarea.cancelada:
+                self._terminar_accion(tarea)
+                continue
+            try:
+                if tarea.accion is None:
+                    self._entregar(tarea, resultado, error)
+                else:
+                    with instrumentacion.parte(tarea.accion):
+                        self._entregar(tarea, resultado, error)
+            except Exception as e:
+                # Mismo tratamiento que una excepción en cualquier callback de Tk
+                self.root.report_callback_exception(type(e), e, e.__traceback__)
+            self._terminar_accion(tarea)
+
+        # Las tareas descartadas antes de empezar no pasan por la cola
+        for tarea in list(self._pendientes):
+            if tarea.cancelada and tarea._futuro.cancelled():
+                self._pendientes.discard(tarea)
+                self._terminar_accion(tarea)
+
+        if self._pendientes and self._revision is None:
+            self._revision = self.root.after(INTERVALO_MS, self._revisar)
+        if ocupado_antes != self.ocupado:
+            self._avisar_ocupado()
+
+    def _entregar(self, tarea, resultado, error):
+        if error is None:
+            if tarea.al_terminar is not None:
+                tarea.al_terminar(resultado)
+        elif tarea.al_fallar is not None:
+            tarea.al_fallar(error)
+        else:
+            raise error
+
+    def _terminar_accion(self, tarea):
+        if tarea.accion is not None:
+            accion, tarea.accion = tarea.accion, None
+            accion.terminar_parte()
+
+    def _avisar_ocupado(self):
+        if self.al_cambiar_ocupado is not None:
+            self.al_cambiar_ocupado(self.ocupado)
@@ -0,0 +1,208 @@
+import argparse
+import csv
+import json
+import sys
+
+from conexion import RUTA_BD, abrir_conexion, iterar_consulta
+from migraciones import aplicar_migraciones
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Filas por fetchmany; también es el tamaño de cada grupo de filas en Parquet
+TAMANO_BLOQUE = 5000
+
+TIPOS_SQL = {"texto": "TEXT", "entero": "INTEGER", "real": "REAL"}
+
+# Cada exportación: columnas (nombre, expresión, tipo), tablas, columna de
+# fecha para el rango y columna de asistente (None si no aplica). El tipo se
+# fuerza con CAST para que todas las filas de una columna coincidan, lo que
+# exige el formato columnar.
+EXPORTACIONES = {
+    "sesiones": {
+        "columnas": [
+            ("id", "sr.id", "entero"),
+            ("fecha_sesion", "sr.fecha_sesion", "texto"),
+            ("paciente", "p.nombre", "texto"),
+            ("tratamiento", "t.nombre", "texto"),
+            ("componente", "sr.nombre_componente", "texto"),
+            ("numero_sesion", "sr.numero_sesion", "entero"),
+            ("asistente_id", "sr.asistente_id", "entero"),
+            ("asistente", "a.nombre", "texto"),
+            ("monto_abonado", "sr.monto_abonado", "real"),
+            ("estado_pago", "sr.estado_pago", "texto"),
+            ("estado_sesion", "sr.estado_sesion", "texto"),
+            ("realizada", "sr.realizada", "entero"),
+            ("porcentaje_asistente", "sr.porcentaje_asistente", "real"),
+            ("proxima_cita", "sr.proxima_cita", "texto"),
+        ],
+        "desde": """
+            sesiones_realizadas sr
+            JOIN tratamientos_asignados ta ON sr.tratamiento_asignado_id = ta.id
+            JOIN pacientes p ON ta.paciente_id = p.id
+            JOIN tratamientos t ON ta.tratamiento_id = t.id
+            LEFT JOIN asistentes a ON sr.asistente_id = a.id
+        """,
+        "fecha": "sr.fecha_sesion",
+        "asistente": "sr.asistente_id",
+        "orden": "sr.fecha_sesion, sr.id",
+    },
+    "pagos": {
+        "columnas": [
+            ("id", "pa.id", "entero"),
+            ("fecha_pago", "pa.fecha_pago", "texto"),
+            ("asistente_id", "pa.asistente_id", "entero"),
+            ("asistente", "a.nombre", "texto"),
+            ("tratamiento_asignado_id", "pa.tratamiento_asignado_id", "entero"),
+            ("sesion_id", "pa.sesion_id", "entero"),
+            ("monto", "pa.monto", "real"),
+            ("tipo_comision", "pa.tipo_comision", "texto"),
+            ("detalle", "pa.detalle", "texto"),
+        ],
+        "desde": """
+            pagos_asistentes pa
+            LEFT JOIN asistentes a ON pa.asistente_id = a.id
+        """,
+        "fecha": "pa.fecha_pago",
+        "asistente": "pa.asistente_id",
+        "orden": "pa.fecha_pago, pa.id",
+    },
+    "reportes": {
+        "columnas": [
+            ("id", "r.id", "entero"),
+            ("fecha", "r.fecha", "texto"),
+            ("concepto", "r.concepto", "texto"),
+            ("ingreso", "r.ingreso", "real"),
+            ("egreso", "r.egreso", "real"),
+            ("detalle", "r.detalle", "texto"),
+        ],
+        "desde": "reportes r",
+        "fecha": "r.fecha",
+        "asistente": None,
+        "orden": "r.fecha, r.id",
+    },
+}
+
+FORMATOS = ("csv", "jsonl", "parquet")
+
+
+def construir_exportacion(nombre, fecha_desde=None, fecha_hasta=None, asistente_id=None):
+    # Devuelve (sql, params, columnas) de la exportación con sus filtros
+    exportacion = EXPORTACIONES[nombre]
+    columnas = [c[0] for c in exportacion["columnas"]]
+    select = ",\n        ".join(f"CAST({expresion} AS {TIPOS_SQL[tipo]}) AS {columna}"
+                                for columna, expresion, tipo in exportacion["columnas"])
+
+    filtros, params = [], []
+    # Rango de fechas inclusivo; "< día siguiente" también incluye las
+    # fechas guardadas con hora
+    if fecha_desde:
+        filtros.append(f"{exportacion['fecha']} >= ?")
+        params.append(fecha_desde)
+    if fecha_hasta:
+        filtros.append(f"{exportacion['fecha']} < date(?, '+1 day')")
+        params.append(fecha_hasta)
+    if asistente_id is not None:
+        if exportacion["asistente"] is None:
+            raise ValueError(f"La exportación '{nombre}' no se puede filtrar por asistente")
+        filtros.append(f"{exportacion['asistente']} = ?")
+        params.append(asistente_id)
+
+    where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+    sql = f"""
+    SELECT
+        {select}
+    FROM {exportacion['desde']}
+    {where}
+    ORDER BY {exportacion['orden']}
+    """
+    return sql, tuple(params), columnas
+
+
+def escribir_csv(bloques, columnas, salida):
+    escritor = csv.writer(salida)
+    escritor.writerow(columnas)
+    total = 0
+    for bloque in bloques:
+        escritor.writerows(bloque)
+        total += len(bloque)
+    return total
+
+
+def escribir_jsonl(bloques, columnas, salida):
+    total = 0
+    for bloque in bloques:
+        salida.writelines(json.dumps(dict(zip(columnas, fila)), ensure_ascii=False) + "\n"
+                          for fila in bloque)
+        total += len(bloque)
+    return total
+
+
+def escribir_parquet(bloques, columnas, tipos, ruta):
+    if pyarrow is None:
+        raise RuntimeError("Para exportar en formato parquet hace falta instalar pyarrow")
+    tipos_arrow = {"texto": pyarrow.string(), "entero": pyarrow.int64(), "real": pyarrow.float64()}
+    esquema = pyarrow.schema([(columna, tipos_arrow[tipo]) for columna, tipo in zip(columnas, tipos)])
+    total = 0
+    # Un grupo de filas por bloque: en memoria solo hay un bloque a la vez
+    with pyarrow.parquet.ParquetWriter(ruta, esquema) as escritor:
+        for bloque in bloques:
+            valores = list(zip(*bloque))
+            escritor.write_table(pyarrow.table(
+                [pyarrow.array(columna, type=campo.type) for columna, campo in zip(valores, esquema)],
+                schema=esquema))
+            total += len(bloque)
+    return total
+
+
+def exportar(nombre, formato, ruta, fecha_desde=None, fecha_hasta=None, asistente_id=None,
+             ruta_bd=RUTA_BD):
+    # Recorre la consulta por bloques con fetchmany y los va escribiendo, así
+    # la memoria no depende de cuántas filas tenga la exportación.
+    # ruta "-" escribe CSV o JSON Lines en la salida estándar.
+    # Devuelve la cantidad de filas exportadas.
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido: {formato}")
+    sql, params, columnas = construir_exportacion(nombre, fecha_desde, fecha_hasta, asistente_id)
+
+    conn = abrir_conexion(ruta_bd)
+    try:
+        bloques = iterar_consulta(sql, params, TAMANO_BLOQUE, conn)
+        if formato == "parquet":
+            tipos = [c[2] for c in EXPORTACIONES[nombre]["columnas"]]
+            return escribir_parquet(bloques, columnas, tipos, ruta)
+
+        escribir = escribir_csv if formato == "csv" else escribir_jsonl
+        if ruta == "-":
+            return escribir(bloques, columnas, sys.stdout)
+        with open(ruta, "w", newline="", encoding="utf-8") as salida:
+            return escribir(bloques, columnas, salida)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exportar sesiones, pagos y reportes")
+    parser.add_argument("exportacion", choices=sorted(EXPORTACIONES))
+    parser.add_argument("salida", help="Archivo de salida ('-' para la salida estándar)")
+    parser.add_argument("--formato", choices=FORMATOS,
+                        help="csv, jsonl o parquet (por defecto según la extensión)")
+    parser.add_argument("--desde", help="Fecha inicial AAAA-MM-DD")
+    parser.add_argument("--hasta", help="Fecha final AAAA-MM-DD (inclusive)")
+    parser.add_argument("--asistente", type=int, help="ID del asistente")
+    parser.add_argument("--bd", default=RUTA_BD, help="Ruta de la base de datos")
+    args = parser.parse_args()
+
+    formato = args.formato
+    if formato is None:
+        extension = args.salida.rsplit(".", 1)[-1].lower()
+        formato = extension if extension in FORMATOS else "csv"
+
+    aplicar_migraciones(args.bd)
+    total = exportar(args.exportacion, formato, args.salida, args.desde, args.hasta,
+                     args.asistente, args.bd)
+    if args.salida != "-":
+        print(f"{total} filas exportadas a {args.salida}")
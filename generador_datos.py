@@ -0,0 +1,397 @@
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from conexion import RUTA_BD, abrir_conexion
+from importar_historico import (ACTUALIZAR_SECUENCIAS, INDEXAR_BUSQUEDA, TABLAS_IMPORTADAS,
+                                TAMANO_LOTE, TRIGGERS_DIFERIDOS, suspender_indices)
+from migraciones import aplicar_migraciones, recalcular_progreso_componentes, reconstruir_resumenes
+
+# Datos sintéticos para medir las pantallas de Control de Sesiones con
+# volúmenes reales (de 10 mil a 10 millones de sesiones). Las filas se
+# escriben por lotes, con los índices y los triggers por fila suspendidos
+# como en importar_historico, y los valores derivados (contadores,
+# sesiones restantes, saldos, libro de comisiones, resúmenes) quedan
+# coherentes con lo que harían las pantallas.
+
+TABLAS_BASE = ("pacientes", "asistentes", "tratamientos", "promocion_detalles", "tratamientos_asignados",
+               "promocion_componentes", "sesiones_realizadas", "pagos_asistentes", "reportes")
+TABLAS_GENERADAS = (*TABLAS_IMPORTADAS, "pacientes", "pagos_asistentes", "reportes", "comisiones_movimientos")
+# Además de los de la importación: el contador de componentes pendientes se
+# escribe con cada tratamiento y los saldos de comisiones se calculan al
+# final en una sola sentencia
+TRIGGERS_GENERACION = (*TRIGGERS_DIFERIDOS, "trg_componentes_pendientes_insert", "trg_comisiones_saldos_insert")
+
+DIAS_HISTORIA = 3 * 365
+TRATAMIENTOS_POR_PACIENTE = 3
+PROPORCION_SIN_INICIAR = 0.05
+PROPORCION_PROMOCIONES = 0.25
+PROPORCION_REALIZADAS = 0.9
+PROPORCION_PAGADAS = 0.85
+PORCENTAJES = (10, 15, 20, 25)
+ASISTENTES = 12
+
+# Catálogo que se crea si la base no tiene tratamientos: (nombre, precio por sesión)
+CATALOGO = (
+    ("Limpieza facial", 45), ("Masaje descontracturante", 40), ("Depilación láser", 60),
+    ("Drenaje linfático", 35), ("Peeling químico", 70), ("Radiofrecuencia", 55),
+    ("Mesoterapia", 80), ("Microdermoabrasión", 50), ("Presoterapia", 30), ("Criolipólisis", 120),
+)
+# (nombre, [(componente, sesiones)]); el precio es el de cada componente con 20% de descuento
+PROMOCIONES = (
+    ("Promo Verano", [("Depilación láser", 4), ("Limpieza facial", 2)]),
+    ("Promo Modeladora", [("Radiofrecuencia", 6), ("Presoterapia", 6), ("Drenaje linfático", 4)]),
+    ("Promo Rostro", [("Limpieza facial", 3), ("Peeling químico", 2), ("Microdermoabrasión", 3)]),
+    ("Promo Relax", [("Masaje descontracturante", 4), ("Drenaje linfático", 2)]),
+)
+DESCUENTO_PROMOCION = 0.8
+
+NOMBRES = ("María", "Lucía", "Ana", "Sofía", "Valentina", "Camila", "Martina", "Julieta", "Paula", "Florencia",
+           "Carla", "Laura", "José", "Juan", "Carlos", "Diego", "Martín", "Pablo", "Andrés", "Luis")
+APELLIDOS = ("González", "Rodríguez", "Gómez", "Fernández", "López", "Díaz", "Martínez", "Pérez", "García",
+             "Sánchez", "Romero", "Sosa", "Álvarez", "Torres", "Ruiz", "Ramírez", "Flores", "Benítez", "Núñez", "Peña")
+
+INSERTAR_PACIENTE = "INSERT INTO pacientes (id, nombre) VALUES (?, ?)"
+
+INSERTAR_TRATAMIENTO = """
+    INSERT INTO tratamientos_asignados (
+        id,
+        paciente_id,
+        tratamiento_id,
+        asistente_id,
+        fecha_asignacion,
+        estado_inicio,
+        sesiones_asignadas,
+        sesiones_restantes,
+        costo_total,
+        total_pagado,
+        saldo_pendiente,
+        comision_asistente,
+        estado,
+        componentes_pendientes
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERTAR_COMPONENTE = """
+    INSERT INTO promocion_componentes (tratamiento_asignado_id, tratamiento_id, sesiones_restantes)
+    VALUES (?, ?, ?)
+"""
+
+INSERTAR_SESION = """
+    INSERT INTO sesiones_realizadas (
+        id,
+        tratamiento_asignado_id,
+        nombre_componente,
+        asistente_id,
+        fecha_sesion,
+        numero_sesion,
+        monto_abonado,
+        estado_pago,
+        estado_sesion,
+        porcentaje_asistente,
+        proxima_cita,
+        comision_sumada,
+        realizada
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERTAR_PAGO = """
+    INSERT INTO pagos_asistentes (asistente_id, tratamiento_asignado_id, sesion_id, monto, fecha_pago, tipo_comision, detalle)
+    VALUES (?, ?, ?, ?, ?, 'Sesion', ?)
+"""
+
+INSERTAR_REPORTE = "INSERT INTO reportes (fecha, concepto, ingreso, egreso, detalle) VALUES (?, ?, ?, ?, ?)"
+
+# Libro de comisiones: un movimiento por cada sesión con la comisión sumada
+INSERTAR_MOVIMIENTOS = """
+    INSERT INTO comisiones_movimientos (
+        asistente_id, tratamiento_asignado_id, sesion_id, periodo, monto, concepto, registrado_en
+    )
+    SELECT
+        asistente_id,
+        tratamiento_asignado_id,
+        id,
+        substr(fecha_sesion, 1, 7),
+        ROUND(monto_abonado * porcentaje_asistente / 100, 2),
+        'Comisión por sesión ' || numero_sesion || IFNULL(' - ' || nombre_componente, ''),
+        datetime('now', 'localtime')
+    FROM sesiones_realizadas
+    WHERE id > ? AND comision_sumada = 1
+"""
+
+# Mismo efecto que trg_comisiones_saldos_insert, agrupado
+ACTUALIZAR_SALDOS = """
+    INSERT INTO comisiones_saldos (asistente_id, periodo, total, movimientos)
+    SELECT asistente_id, periodo, SUM(monto), COUNT(*)
+    FROM (
+        SELECT asistente_id, periodo, monto FROM comisiones_movimientos WHERE id > ?
+        UNION ALL
+        SELECT asistente_id, '', monto FROM comisiones_movimientos WHERE id > ?
+    )
+    GROUP BY asistente_id, periodo
+    ON CONFLICT (asistente_id, periodo)
+    DO UPDATE SET total = total + excluded.total, movimientos = movimientos + excluded.movimientos
+"""
+
+
+def ultimo_id(conn, tabla):
+    return conn.execute(f"SELECT IFNULL(MAX(id), 0) FROM {tabla}").fetchone()[0]
+
+
+def preparar_catalogo(conn):
+    # Asistentes y tratamientos existentes; si la base está vacía se crea
+    # el catálogo de ejemplo. Devuelve (asistentes, individuales, promociones)
+    # con individuales [(id, nombre, precio)] y promociones
+    # [(id, nombre, precio, [(componente, sesiones, precio)])].
+    asistentes = [fila[0] for fila in conn.execute("SELECT id FROM asistentes")]
+    if not asistentes:
+        conn.executemany("INSERT INTO asistentes (nombre) VALUES (?)",
+                         [(f"Asistente {n}",) for n in range(1, ASISTENTES + 1)])
+        asistentes = [fila[0] for fila in conn.execute("SELECT id FROM asistentes")]
+
+    if conn.execute("SELECT COUNT(*) FROM tratamientos").fetchone()[0] == 0:
+        precios = dict(CATALOGO)
+        conn.executemany("INSERT INTO tratamientos (nombre, precio, es_promocion) VALUES (?, ?, 0)", CATALOGO)
+        for nombre, componentes in PROMOCIONES:
+            detalles = [(componente, sesiones, round(precios[componente] * DESCUENTO_PROMOCION, 2))
+                        for componente, sesiones in componentes]
+            precio = round(sum(sesiones * precio for _, sesiones, precio in detalles), 2)
+            promocion_id = conn.execute(
+                "INSERT INTO tratamientos (nombre, precio, es_promocion) VALUES (?, ?, 1)", (nombre, precio)).lastrowid
+            conn.executemany("""
+                INSERT INTO promocion_detalles (promocion_id, nombre_componente, cantidad_sesiones, precio_componente)
+                VALUES (?, ?, ?, ?)
+            """, [(promocion_id, *detalle) for detalle in detalles])
+
+    componentes = {}
+    for promocion_id, nombre, sesiones, precio in conn.execute(
+            "SELECT promocion_id, nombre_componente, cantidad_sesiones, precio_componente "
+            "FROM promocion_detalles ORDER BY id"):
+        componentes.setdefault(promocion_id, []).append((nombre, sesiones, precio or 0))
+
+    individuales, promociones = [], []
+    for tratamiento_id, nombre, precio, es_promocion in conn.execute(
+            "SELECT id, nombre, precio, es_promocion FROM tratamientos ORDER BY id"):
+        if not es_promocion:
+            individuales.append((tratamiento_id, nombre, precio or 0))
+        elif componentes.get(tratamiento_id):
+            promociones.append((tratamiento_id, nombre, precio or 0, componentes[tratamiento_id]))
+    if not individuales:
+        raise ValueError("La base no tiene tratamientos individuales para generar datos")
+    return asistentes, individuales, promociones
+
+
+class Generador:
+    # Genera tratamientos asignados uno por uno, con sus sesiones, pagos y
+    # reportes, hasta llegar a las sesiones pedidas. Nada crece con el
+    # volumen salvo los lotes pendientes de escribir.
+    def __init__(self, conn, sesiones, semilla=None, hasta=None):
+        self.conn = conn
+        self.objetivo = sesiones
+        self.azar = random.Random(semilla)
+        self.hasta = hasta or date.today()
+        self.desde = self.hasta - timedelta(days=DIAS_HISTORIA)
+        self.asistentes, self.individuales, self.promociones = preparar_catalogo(conn)
+
+        self.ultimo_paciente = self.primer_paciente = ultimo_id(conn, "pacientes")
+        self.ultimo_tratamiento = self.primer_tratamiento = ultimo_id(conn, "tratamientos_asignados")
+        self.ultima_sesion = self.primera_sesion = ultimo_id(conn, "sesiones_realizadas")
+        self.primer_movimiento = ultimo_id(conn, "comisiones_movimientos")
+
+        self.sesiones = 0
+        self.lotes = {consulta: [] for consulta in (
+            INSERTAR_PACIENTE, INSERTAR_TRATAMIENTO, INSERTAR_COMPONENTE, INSERTAR_SESION,
+            INSERTAR_PAGO, INSERTAR_REPORTE)}
+        self.pendientes = 0
+
+    def agregar(self, consulta, fila):
+        self.lotes[consulta].append(fila)
+        self.pendientes += 1
+
+    def escribir_lotes(self):
+        # En el orden del diccionario: cada tabla antes que las que la referencian
+        for consulta, filas in self.lotes.items():
+            if filas:
+                self.conn.executemany(consulta, filas)
+                filas.clear()
+        self.pendientes = 0
+
+    def paciente(self):
+        # Un paciente nuevo cada TRATAMIENTOS_POR_PACIENTE tratamientos en
+        # promedio; si no, uno ya generado
+        if self.ultimo_paciente == self.primer_paciente or self.azar.random() < 1 / TRATAMIENTOS_POR_PACIENTE:
+            self.ultimo_paciente += 1
+            nombre = f"{self.azar.choice(NOMBRES)} {self.azar.choice(APELLIDOS)} {self.azar.choice(APELLIDOS)}"
+            self.agregar(INSERTAR_PACIENTE, (self.ultimo_paciente, nombre))
+            return self.ultimo_paciente
+        return self.azar.randint(self.primer_paciente + 1, self.ultimo_paciente)
+
+    def sesiones_de(self, tratamiento_id, componente, asignadas, monto, inicio, asistente_id):
+        # Sesiones semanales desde el inicio; se cortan en `hasta`. Devuelve
+        # (completas, pagado, comision, fecha de la última).
+        azar = self.azar
+        cantidad = min(azar.randint(0, asignadas), self.objetivo - self.sesiones)
+        completas, pagado, comision, ultima = 0, 0.0, 0.0, None
+        fecha = inicio
+        for numero in range(1, cantidad + 1):
+            fecha = fecha + timedelta(days=azar.randint(5, 10))
+            if fecha > self.hasta:
+                break
+            realizada = 1 if azar.random() < PROPORCION_REALIZADAS else 0
+            estado_pago = 'PAGADO' if azar.random() < PROPORCION_PAGADAS else 'Pendiente'
+            porcentaje = azar.choice(PORCENTAJES)
+            completa = realizada and estado_pago == 'PAGADO'
+            asistente = asistente_id if azar.random() < 0.8 else azar.choice(self.asistentes)
+
+            self.ultima_sesion += 1
+            self.sesiones += 1
+            texto = fecha.isoformat()
+            self.agregar(INSERTAR_SESION, (
+                self.ultima_sesion, tratamiento_id, componente, asistente, texto, numero, monto, estado_pago,
+                'Realizada' if realizada else 'Pendiente', porcentaje,
+                (fecha + timedelta(days=7)).isoformat(), 1 if completa else 0, realizada
+            ))
+            if completa:
+                monto_comision = round(monto * porcentaje / 100, 2)
+                detalle = f"Comisión por sesión {numero}" + (f" - {componente}" if componente else "")
+                self.agregar(INSERTAR_PAGO, (asistente, tratamiento_id, self.ultima_sesion, monto_comision,
+                                             texto, detalle))
+                completas += 1
+                pagado += monto
+                comision += monto_comision
+            ultima = fecha
+        return completas, pagado, comision, ultima
+
+    def tratamiento(self):
+        azar = self.azar
+        self.ultimo_tratamiento += 1
+        tratamiento_id = self.ultimo_tratamiento
+        paciente_id = self.paciente()
+        asistente_id = azar.choice(self.asistentes)
+        inicio = None
+        if azar.random() >= PROPORCION_SIN_INICIAR:
+            inicio = self.desde + timedelta(days=azar.randint(0, DIAS_HISTORIA))
+
+        if self.promociones and azar.random() < PROPORCION_PROMOCIONES:
+            catalogo_id, nombre, costo, componentes = azar.choice(self.promociones)
+            asignadas = sum(sesiones for _, sesiones, _ in componentes)
+            restantes, pendientes, pagado, comision, ultima = 0, 0, 0.0, 0.0, None
+            for componente, sesiones, precio in componentes:
+                completas, pagado_componente, comision_componente, ultima_componente = (0, 0.0, 0.0, None)
+                if inicio is not None:
+                    completas, pagado_componente, comision_componente, ultima_componente = self.sesiones_de(
+                        tratamiento_id, componente, sesiones, precio, inicio, asistente_id)
+                self.agregar(INSERTAR_COMPONENTE, (tratamiento_id, componente, max(sesiones - completas, 0)))
+                restantes += max(sesiones - completas, 0)
+                pendientes += sesiones > completas
+                pagado += pagado_componente
+                comision += comision_componente
+                if ultima_componente and (ultima is None or ultima_componente > ultima):
+                    ultima = ultima_componente
+        else:
+            catalogo_id, nombre, precio = azar.choice(self.individuales)
+            asignadas = azar.randint(4, 10)
+            costo = round(precio * asignadas, 2)
+            completas, pagado, comision, ultima = 0, 0.0, 0.0, None
+            if inicio is not None:
+                completas, pagado, comision, ultima = self.sesiones_de(
+                    tratamiento_id, None, asignadas, costo / asignadas, inicio, asistente_id)
+            restantes = asignadas - completas
+            pendientes = 0
+
+        estado = 'INACTIVO' if restantes == 0 else 'ACTIVO'
+        self.agregar(INSERTAR_TRATAMIENTO, (
+            tratamiento_id, paciente_id, catalogo_id, asistente_id,
+            inicio.isoformat() if inicio else None, 'INICIADO' if inicio else 'SIN_INICIAR',
+            asignadas, restantes, costo, round(pagado, 2), round(costo - pagado, 2), round(comision, 2), estado,
+            pendientes
+        ))
+        if estado == 'INACTIVO':
+            self.agregar(INSERTAR_REPORTE, (ultima.isoformat(), "Tratamiento completado", costo, 0,
+                                            f"Tratamiento completado - {nombre} - paciente {paciente_id}"))
+
+    def generar(self, al_avanzar=None):
+        while self.sesiones < self.objetivo:
+            self.tratamiento()
+            if self.pendientes >= TAMANO_LOTE:
+                self.escribir_lotes()
+                if al_avanzar:
+                    al_avanzar(self.sesiones)
+        self.escribir_lotes()
+
+        # Un egreso por mes para que los reportes no sean solo ingresos
+        mes = self.desde.replace(day=1)
+        egresos = []
+        while mes <= self.hasta:
+            egresos.append((mes.isoformat(), "Compra de insumos", 0, round(self.azar.uniform(200, 800), 2),
+                            "Insumos del mes"))
+            mes = (mes + timedelta(days=32)).replace(day=1)
+        self.conn.executemany(INSERTAR_REPORTE, egresos)
+
+    def finalizar(self):
+        # Efectos de los triggers suspendidos, una sentencia por tabla
+        self.conn.execute(ACTUALIZAR_SECUENCIAS, (self.primera_sesion,))
+        self.conn.execute(INDEXAR_BUSQUEDA, (self.primer_tratamiento,))
+        recalcular_progreso_componentes(self.conn, self.primer_tratamiento)
+        self.conn.execute(INSERTAR_MOVIMIENTOS, (self.primera_sesion,))
+        self.conn.execute(ACTUALIZAR_SALDOS, (self.primer_movimiento, self.primer_movimiento))
+        reconstruir_resumenes(self.conn)
+
+
+def revisar_tablas(conn):
+    existentes = {fila[0] for fila in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    faltan = [tabla for tabla in TABLAS_BASE if tabla not in existentes]
+    if faltan:
+        raise ValueError(f"La base no tiene las tablas {', '.join(faltan)}; "
+                         "ábrala una vez con la aplicación antes de generar datos")
+
+
+def generar(ruta_bd, sesiones, semilla=None, al_avanzar=None):
+    # Todo en una transacción, como la importación: si algo falla la base
+    # queda como estaba
+    conn = abrir_conexion(ruta_bd)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            recrear = suspender_indices(conn, TABLAS_GENERADAS, TRIGGERS_GENERACION)
+            generador = Generador(conn, sesiones, semilla)
+            generador.generar(al_avanzar)
+            generador.finalizar()
+            for sql in recrear:
+                conn.execute(sql)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return generador
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generar datos sintéticos para medir Control de Sesiones")
+    parser.add_argument("--bd", required=True,
+                        help="Base a llenar (una copia, nunca la de trabajo); debe tener las tablas de la aplicación")
+    parser.add_argument("--sesiones", type=int, default=10_000, help="Sesiones a generar (10 mil a 10 millones)")
+    parser.add_argument("--semilla", type=int, default=1, help="Semilla para repetir exactamente los mismos datos")
+    args = parser.parse_args()
+
+    if args.bd == RUTA_BD:
+        parser.error("use una copia de la base, no la de trabajo")
+    conn = abrir_conexion(args.bd)
+    try:
+        revisar_tablas(conn)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        conn.close()
+    aplicar_migraciones(args.bd)
+
+    inicio = time.perf_counter()
+    resultado = generar(args.bd, args.sesiones, args.semilla,
+                        lambda n: print(f"\r{n} sesiones", end="", flush=True))
+    print(f"\r{resultado.sesiones} sesiones, "
+          f"{resultado.ultimo_tratamiento - resultado.primer_tratamiento} tratamientos y "
+          f"{resultado.ultimo_paciente - resultado.primer_paciente} pacientes generados "
+          f"en {time.perf_counter() - inicio:.1f} s")
@@ -0,0 +1,466 @@
+import argparse
+import csv
+from datetime import date, datetime
+from functools import lru_cache
+
+from conexion import RUTA_BD, abrir_conexion
+from migraciones import (TRIGGERS_PROGRESO, TRIGGERS_RESUMEN, aplicar_migraciones,
+                         recalcular_progreso_componentes, reconstruir_resumenes)
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Filas que se acumulan antes de cada executemany
+TAMANO_LOTE = 5000
+# Errores que se informan; la importación igual revisa el archivo completo
+MAX_ERRORES = 50
+
+TABLAS_IMPORTADAS = ("tratamientos_asignados", "sesiones_realizadas", "promocion_componentes")
+# Triggers por fila cuyo efecto se aplica al final en una sola sentencia
+TRIGGERS_DIFERIDOS = ("trg_busqueda_ta_insert", "trg_secuencia_sesion_insert", *TRIGGERS_PROGRESO,
+                      *TRIGGERS_RESUMEN)
+
+FORMATOS_FECHA = ('%d/%m/%Y', '%d-%m-%Y')
+# Texto que identifica en el archivo un tratamiento asignado que nunca se
+# inició; se guarda como fecha_asignacion NULL con estado_inicio 'SIN_INICIAR'
+SIN_INICIAR = 'Sin iniciar'
+VALORES_SI = ("si", "sí", "s", "x", "1", "true", "verdadero", "realizada")
+
+INSERTAR_TRATAMIENTO = """
+    INSERT INTO tratamientos_asignados (
+        id,
+        paciente_id,
+        tratamiento_id,
+        fecha_asignacion,
+        estado_inicio,
+        sesiones_asignadas,
+        sesiones_restantes,
+        costo_total,
+        total_pagado,
+        saldo_pendiente
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
+"""
+
+# Sin número de sesión: se numeran al final por fecha dentro de cada
+# tratamiento o componente. Las comisiones históricas se consideran ya
+# liquidadas (comision_sumada = 0, sin movimientos en el libro).
+INSERTAR_SESION = """
+    INSERT INTO sesiones_realizadas (
+        tratamiento_asignado_id,
+        nombre_componente,
+        asistente_id,
+        fecha_sesion,
+        monto_abonado,
+        estado_pago,
+        estado_sesion,
+        porcentaje_asistente,
+        proxima_cita,
+        comision_sumada,
+        realizada
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, date(?, '+7 days'), 0, ?)
+"""
+
+NUMERAR_SESIONES = """
+    UPDATE sesiones_realizadas
+    SET numero_sesion = n.numero
+    FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY tratamiento_asignado_id, IFNULL(nombre_componente, '')
+            ORDER BY fecha_sesion, id
+        ) AS numero
+        FROM sesiones_realizadas
+        WHERE id > ?
+    ) AS n
+    WHERE sesiones_realizadas.id = n.id
+"""
+
+ACTUALIZAR_SECUENCIAS = """
+    INSERT INTO secuencias_sesion (tratamiento_asignado_id, nombre_componente, ultimo_numero)
+    SELECT tratamiento_asignado_id, IFNULL(nombre_componente, ''), MAX(numero_sesion)
+    FROM sesiones_realizadas
+    WHERE id > ?
+    GROUP BY tratamiento_asignado_id, IFNULL(nombre_componente, '')
+    ON CONFLICT (tratamiento_asignado_id, nombre_componente)
+    DO UPDATE SET ultimo_numero = MAX(ultimo_numero, excluded.ultimo_numero)
+"""
+
+# Mismo efecto que registrar_pago_sesion por cada sesión realizada y pagada
+# de un tratamiento individual
+ACTUALIZAR_PAGOS = """
+    UPDATE tratamientos_asignados
+    SET sesiones_restantes = MAX(sesiones_restantes - s.completas, 0),
+        total_pagado = total_pagado + s.pagado,
+        saldo_pendiente = saldo_pendiente - s.pagado
+    FROM (
+        SELECT
+            tratamiento_asignado_id,
+            COUNT(*) AS completas,
+            SUM(monto_abonado) AS pagado
+        FROM sesiones_realizadas
+        WHERE id > ?
+        AND nombre_componente IS NULL
+        AND realizada = 1 AND estado_pago = 'PAGADO'
+        GROUP BY tratamiento_asignado_id
+    ) AS s
+    WHERE tratamientos_asignados.id = s.tratamiento_asignado_id
+"""
+
+INSERTAR_COMPONENTES = """
+    INSERT INTO promocion_componentes (tratamiento_asignado_id, tratamiento_id, sesiones_restantes)
+    SELECT
+        ta.id,
+        pd.nombre_componente,
+        MAX(pd.cantidad_sesiones - IFNULL(s.completas, 0), 0)
+    FROM tratamientos_asignados ta
+    JOIN tratamientos t ON ta.tratamiento_id = t.id
+    JOIN promocion_detalles pd ON pd.promocion_id = ta.tratamiento_id
+    LEFT JOIN (
+        SELECT
+            tratamiento_asignado_id,
+            nombre_componente,
+            SUM(realizada = 1 AND estado_pago = 'PAGADO') AS completas
+        FROM sesiones_realizadas
+        WHERE id > ?
+        GROUP BY tratamiento_asignado_id, nombre_componente
+    ) AS s ON s.tratamiento_asignado_id = ta.id AND s.nombre_componente = pd.nombre_componente
+    WHERE ta.id > ? AND t.es_promocion
+"""
+
+INDEXAR_BUSQUEDA = """
+    INSERT INTO busqueda_tratamientos (rowid, paciente, tratamiento)
+    SELECT ta.id, p.nombre, t.nombre
+    FROM tratamientos_asignados ta
+    JOIN pacientes p ON ta.paciente_id = p.id
+    JOIN tratamientos t ON ta.tratamiento_id = t.id
+    WHERE ta.id > ?
+"""
+
+
+def normalizar(texto):
+    return " ".join(str(texto).split()).casefold()
+
+
+def leer_filas(ruta):
+    # Genera (número de línea, {columna: valor}) sin cargar el archivo completo
+    if ruta.lower().endswith((".xlsx", ".xlsm")):
+        yield from leer_filas_xlsx(ruta)
+    else:
+        yield from leer_filas_csv(ruta)
+
+
+def leer_filas_csv(ruta):
+    with open(ruta, newline="", encoding="utf-8-sig") as archivo:
+        # Las planillas exportadas en español suelen usar ';'
+        try:
+            dialecto = csv.Sniffer().sniff(archivo.read(4096), delimiters=",;\t")
+        except csv.Error:
+            dialecto = csv.excel
+        archivo.seek(0)
+        lector = csv.reader(archivo, dialecto)
+        encabezados = [normalizar(c) for c in next(lector, [])]
+        for linea, valores in enumerate(lector, 2):
+            if any(v.strip() for v in valores):
+                yield linea, dict(zip(encabezados, valores))
+
+
+def leer_filas_xlsx(ruta):
+    if openpyxl is None:
+        raise RuntimeError("Para importar archivos .xlsx hace falta instalar openpyxl")
+    libro = openpyxl.load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezados = [normalizar(c or "") for c in next(filas, ())]
+        for linea, valores in enumerate(filas, 2):
+            if any(v not in (None, "") for v in valores):
+                yield linea, dict(zip(encabezados, valores))
+    finally:
+        libro.close()
+
+
+def leer_fecha(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.strftime('%Y-%m-%d')
+    return leer_fecha_texto(str(valor or "").strip())
+
+
+def leer_fecha_asignacion(valor):
+    # Vacía o 'Sin iniciar': el tratamiento se asignó pero no empezó (None)
+    if isinstance(valor, (datetime, date)):
+        return leer_fecha(valor)
+    if normalizar(valor or "") in ("", normalizar(SIN_INICIAR)):
+        return None
+    return leer_fecha(valor)
+
+
+# Las fechas se repiten mucho en un archivo histórico y strptime es lo más
+# lento de cada fila
+@lru_cache(maxsize=4096)
+def leer_fecha_texto(texto):
+    try:
+        return date.fromisoformat(texto).strftime('%Y-%m-%d')
+    except ValueError:
+        pass
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    raise ValueError(f"fecha inválida: '{texto}'")
+
+
+def leer_numero(valor, nombre, defecto=None):
+    if valor is None or str(valor).strip() == "":
+        if defecto is None:
+            raise ValueError(f"falta {nombre}")
+        return defecto
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    try:
+        return float(str(valor).strip().replace("$", "").replace(",", "."))
+    except ValueError:
+        raise ValueError(f"{nombre} inválido: '{valor}'")
+
+
+def mapa_por_nombre(filas):
+    # nombre normalizado -> fila; los nombres repetidos quedan como None
+    mapa = {}
+    for fila in filas:
+        clave = normalizar(fila[1])
+        mapa[clave] = None if clave in mapa else fila
+    return mapa
+
+
+def buscar(mapa, valor, que):
+    clave = normalizar(valor or "")
+    if not clave:
+        raise ValueError(f"falta {que}")
+    if clave not in mapa:
+        raise ValueError(f"{que} desconocido: '{valor}'")
+    if mapa[clave] is None:
+        raise ValueError(f"hay más de un {que} llamado '{valor}'")
+    return mapa[clave]
+
+
+class Importacion:
+    # Una pasada por el archivo: cada fila es una sesión (o solo el
+    # tratamiento si no tiene fecha_sesion). Columnas:
+    #   paciente, tratamiento, fecha_asignacion, sesiones_asignadas,
+    #   costo_total, componente, asistente, fecha_sesion, monto,
+    #   estado_pago, realizada, porcentaje
+    # Las filas con el mismo paciente, tratamiento y fecha_asignacion son
+    # el mismo tratamiento asignado; las de un tratamiento sin iniciar se
+    # agrupan por paciente y tratamiento.
+    def __init__(self, conn, crear_pacientes=False):
+        self.conn = conn
+        self.crear_pacientes = crear_pacientes
+        self.errores = []
+        self.total_errores = 0
+        self.pacientes_creados = 0
+        self.tratamientos_importados = 0
+        self.sesiones_importadas = 0
+
+        # Catálogos en memoria: una consulta por tabla, no una por fila
+        self.pacientes = mapa_por_nombre(conn.execute("SELECT id, nombre FROM pacientes"))
+        self.asistentes = mapa_por_nombre(conn.execute("SELECT id, nombre FROM asistentes"))
+        self.tratamientos = mapa_por_nombre(conn.execute(
+            "SELECT id, nombre, precio, es_promocion FROM tratamientos"))
+        self.componentes = {}
+        self.sesiones_promocion = {}
+        for promocion_id, nombre, cantidad, precio in conn.execute(
+                "SELECT promocion_id, nombre_componente, cantidad_sesiones, precio_componente FROM promocion_detalles"):
+            self.componentes[(promocion_id, normalizar(nombre))] = (nombre, precio)
+            self.sesiones_promocion[promocion_id] = self.sesiones_promocion.get(promocion_id, 0) + cantidad
+
+        # (paciente_id, tratamiento_id, fecha_asignacion o None) -> (id, costo por sesión).
+        # Crece con los tratamientos, no con las sesiones.
+        self.asignados = {}
+        self.siguiente_id = conn.execute(
+            "SELECT IFNULL(MAX(id), 0) + 1 FROM tratamientos_asignados").fetchone()[0]
+        self.ultimo_id_tratamiento = self.siguiente_id - 1
+        self.ultimo_id_sesion = conn.execute(
+            "SELECT IFNULL(MAX(id), 0) FROM sesiones_realizadas").fetchone()[0]
+
+        self.lote_tratamientos = []
+        self.lote_sesiones = []
+
+    def error(self, linea, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append(f"Línea {linea}: {mensaje}")
+
+    def paciente_id(self, nombre):
+        try:
+            return buscar(self.pacientes, nombre, "paciente")[0]
+        except ValueError:
+            clave = normalizar(nombre or "")
+            if not self.crear_pacientes or not clave or clave in self.pacientes:
+                raise
+        paciente_id = self.conn.execute(
+            "INSERT INTO pacientes (nombre) VALUES (?)", (" ".join(str(nombre).split()),)).lastrowid
+        self.pacientes[clave] = (paciente_id, nombre)
+        self.pacientes_creados += 1
+        return paciente_id
+
+    def tratamiento_asignado(self, fila):
+        tratamiento_id, _, precio, es_promocion = buscar(self.tratamientos, fila.get("tratamiento"), "tratamiento")
+        paciente_id = self.paciente_id(fila.get("paciente"))
+        fecha_asignacion = leer_fecha_asignacion(fila.get("fecha_asignacion"))
+
+        clave = (paciente_id, tratamiento_id, fecha_asignacion)
+        if clave in self.asignados:
+            return self.asignados[clave], tratamiento_id, es_promocion
+
+        if es_promocion:
+            sesiones = self.sesiones_promocion.get(tratamiento_id, 0)
+        else:
+            sesiones = int(leer_numero(fila.get("sesiones_asignadas"), "sesiones_asignadas"))
+            if sesiones <= 0:
+                raise ValueError("sesiones_asignadas debe ser mayor que 0")
+        costo_total = leer_numero(fila.get("costo_total"), "costo_total", precio or 0)
+
+        asignado = (self.siguiente_id, costo_total / sesiones if sesiones else 0)
+        self.lote_tratamientos.append((
+            self.siguiente_id, paciente_id, tratamiento_id, fecha_asignacion,
+            'INICIADO' if fecha_asignacion else 'SIN_INICIAR', sesiones, sesiones, costo_total, costo_total
+        ))
+        self.asignados[clave] = asignado
+        self.siguiente_id += 1
+        self.tratamientos_importados += 1
+        return asignado, tratamiento_id, es_promocion
+
+    def agregar_fila(self, linea, fila):
+        try:
+            (asignado_id, costo_por_sesion), tratamiento_id, es_promocion = self.tratamiento_asignado(fila)
+            if fila.get("fecha_sesion") in (None, ""):
+                self.revisar_lote()
+                return
+
+            fecha_sesion = leer_fecha(fila.get("fecha_sesion"))
+            componente = None
+            monto = costo_por_sesion
+            if es_promocion:
+                nombre = fila.get("componente")
+                if (tratamiento_id, normalizar(nombre or "")) not in self.componentes:
+                    raise ValueError(f"la promoción no incluye '{nombre or ''}'")
+                componente, monto = self.componentes[(tratamiento_id, normalizar(nombre))]
+            monto = leer_numero(fila.get("monto"), "monto", monto or 0)
+
+            asistente_id = None
+            if fila.get("asistente") not in (None, ""):
+                asistente_id = buscar(self.asistentes, fila.get("asistente"), "asistente")[0]
+
+            estado_pago = 'PAGADO' if normalizar(fila.get("estado_pago") or "") == "pagado" else 'Pendiente'
+            realizada = 1 if normalizar(fila.get("realizada") or "") in VALORES_SI else 0
+            porcentaje = leer_numero(fila.get("porcentaje"), "porcentaje", 0)
+            if not 0 <= porcentaje <= 100:
+                raise ValueError("el porcentaje debe estar entre 0 y 100")
+        except ValueError as e:
+            self.error(linea, e)
+            return
+
+        self.lote_sesiones.append((
+            asignado_id, componente, asistente_id, fecha_sesion, monto, estado_pago,
+            'Realizada' if realizada else 'Pendiente', porcentaje, fecha_sesion, realizada
+        ))
+        self.sesiones_importadas += 1
+        self.revisar_lote()
+
+    def revisar_lote(self):
+        if len(self.lote_tratamientos) + len(self.lote_sesiones) >= TAMANO_LOTE:
+            self.escribir_lote()
+
+    def escribir_lote(self):
+        # Los tratamientos primero: las sesiones del lote apuntan a ellos
+        if self.total_errores:
+            # Con errores la importación se descarta; solo se sigue validando
+            self.lote_tratamientos.clear()
+            self.lote_sesiones.clear()
+            return
+        self.conn.executemany(INSERTAR_TRATAMIENTO, self.lote_tratamientos)
+        self.conn.executemany(INSERTAR_SESION, self.lote_sesiones)
+        self.lote_tratamientos.clear()
+        self.lote_sesiones.clear()
+
+    def finalizar(self):
+        # Efectos de los triggers diferidos y valores derivados, una sentencia
+        # por tabla sobre las filas importadas
+        self.escribir_lote()
+        self.conn.execute(NUMERAR_SESIONES, (self.ultimo_id_sesion,))
+        self.conn.execute(ACTUALIZAR_SECUENCIAS, (self.ultimo_id_sesion,))
+        self.conn.execute(ACTUALIZAR_PAGOS, (self.ultimo_id_sesion,))
+        self.conn.execute(INSERTAR_COMPONENTES, (self.ultimo_id_sesion, self.ultimo_id_tratamiento))
+        recalcular_progreso_componentes(self.conn, self.ultimo_id_tratamiento)
+        self.conn.execute(INDEXAR_BUSQUEDA, (self.ultimo_id_tratamiento,))
+        reconstruir_resumenes(self.conn)
+
+
+def suspender_indices(conn, tablas=TABLAS_IMPORTADAS, diferidos=TRIGGERS_DIFERIDOS):
+    # Quita los índices secundarios de las tablas y los triggers diferidos;
+    # devuelve su SQL para volver a crearlos. Construir un índice una vez al
+    # final es mucho más rápido que mantenerlo fila por fila.
+    marcas = ",".join("?" * len(tablas))
+    indices = conn.execute(f"""
+        SELECT name, sql
+        FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({marcas})
+    """, tuple(tablas)).fetchall()
+    triggers = conn.execute(f"""
+        SELECT name, sql
+        FROM sqlite_master
+        WHERE type = 'trigger' AND name IN ({",".join("?" * len(diferidos))})
+    """, tuple(diferidos)).fetchall()
+    for nombre, _ in indices:
+        conn.execute(f'DROP INDEX "{nombre}"')
+    for nombre, _ in triggers:
+        conn.execute(f'DROP TRIGGER "{nombre}"')
+    return [sql for _, sql in triggers + indices]
+
+
+def importar(ruta, ruta_bd=RUTA_BD, crear_pacientes=False):
+    # Todo el archivo en una sola transacción: si hay errores no se importa
+    # nada, y las demás estaciones nunca ven las tablas sin sus índices
+    conn = abrir_conexion(ruta_bd)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            recrear = suspender_indices(conn)
+            importacion = Importacion(conn, crear_pacientes)
+            for linea, fila in leer_filas(ruta):
+                importacion.agregar_fila(linea, fila)
+            if importacion.total_errores:
+                conn.execute("ROLLBACK")
+                return importacion
+            importacion.finalizar()
+            for sql in recrear:
+                conn.execute(sql)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return importacion
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importar tratamientos y sesiones históricas")
+    parser.add_argument("archivo", help="Archivo .csv o .xlsx, una fila por sesión")
+    parser.add_argument("--bd", default=RUTA_BD, help="Ruta de la base de datos")
+    parser.add_argument("--crear-pacientes", action="store_true",
+                        help="Crear los pacientes que no existan en lugar de rechazar la fila")
+    args = parser.parse_args()
+
+    aplicar_migraciones(args.bd)
+    resultado = importar(args.archivo, args.bd, args.crear_pacientes)
+    if resultado.total_errores:
+        for mensaje in resultado.errores:
+            print(mensaje)
+        if resultado.total_errores > len(resultado.errores):
+            print(f"... y {resultado.total_errores - len(resultado.errores)} errores más")
+        print("No se importó nada; corrija el archivo y vuelva a intentarlo")
+        raise SystemExit(1)
+    print(f"{resultado.tratamientos_importados} tratamientos y {resultado.sesiones_importadas} sesiones importados")
+    if resultado.pacientes_creados:
+        print(f"{resultado.pacientes_creados} pacientes nuevos")
@@ -0,0 +1,237 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+# Mediciones por acción del usuario en Control de Sesiones: tiempo total
+# (del clic hasta que termina el último callback que la acción disparó),
+# tiempo en la base, filas devueltas y tiempo del hilo de Tk armando
+# widgets. Las acciones que superan el umbral se escriben en un log
+# rotativo con el SQL y los parámetros de cada consulta.
+#
+# Se activa con SPA_LOG_LENTAS=<archivo.log> (umbral opcional en
+# SPA_UMBRAL_LENTO_MS). Desactivada, cada punto de medición es una sola
+# comparación con `activa`.
+
+UMBRAL_LENTO_MS = 250
+# Una consulta suelta (fuera de una acción) también se registra si supera esto
+UMBRAL_CONSULTA_MS = 100
+# Consultas que se guardan por acción para el log; las demás solo suman
+MAX_CONSULTAS_ACCION = 50
+TAMANO_LOG = 1_000_000  # bytes por archivo
+ARCHIVOS_LOG = 5
+
+activa = False
+umbral_ms = UMBRAL_LENTO_MS
+log = logging.getLogger("spa.lentas")
+log.propagate = False
+
+_local = threading.local()
+# Lo que devuelven accion() y sin_medir() desactivadas; se puede reutilizar
+_SIN_MEDICION = nullcontext()
+_estadisticas = {}
+_candado = threading.Lock()
+
+
+class Accion:
+    # Una acción queda abierta mientras tenga partes pendientes: el bloque
+    # que la inicia y cada tarea que envió al ejecutor, hasta que su
+    # callback termina en el hilo de Tk
+    def __init__(self, nombre, detalle):
+        self.nombre = nombre
+        self.detalle = detalle
+        self.inicio = time.perf_counter()
+        self.bd_ms = 0.0
+        self.tk_ms = 0.0
+        self.pausa_ms = 0.0
+        self.filas = 0
+        self.llamadas = 0
+        self.consultas = []
+        self.pendientes = 1
+        self._candado = threading.Lock()
+
+    def agregar_parte(self):
+        with self._candado:
+            self.pendientes += 1
+
+    def terminar_parte(self):
+        with self._candado:
+            self.pendientes -= 1
+            if self.pendientes:
+                return
+        terminar(self)
+
+
+def sql_compacto(sql):
+    return " ".join(sql.split())
+
+
+def registrar_consulta(nombre, sql, params, segundos, filas):
+    # Observador de RegistroConsultas: suma la consulta a la acción en curso
+    # del hilo, o la registra sola si es lenta
+    ms = segundos * 1000
+    _local.bd_ms = getattr(_local, "bd_ms", 0.0) + ms
+    accion = getattr(_local, "accion", None)
+    if accion is None:
+        if ms >= UMBRAL_CONSULTA_MS:
+            escribir({"consulta": nombre, "total_ms": round(ms, 2), "filas": filas,
+                      "sql": sql_compacto(sql), "params": params})
+        return
+    with accion._candado:
+        accion.bd_ms += ms
+        accion.filas += filas or 0
+        accion.llamadas += 1
+        if len(accion.consultas) < MAX_CONSULTAS_ACCION:
+            accion.consultas.append({"nombre": nombre, "ms": round(ms, 2), "filas": filas,
+                                     "sql": sql_compacto(sql), "params": params})
+
+
+def accion_actual():
+    return getattr(_local, "accion", None) if activa else None
+
+
+@contextmanager
+def parte(accion, tk=True):
+    # Corre un tramo de la acción en este hilo: las consultas se le suman y,
+    # en el hilo de Tk, el tiempo que no fue de la base ni de un diálogo
+    # cuenta como tiempo de widgets
+    anterior = getattr(_local, "accion", None)
+    _local.accion = accion
+    inicio = time.perf_counter()
+    bd_antes, pausa_antes = getattr(_local, "bd_ms", 0.0), getattr(_local, "pausa_ms", 0.0)
+    try:
+        yield accion
+    finally:
+        _local.accion = anterior
+        if tk:
+            tk_ms = ((time.perf_counter() - inicio) * 1000
+                     - (getattr(_local, "bd_ms", 0.0) - bd_antes)
+                     - (getattr(_local, "pausa_ms", 0.0) - pausa_antes))
+            with accion._candado:
+                accion.tk_ms += max(tk_ms, 0.0)
+
+
+@contextmanager
+def _pausar(accion):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - inicio) * 1000
+        _local.pausa_ms = getattr(_local, "pausa_ms", 0.0) + ms
+        with accion._candado:
+            accion.pausa_ms += ms
+
+
+def sin_medir():
+    # Diálogos modales dentro de una acción: lo que el usuario tarda en
+    # cerrarlos no cuenta como demora
+    accion = accion_actual()
+    return _SIN_MEDICION if accion is None else _pausar(accion)
+
+
+@contextmanager
+def _medir_accion(nombre, detalle):
+    # Dentro de otra acción (por ejemplo, la recarga que hace un guardado al
+    # terminar) el bloque es parte de esa acción y no una nueva
+    if getattr(_local, "accion", None) is not None:
+        yield _local.accion
+        return
+    accion = Accion(nombre, detalle)
+    try:
+        with parte(accion):
+            yield accion
+    finally:
+        accion.terminar_parte()
+
+
+def accion(nombre, **detalle):
+    # with instrumentacion.accion("nombre", tratamiento_id=...): ...
+    if not activa:
+        return _SIN_MEDICION
+    return _medir_accion(nombre, detalle)
+
+
+def medir(nombre):
+    # Decorador para métodos que son una acción completa
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not activa:
+                return funcion(*args, **kwargs)
+            with _medir_accion(nombre, {}):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def terminar(accion):
+    total_ms = (time.perf_counter() - accion.inicio) * 1000 - accion.pausa_ms
+    with _candado:
+        est = _estadisticas.get(accion.nombre)
+        if est is None:
+            est = _estadisticas[accion.nombre] = {
+                "llamadas": 0, "lentas": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "bd_ms": 0.0, "tk_ms": 0.0, "filas": 0,
+            }
+        est["llamadas"] += 1
+        est["total_ms"] += total_ms
+        est["max_ms"] = max(est["max_ms"], total_ms)
+        est["bd_ms"] += accion.bd_ms
+        est["tk_ms"] += accion.tk_ms
+        est["filas"] += accion.filas
+        if total_ms >= umbral_ms:
+            est["lentas"] += 1
+
+    if total_ms >= umbral_ms:
+        escribir({
+            "accion": accion.nombre,
+            "detalle": accion.detalle,
+            "total_ms": round(total_ms, 2),
+            "bd_ms": round(accion.bd_ms, 2),
+            "tk_ms": round(accion.tk_ms, 2),
+            "filas": accion.filas,
+            "llamadas": accion.llamadas,
+            "consultas": accion.consultas,
+        })
+
+
+def escribir(registro):
+    registro = {"fecha": datetime.now().strftime('%Y-%m-%d %H:%M:%S'), **registro}
+    log.warning(json.dumps(registro, ensure_ascii=False, default=str))
+
+
+def estadisticas():
+    with _candado:
+        return {nombre: dict(est) for nombre, est in _estadisticas.items()}
+
+
+def activar(ruta, umbral=UMBRAL_LENTO_MS):
+    # Una línea JSON por acción lenta; el archivo rota al llegar a TAMANO_LOG
+    global activa, umbral_ms
+    from consultas_sesiones import consultas
+
+    if not log.handlers:
+        manejador = RotatingFileHandler(ruta, maxBytes=TAMANO_LOG, backupCount=ARCHIVOS_LOG, encoding="utf-8")
+        manejador.setFormatter(logging.Formatter("%(message)s"))
+        log.addHandler(manejador)
+    umbral_ms = umbral
+    consultas.observador = registrar_consulta
+    activa = True
+
+
+def desactivar():
+    global activa
+    from consultas_sesiones import consultas
+
+    activa = False
+    consultas.observador = None
+
+
+if os.environ.get("SPA_LOG_LENTAS"):
+    activar(os.environ["SPA_LOG_LENTAS"], float(os.environ.get("SPA_UMBRAL_LENTO_MS", UMBRAL_LENTO_MS)))
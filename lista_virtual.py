@@ -0,0 +1,212 @@
+from tkinter import ttk
+
+# Filas extra que se mantienen en el widget por debajo de la última visible,
+# para que al agrandar la ventana no quede un hueco antes del siguiente relleno
+MARGEN_FILAS = 2
+FILAS_POR_RUEDA = 3
+# A cuántas filas del final del buffer se pide la siguiente página
+FILAS_ANTES_DEL_FINAL = 20
+
+
+class ListaVirtual(ttk.Treeview):
+    # Treeview que solo crea en Tk las filas que caben en pantalla (más un
+    # margen). Los datos viven en self.filas y al desplazarse se reutilizan los
+    # mismos ítems cambiando sus valores, así que el costo de cargar o
+    # refrescar no depende de cuántas filas tenga el resultado.
+    #
+    # selection() e item() siguen funcionando sobre las filas visibles; la fila
+    # de datos seleccionada está en fila_seleccionada().
+    def __init__(self, master=None, formatear=None, al_llegar_al_final=None, **kw):
+        self._avisar_desplazamiento = kw.pop("yscrollcommand", None)
+        super().__init__(master, **kw)
+
+        # formatear(fila) -> (valores, etiquetas). Se aplica solo a las filas
+        # que se muestran. Por defecto cada fila ya es (valores, etiquetas).
+        self.formatear = formatear or (lambda fila: fila)
+        self.al_llegar_al_final = al_llegar_al_final
+        self.filas = []
+        self.inicio = 0
+        self.seleccionada = None
+        self.visibles = self.tk.getint(self.cget("height"))
+        self._huecos = []
+
+        self.bind("<Configure>", self._al_redimensionar, add="+")
+        self.bind("<<TreeviewSelect>>", self._al_seleccionar, add="+")
+        self.bind("<MouseWheel>", self._al_girar_rueda)
+        self.bind("<Button-4>", lambda e: self._desplazar(-FILAS_POR_RUEDA))
+        self.bind("<Button-5>", lambda e: self._desplazar(FILAS_POR_RUEDA))
+        self.bind("<Up>", lambda e: self._mover_seleccion(-1))
+        self.bind("<Down>", lambda e: self._mover_seleccion(1))
+        self.bind("<Prior>", lambda e: self._mover_seleccion(-self.visibles))
+        self.bind("<Next>", lambda e: self._mover_seleccion(self.visibles))
+        self.bind("<Home>", lambda e: self._mover_seleccion(-len(self.filas)))
+        self.bind("<End>", lambda e: self._mover_seleccion(len(self.filas)))
+
+    def cargar(self, filas):
+        self.filas = list(filas)
+        self.inicio = 0
+        self.seleccionada = None
+        self._rellenar()
+
+    def agregar(self, filas):
+        self.filas.extend(filas)
+        self._rellenar()
+
+    def limpiar(self):
+        self.cargar([])
+
+    def reemplazar_filas(self, filas, claves, clave=lambda fila: fila[0]):
+        # Actualiza en su lugar las filas cuyas claves cambiaron: las que
+        # vienen en filas se reemplazan y las que no vienen se quitan. El resto
+        # de la lista, la posición de desplazamiento y la selección se conservan.
+        nuevas = {clave(fila): fila for fila in filas}
+        seleccionada = self.fila_seleccionada()
+        clave_seleccionada = clave(seleccionada) if seleccionada is not None else None
+
+        resultado = []
+        quitadas_antes = 0
+        for indice, fila in enumerate(self.filas):
+            k = clave(fila)
+            if k not in claves:
+                resultado.append(fila)
+            elif k in nuevas:
+                resultado.append(nuevas[k])
+            elif indice < self.inicio:
+                quitadas_antes += 1
+
+        self.filas = resultado
+        self.inicio -= quitadas_antes
+        self.seleccionada = None
+        if clave_seleccionada is not None:
+            for indice, fila in enumerate(resultado):
+                if clave(fila) == clave_seleccionada:
+                    self.seleccionada = indice
+                    break
+        self._rellenar()
+
+    def fila_seleccionada(self):
+        if self.seleccionada is None or self.seleccionada >= len(self.filas):
+            return None
+        return self.filas[self.seleccionada]
+
+    def configure(self, cnf=None, **kw):
+        if isinstance(cnf, str):
+            return super().configure(cnf)
+        kw = dict(cnf or {}, **kw)
+        # La barra vertical recibe la posición dentro de self.filas, no la
+        # del widget, que siempre está al principio
+        if "yscrollcommand" in kw:
+            self._avisar_desplazamiento = kw.pop("yscrollcommand")
+            self._actualizar_barra()
+            if not kw:
+                return None
+        return super().configure(**kw)
+
+    config = configure
+
+    def yview(self, *args):
+        if not args:
+            return self._fracciones()
+        if args[0] == "moveto":
+            self.inicio = round(float(args[1]) * len(self.filas))
+            self._rellenar()
+        elif args[0] == "scroll":
+            cantidad = int(args[1])
+            if args[2].startswith("page"):
+                cantidad *= max(1, self.visibles - 1)
+            self._desplazar(cantidad)
+
+    def yview_moveto(self, fraccion):
+        self.yview("moveto", fraccion)
+
+    def yview_scroll(self, numero, que):
+        self.yview("scroll", numero, que)
+
+    def _rellenar(self):
+        self.inicio = min(max(0, self.inicio), max(0, len(self.filas) - self.visibles))
+        ventana = self.filas[self.inicio:self.inicio + self.visibles + MARGEN_FILAS]
+
+        # Ajustar la cantidad de ítems del widget a la ventana y reutilizarlos
+        while len(self._huecos) < len(ventana):
+            self._huecos.append(self.insert("", "end"))
+        while len(self._huecos) > len(ventana):
+            self.delete(self._huecos.pop())
+        for hueco, fila in zip(self._huecos, ventana):
+            valores, etiquetas = self.formatear(fila)
+            self.item(hueco, values=valores, tags=etiquetas)
+
+        # La selección sigue a la fila de datos, no al ítem del widget
+        if self.seleccionada is not None and 0 <= self.seleccionada - self.inicio < len(ventana):
+            hueco = self._huecos[self.seleccionada - self.inicio]
+            if self.selection() != (hueco,):
+                self.selection_set(hueco)
+                self.focus(hueco)
+        elif self.selection():
+            self.selection_remove(self.selection())
+
+        super().yview_moveto(0)
+        self._actualizar_barra()
+
+        if (self.al_llegar_al_final is not None
+                and self.inicio + self.visibles >= len(self.filas) - FILAS_ANTES_DEL_FINAL):
+            self.al_llegar_al_final()
+
+    def _fracciones(self):
+        total = len(self.filas)
+        if total <= self.visibles:
+            return 0.0, 1.0
+        return self.inicio / total, min(1.0, (self.inicio + self.visibles) / total)
+
+    def _actualizar_barra(self):
+        if self._avisar_desplazamiento is not None:
+            self._avisar_desplazamiento(*self._fracciones())
+
+    def _desplazar(self, cantidad):
+        self.inicio += cantidad
+        self._rellenar()
+        return "break"
+
+    def _al_girar_rueda(self, event):
+        # Windows informa múltiplos de 120; macOS, pasos pequeños
+        pasos = -int(event.delta / 120) or (-1 if event.delta > 0 else 1)
+        return self._desplazar(pasos * FILAS_POR_RUEDA)
+
+    def _mover_seleccion(self, paso):
+        if not self.filas:
+            return "break"
+        if self.seleccionada is None:
+            nueva = self.inicio
+        else:
+            nueva = min(max(0, self.seleccionada + paso), len(self.filas) - 1)
+        self.seleccionada = nueva
+        if nueva < self.inicio:
+            self.inicio = nueva
+        elif nueva >= self.inicio + self.visibles:
+            self.inicio = nueva - self.visibles + 1
+        self._rellenar()
+        return "break"
+
+    def _al_seleccionar(self, event):
+        seleccion = self.selection()
+        if seleccion and seleccion[0] in self._huecos:
+            self.seleccionada = self.inicio + self._huecos.index(seleccion[0])
+            # Clic en una fila del margen, cortada por el borde inferior
+            if self.seleccionada >= self.inicio + self.visibles:
+                self.inicio = self.seleccionada - self.visibles + 1
+                self._rellenar()
+        elif self.seleccionada is not None and 0 <= self.seleccionada - self.inicio < len(self._huecos):
+            # Se deseleccionó una fila visible; si la seleccionada quedó fuera
+            # de la ventana al desplazarse, se conserva
+            self.seleccionada = None
+
+    def _al_redimensionar(self, event):
+        if not self._huecos:
+            return
+        caja = self.bbox(self._huecos[0])
+        if not caja:
+            return
+        # caja = (x, y, ancho, alto) de la primera fila; y es el alto del encabezado
+        visibles = max(1, (event.height - caja[1]) // caja[3])
+        if visibles != self.visibles:
+            self.visibles = visibles
+            self._rellenar()
@@ -0,0 +1,1020 @@
+import argparse
+from datetime import datetime
+
+from conexion import RUTA_BD, abrir_conexion
+
+
+def existe_columna(conn, tabla, columna):
+    return any(fila[1] == columna for fila in conn.execute(f"PRAGMA table_info({tabla})"))
+
+
+def recalcular_componentes_pendientes(conn):
+    # Reconstruye el contador desde promocion_componentes; solo hace falta
+    # al crear la columna o si se modificaron datos con los triggers desactivados
+    conn.execute("""
+        UPDATE tratamientos_asignados
+        SET componentes_pendientes = (
+            SELECT COUNT(*)
+            FROM promocion_componentes pc
+            WHERE pc.tratamiento_asignado_id = tratamientos_asignados.id
+            AND pc.sesiones_restantes > 0
+        )
+    """)
+
+
+# Un componente queda completo (sin sesiones restantes) cuando todas las
+# sesiones que tiene registradas están realizadas y pagadas
+COMPONENTE_COMPLETO = ("sesiones_realizadas > 0 AND sesiones_realizadas = sesiones_completas "
+                       "AND sesiones_restantes <> 0")
+
+def agregar_componentes_pendientes(conn):
+    if existe_columna(conn, "tratamientos_asignados", "componentes_pendientes"):
+        return
+    conn.execute("""
+        ALTER TABLE tratamientos_asignados
+        ADD COLUMN componentes_pendientes INTEGER NOT NULL DEFAULT 0
+    """)
+    recalcular_componentes_pendientes(conn)
+
+
+def recalcular_progreso_componentes(conn, despues_de=0):
+    # Reconstruye los contadores de progreso de los componentes de los
+    # tratamientos con id > despues_de y completa los que ya tienen todas sus
+    # sesiones realizadas y pagadas. Hace falta al crear las columnas y
+    # después de escribir sesiones con los triggers de progreso suspendidos.
+    # Agrupa las sesiones una sola vez, así no depende de los índices.
+    conn.execute("""
+        UPDATE promocion_componentes
+        SET sesiones_realizadas = 0, sesiones_completas = 0
+        WHERE tratamiento_asignado_id > ?
+        AND (sesiones_realizadas <> 0 OR sesiones_completas <> 0)
+    """, (despues_de,))
+    conn.execute("""
+        UPDATE promocion_componentes
+        SET sesiones_realizadas = s.realizadas,
+            sesiones_completas = s.completas
+        FROM (
+            SELECT
+                tratamiento_asignado_id,
+                nombre_componente,
+                COUNT(*) AS realizadas,
+                SUM(IFNULL(realizada = 1 AND estado_pago = 'PAGADO', 0)) AS completas
+            FROM sesiones_realizadas
+            WHERE tratamiento_asignado_id > ? AND nombre_componente IS NOT NULL
+            GROUP BY tratamiento_asignado_id, nombre_componente
+        ) AS s
+        WHERE promocion_componentes.tratamiento_asignado_id = s.tratamiento_asignado_id
+        AND promocion_componentes.tratamiento_id = s.nombre_componente
+    """, (despues_de,))
+    conn.execute(f"""
+        UPDATE promocion_componentes
+        SET sesiones_restantes = 0
+        WHERE tratamiento_asignado_id > ? AND {COMPONENTE_COMPLETO}
+    """, (despues_de,))
+
+
+def agregar_progreso_componentes(conn):
+    if existe_columna(conn, "promocion_componentes", "sesiones_realizadas"):
+        return
+    for columna in ("sesiones_realizadas", "sesiones_completas"):
+        conn.execute(f"""
+            ALTER TABLE promocion_componentes
+            ADD COLUMN {columna} INTEGER NOT NULL DEFAULT 0
+        """)
+    recalcular_progreso_componentes(conn)
+
+def renumerar_sesiones_duplicadas(conn):
+    # Antes de exigir números únicos: las sesiones que repiten número dentro
+    # de su tratamiento (o componente) pasan al siguiente número libre. La
+    # primera registrada conserva el suyo.
+    duplicadas = conn.execute("""
+        SELECT s.id, s.tratamiento_asignado_id, s.nombre_componente
+        FROM sesiones_realizadas s
+        WHERE EXISTS (
+            SELECT 1
+            FROM sesiones_realizadas o
+            WHERE o.tratamiento_asignado_id = s.tratamiento_asignado_id
+            AND IFNULL(o.nombre_componente, '') = IFNULL(s.nombre_componente, '')
+            AND o.numero_sesion = s.numero_sesion
+            AND o.id < s.id
+        )
+        ORDER BY s.id
+    """).fetchall()
+    for sesion_id, tratamiento_id, componente in duplicadas:
+        conn.execute("""
+            UPDATE sesiones_realizadas
+            SET numero_sesion = (
+                SELECT MAX(numero_sesion) + 1
+                FROM sesiones_realizadas
+                WHERE tratamiento_asignado_id = ?
+                AND IFNULL(nombre_componente, '') = IFNULL(?, '')
+            )
+            WHERE id = ?
+        """, (tratamiento_id, componente, sesion_id))
+
+
+def normalizar_fechas(conn):
+    # Las fechas quedan como 'AAAA-MM-DD' exacto. El texto 'Sin iniciar' (o
+    # cualquier fecha_asignacion ilegible) pasa a NULL con estado_inicio
+    # 'SIN_INICIAR'; una proxima_cita ilegible pasa a NULL. Las fechas con
+    # hora pierden la hora.
+    if not existe_columna(conn, "tratamientos_asignados", "estado_inicio"):
+        conn.execute("""
+            ALTER TABLE tratamientos_asignados
+            ADD COLUMN estado_inicio TEXT NOT NULL DEFAULT 'INICIADO'
+            CHECK (estado_inicio IN ('INICIADO', 'SIN_INICIAR'))
+        """)
+    conn.execute("""
+        UPDATE tratamientos_asignados
+        SET fecha_asignacion = NULL, estado_inicio = 'SIN_INICIAR'
+        WHERE date(fecha_asignacion, '+0 days') IS NULL
+    """)
+    conn.execute("""
+        UPDATE tratamientos_asignados
+        SET fecha_asignacion = date(fecha_asignacion, '+0 days')
+        WHERE fecha_asignacion IS NOT date(fecha_asignacion, '+0 days')
+    """)
+    conn.execute("""
+        UPDATE sesiones_realizadas
+        SET fecha_sesion = date(fecha_sesion, '+0 days')
+        WHERE date(fecha_sesion, '+0 days') IS NOT NULL
+        AND fecha_sesion IS NOT date(fecha_sesion, '+0 days')
+    """)
+    conn.execute("""
+        UPDATE sesiones_realizadas
+        SET proxima_cita = date(proxima_cita, '+0 days')
+        WHERE proxima_cita IS NOT date(proxima_cita, '+0 days')
+    """)
+
+
+# Tablas de resumen por periodo: cada fila origen suma a dos filas, la del
+# día ('AAAA-MM-DD', largo 10) y la del mes ('AAAA-MM', largo 7). Las filas
+# sin fecha válida no entran en los resúmenes.
+# nombre: (tabla origen, columnas que disparan la actualización,
+#          INSERT ... ON CONFLICT que suma la fila {f} con signo {s},
+#          DELETE de las filas que quedaron en cero para la fila {f},
+#          reconstrucción completa)
+RESUMENES = {
+    "resumen_sesiones": (
+        "sesiones_realizadas",
+        "fecha_sesion, asistente_id, monto_abonado, estado_pago, realizada, tratamiento_asignado_id",
+        """
+            INSERT INTO resumen_sesiones (
+                periodo, tratamiento_id, asistente_id,
+                sesiones, sesiones_completas, monto_abonado, monto_cobrado
+            )
+            SELECT
+                substr(date({f}.fecha_sesion), 1, largo),
+                IFNULL((SELECT tratamiento_id FROM tratamientos_asignados WHERE id = {f}.tratamiento_asignado_id), 0),
+                IFNULL({f}.asistente_id, 0),
+                {s},
+                {s} * ({f}.realizada = 1 AND {f}.estado_pago IS 'PAGADO'),
+                {s} * IFNULL({f}.monto_abonado, 0),
+                {s} * IIF({f}.realizada = 1 AND {f}.estado_pago IS 'PAGADO', IFNULL({f}.monto_abonado, 0), 0)
+            FROM (SELECT 10 AS largo UNION ALL SELECT 7)
+            WHERE date({f}.fecha_sesion) IS NOT NULL
+            ON CONFLICT (periodo, tratamiento_id, asistente_id) DO UPDATE SET
+                sesiones = sesiones + excluded.sesiones,
+                sesiones_completas = sesiones_completas + excluded.sesiones_completas,
+                monto_abonado = monto_abonado + excluded.monto_abonado,
+                monto_cobrado = monto_cobrado + excluded.monto_cobrado;
+        """,
+        """
+            DELETE FROM resumen_sesiones
+            WHERE periodo IN (date({f}.fecha_sesion), substr(date({f}.fecha_sesion), 1, 7))
+            AND tratamiento_id = IFNULL((SELECT tratamiento_id FROM tratamientos_asignados WHERE id = {f}.tratamiento_asignado_id), 0)
+            AND asistente_id = IFNULL({f}.asistente_id, 0)
+            AND sesiones = 0;
+        """,
+        """
+            INSERT INTO resumen_sesiones (
+                periodo, tratamiento_id, asistente_id,
+                sesiones, sesiones_completas, monto_abonado, monto_cobrado
+            )
+            SELECT
+                substr(date(sr.fecha_sesion), 1, largo),
+                IFNULL(ta.tratamiento_id, 0),
+                IFNULL(sr.asistente_id, 0),
+                COUNT(*),
+                SUM(sr.realizada = 1 AND sr.estado_pago IS 'PAGADO'),
+                SUM(IFNULL(sr.monto_abonado, 0)),
+                SUM(IIF(sr.realizada = 1 AND sr.estado_pago IS 'PAGADO', IFNULL(sr.monto_abonado, 0), 0))
+            FROM sesiones_realizadas sr
+            LEFT JOIN tratamientos_asignados ta ON sr.tratamiento_asignado_id = ta.id
+            CROSS JOIN (SELECT 10 AS largo UNION ALL SELECT 7)
+            WHERE date(sr.fecha_sesion) IS NOT NULL
+            GROUP BY 1, 2, 3
+        """,
+    ),
+    "resumen_tratamientos": (
+        "tratamientos_asignados",
+        "fecha_asignacion, tratamiento_id, costo_total, total_pagado, saldo_pendiente",
+        """
+            INSERT INTO resumen_tratamientos (
+                periodo, tratamiento_id, tratamientos, costo_total, total_pagado, saldo_pendiente
+            )
+            SELECT
+                substr(date({f}.fecha_asignacion), 1, largo),
+                IFNULL({f}.tratamiento_id, 0),
+                {s},
+                {s} * IFNULL({f}.costo_total, 0),
+                {s} * IFNULL({f}.total_pagado, 0),
+                {s} * IFNULL({f}.saldo_pendiente, 0)
+            FROM (SELECT 10 AS largo UNION ALL SELECT 7)
+            WHERE date({f}.fecha_asignacion) IS NOT NULL
+            ON CONFLICT (periodo, tratamiento_id) DO UPDATE SET
+                tratamientos = tratamientos + excluded.tratamientos,
+                costo_total = costo_total + excluded.costo_total,
+                total_pagado = total_pagado + excluded.total_pagado,
+                saldo_pendiente = saldo_pendiente + excluded.saldo_pendiente;
+        """,
+        """
+            DELETE FROM resumen_tratamientos
+            WHERE periodo IN (date({f}.fecha_asignacion), substr(date({f}.fecha_asignacion), 1, 7))
+            AND tratamiento_id = IFNULL({f}.tratamiento_id, 0)
+            AND tratamientos = 0;
+        """,
+        """
+            INSERT INTO resumen_tratamientos (
+                periodo, tratamiento_id, tratamientos, costo_total, total_pagado, saldo_pendiente
+            )
+            SELECT
+                substr(date(fecha_asignacion), 1, largo),
+                IFNULL(tratamiento_id, 0),
+                COUNT(*),
+                SUM(IFNULL(costo_total, 0)),
+                SUM(IFNULL(total_pagado, 0)),
+                SUM(IFNULL(saldo_pendiente, 0))
+            FROM tratamientos_asignados
+            CROSS JOIN (SELECT 10 AS largo UNION ALL SELECT 7)
+            WHERE date(fecha_asignacion) IS NOT NULL
+            GROUP BY 1, 2
+        """,
+    ),
+    "resumen_reportes": (
+        "reportes",
+        "fecha, concepto, ingreso, egreso",
+        """
+            INSERT INTO resumen_reportes (periodo, concepto, movimientos, ingreso, egreso)
+            SELECT
+                substr(date({f}.fecha), 1, largo),
+                IFNULL({f}.concepto, ''),
+                {s},
+                {s} * IFNULL({f}.ingreso, 0),
+                {s} * IFNULL({f}.egreso, 0)
+            FROM (SELECT 10 AS largo UNION ALL SELECT 7)
+            WHERE date({f}.fecha) IS NOT NULL
+            ON CONFLICT (periodo, concepto) DO UPDATE SET
+                movimientos = movimientos + excluded.movimientos,
+                ingreso = ingreso + excluded.ingreso,
+                egreso = egreso + excluded.egreso;
+        """,
+        """
+            DELETE FROM resumen_reportes
+            WHERE periodo IN (date({f}.fecha), substr(date({f}.fecha), 1, 7))
+            AND concepto = IFNULL({f}.concepto, '')
+            AND movimientos = 0;
+        """,
+        """
+            INSERT INTO resumen_reportes (periodo, concepto, movimientos, ingreso, egreso)
+            SELECT
+                substr(date(fecha), 1, largo),
+                IFNULL(concepto, ''),
+                COUNT(*),
+                SUM(IFNULL(ingreso, 0)),
+                SUM(IFNULL(egreso, 0))
+            FROM reportes
+            CROSS JOIN (SELECT 10 AS largo UNION ALL SELECT 7)
+            WHERE date(fecha) IS NOT NULL
+            GROUP BY 1, 2
+        """,
+    ),
+}
+
+# Nombres de los triggers que mantienen los resúmenes
+TRIGGERS_RESUMEN = [f"trg_{nombre}_{evento}" for nombre in RESUMENES
+                    for evento in ("insert", "update", "delete")]
+
+
+def triggers_resumen(nombre):
+    tabla, columnas, sumar, limpiar, _ = RESUMENES[nombre]
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{nombre}_insert
+        AFTER INSERT ON {tabla}
+        BEGIN
+            {sumar.format(f="NEW", s="1")}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{nombre}_update
+        AFTER UPDATE OF {columnas} ON {tabla}
+        BEGIN
+            {sumar.format(f="OLD", s="-1")}
+            {sumar.format(f="NEW", s="1")}
+            {limpiar.format(f="OLD")}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{nombre}_delete
+        AFTER DELETE ON {tabla}
+        BEGIN
+            {sumar.format(f="OLD", s="-1")}
+            {limpiar.format(f="OLD")}
+        END
+        """,
+    ]
+
+
+# Tablas de referencia (catálogos que casi no cambian). Cada escritura en
+# ellas sube version_referencia, y datos_referencia la compara para saber si
+# su caché sigue vigente, incluso ante escrituras de otras estaciones.
+TABLAS_REFERENCIA = ("asistentes", "tratamientos", "promocion_detalles")
+
+
+def triggers_referencia(tabla):
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_referencia_{tabla}_{evento.lower()}
+        AFTER {evento} ON {tabla}
+        BEGIN
+            UPDATE version_referencia SET version = version + 1 WHERE id = 1;
+        END
+        """
+        for evento in ("INSERT", "UPDATE", "DELETE")
+    ]
+
+
+def reconstruir_resumenes(conn):
+    # Vuelve a calcular todos los resúmenes desde las tablas de origen; solo
+    # hace falta al crearlos o si se modificaron datos con los triggers
+    # desactivados (importaciones)
+    for nombre, (_, _, _, _, reconstruir) in RESUMENES.items():
+        conn.execute(f"DELETE FROM {nombre}")
+        conn.execute(reconstruir)
+
+
+# Progreso de cada componente de promoción, mantenido por triggers sobre
+# sesiones_realizadas: sesiones registradas, realizadas y pagadas, y la
+# completitud. Ver la sesión de un componente es solo una lectura.
+TRIGGERS_PROGRESO = [f"trg_progreso_componente_{evento}" for evento in ("insert", "update", "delete")]
+
+SUMAR_PROGRESO = """
+            UPDATE promocion_componentes
+            SET sesiones_realizadas = sesiones_realizadas + {s},
+                sesiones_completas = sesiones_completas
+                    + {s} * IFNULL({f}.realizada = 1 AND {f}.estado_pago = 'PAGADO', 0)
+            WHERE tratamiento_asignado_id = {f}.tratamiento_asignado_id
+            AND tratamiento_id = {f}.nombre_componente;
+"""
+
+COMPLETAR_COMPONENTE = f"""
+            UPDATE promocion_componentes
+            SET sesiones_restantes = 0
+            WHERE tratamiento_asignado_id = {{f}}.tratamiento_asignado_id
+            AND tratamiento_id = {{f}}.nombre_componente
+            AND {COMPONENTE_COMPLETO};
+"""
+
+
+def triggers_progreso():
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_progreso_componente_insert
+        AFTER INSERT ON sesiones_realizadas
+        WHEN NEW.nombre_componente IS NOT NULL
+        BEGIN
+            {SUMAR_PROGRESO.format(f="NEW", s="1")}
+            {COMPLETAR_COMPONENTE.format(f="NEW")}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_progreso_componente_update
+        AFTER UPDATE OF realizada, estado_pago, nombre_componente, tratamiento_asignado_id ON sesiones_realizadas
+        WHEN OLD.nombre_componente IS NOT NULL OR NEW.nombre_componente IS NOT NULL
+        BEGIN
+            {SUMAR_PROGRESO.format(f="OLD", s="-1")}
+            {SUMAR_PROGRESO.format(f="NEW", s="1")}
+            {COMPLETAR_COMPONENTE.format(f="OLD")}
+            {COMPLETAR_COMPONENTE.format(f="NEW")}
+        END
+        """,
+        # Sin la sesión borrada las que quedan pueden estar todas completas
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_progreso_componente_delete
+        AFTER DELETE ON sesiones_realizadas
+        WHEN OLD.nombre_componente IS NOT NULL
+        BEGIN
+            {SUMAR_PROGRESO.format(f="OLD", s="-1")}
+            {COMPLETAR_COMPONENTE.format(f="OLD")}
+        END
+        """,
+    ]
+
+# Migraciones versionadas del esquema que usan las pantallas de sesiones.
+# Cada migración es (versión, descripción, pasos); un paso es una sentencia SQL
+# o una función que recibe la conexión. Las versiones ya aplicadas se guardan
+# en version_esquema y no se vuelven a ejecutar. Los pasos son idempotentes
+# para que una base creada antes de existir esta tabla migre sin errores.
+MIGRACIONES = [
+    (1, "Paginación del listado de Control de Sesiones", [
+        # Paginación por conjunto de claves del listado de Control de Sesiones
+        """
+        CREATE INDEX IF NOT EXISTS idx_tratamientos_asignados_fecha_id
+        ON tratamientos_asignados (fecha_asignacion, id)
+        """,
+    ]),
+    (2, "Índices de búsqueda por paciente", [
+        # Búsqueda por nombre: LIKE 'prefijo%' puede usar un índice NOCASE
+        """
+        CREATE INDEX IF NOT EXISTS idx_pacientes_nombre
+        ON pacientes (nombre COLLATE NOCASE)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_tratamientos_asignados_paciente
+        ON tratamientos_asignados (paciente_id, fecha_asignacion)
+        """,
+    ]),
+    (3, "Búsqueda de texto completo por paciente y tratamiento", [
+        # Índice de texto completo para "Buscar por Nombre": una fila por
+        # tratamiento asignado (rowid = tratamientos_asignados.id). remove_diacritics
+        # hace que "Jose" encuentre "José"; prefix acelera la búsqueda mientras se escribe.
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS busqueda_tratamientos USING fts5(
+            paciente,
+            tratamiento,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+        """,
+        # Carga inicial; después la mantienen los triggers
+        """
+        INSERT INTO busqueda_tratamientos (rowid, paciente, tratamiento)
+        SELECT ta.id, p.nombre, t.nombre
+        FROM tratamientos_asignados ta
+        JOIN pacientes p ON ta.paciente_id = p.id
+        JOIN tratamientos t ON ta.tratamiento_id = t.id
+        WHERE NOT EXISTS (SELECT 1 FROM busqueda_tratamientos)
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_busqueda_ta_insert
+        AFTER INSERT ON tratamientos_asignados
+        BEGIN
+            INSERT INTO busqueda_tratamientos (rowid, paciente, tratamiento)
+            VALUES (
+                NEW.id,
+                (SELECT nombre FROM pacientes WHERE id = NEW.paciente_id),
+                (SELECT nombre FROM tratamientos WHERE id = NEW.tratamiento_id)
+            );
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_busqueda_ta_update
+        AFTER UPDATE OF paciente_id, tratamiento_id ON tratamientos_asignados
+        BEGIN
+            UPDATE busqueda_tratamientos
+            SET paciente = (SELECT nombre FROM pacientes WHERE id = NEW.paciente_id),
+                tratamiento = (SELECT nombre FROM tratamientos WHERE id = NEW.tratamiento_id)
+            WHERE rowid = NEW.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_busqueda_ta_delete
+        AFTER DELETE ON tratamientos_asignados
+        BEGIN
+            DELETE FROM busqueda_tratamientos WHERE rowid = OLD.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_busqueda_paciente_update
+        AFTER UPDATE OF nombre ON pacientes
+        BEGIN
+            UPDATE busqueda_tratamientos
+            SET paciente = NEW.nombre
+            WHERE rowid IN (SELECT id FROM tratamientos_asignados WHERE paciente_id = NEW.id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_busqueda_tratamiento_update
+        AFTER UPDATE OF nombre ON tratamientos
+        BEGIN
+            UPDATE busqueda_tratamientos
+            SET tratamiento = NEW.nombre
+            WHERE rowid IN (SELECT id FROM tratamientos_asignados WHERE tratamiento_id = NEW.id);
+        END
+        """,
+    ]),
+    (4, "Contador de componentes pendientes", [
+        # Componentes de promoción con sesiones pendientes, desnormalizado en
+        # tratamientos_asignados para que el listado no cuente fila por fila
+        agregar_componentes_pendientes,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_componentes_pendientes_insert
+        AFTER INSERT ON promocion_componentes
+        WHEN IFNULL(NEW.sesiones_restantes, 0) > 0
+        BEGIN
+            UPDATE tratamientos_asignados
+            SET componentes_pendientes = componentes_pendientes + 1
+            WHERE id = NEW.tratamiento_asignado_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_componentes_pendientes_delete
+        AFTER DELETE ON promocion_componentes
+        WHEN IFNULL(OLD.sesiones_restantes, 0) > 0
+        BEGIN
+            UPDATE tratamientos_asignados
+            SET componentes_pendientes = componentes_pendientes - 1
+            WHERE id = OLD.tratamiento_asignado_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_componentes_pendientes_update
+        AFTER UPDATE OF sesiones_restantes, tratamiento_asignado_id ON promocion_componentes
+        WHEN (IFNULL(OLD.sesiones_restantes, 0) > 0) IS NOT (IFNULL(NEW.sesiones_restantes, 0) > 0)
+            OR OLD.tratamiento_asignado_id IS NOT NEW.tratamiento_asignado_id
+        BEGIN
+            UPDATE tratamientos_asignados
+            SET componentes_pendientes = componentes_pendientes - (IFNULL(OLD.sesiones_restantes, 0) > 0)
+            WHERE id = OLD.tratamiento_asignado_id;
+            UPDATE tratamientos_asignados
+            SET componentes_pendientes = componentes_pendientes + (IFNULL(NEW.sesiones_restantes, 0) > 0)
+            WHERE id = NEW.tratamiento_asignado_id;
+        END
+        """,
+    ]),
+    (5, "Índices de sesiones y componentes de promoción", [
+        # Sesiones de un tratamiento, filtradas por componente y número de sesión
+        """
+        CREATE INDEX IF NOT EXISTS idx_sesiones_tratamiento_componente
+        ON sesiones_realizadas (tratamiento_asignado_id, nombre_componente, numero_sesion)
+        """,
+        # Sesiones de un tratamiento por número (tratamientos individuales)
+        """
+        CREATE INDEX IF NOT EXISTS idx_sesiones_tratamiento_numero
+        ON sesiones_realizadas (tratamiento_asignado_id, numero_sesion)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_promocion_detalles_componente
+        ON promocion_detalles (promocion_id, nombre_componente)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_promocion_componentes_tratamiento
+        ON promocion_componentes (tratamiento_asignado_id, tratamiento_id)
+        """,
+        # Lista de asistentes ordenada de los formularios
+        """
+        CREATE INDEX IF NOT EXISTS idx_asistentes_nombre
+        ON asistentes (nombre, id)
+        """,
+    ]),
+    (6, "Numeración de sesiones con contador por tratamiento", [
+        # Último número de sesión usado por tratamiento asignado y componente
+        # ('' para tratamientos individuales). Se reserva el siguiente dentro
+        # de la misma transacción que inserta la sesión.
+        """
+        CREATE TABLE IF NOT EXISTS secuencias_sesion (
+            tratamiento_asignado_id INTEGER NOT NULL,
+            nombre_componente TEXT NOT NULL DEFAULT '',
+            ultimo_numero INTEGER NOT NULL,
+            PRIMARY KEY (tratamiento_asignado_id, nombre_componente)
+        ) WITHOUT ROWID
+        """,
+        renumerar_sesiones_duplicadas,
+        """
+        INSERT OR IGNORE INTO secuencias_sesion (tratamiento_asignado_id, nombre_componente, ultimo_numero)
+        SELECT tratamiento_asignado_id, IFNULL(nombre_componente, ''), MAX(numero_sesion)
+        FROM sesiones_realizadas
+        WHERE numero_sesion IS NOT NULL
+        GROUP BY tratamiento_asignado_id, IFNULL(nombre_componente, '')
+        """,
+        # Dos sesiones del mismo tratamiento (o componente) nunca comparten número
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_sesiones_numero_unico
+        ON sesiones_realizadas (tratamiento_asignado_id, IFNULL(nombre_componente, ''), numero_sesion)
+        """,
+        # Si otra parte del sistema inserta sesiones con su propio número, el
+        # contador avanza igual y no vuelve a entregar ese número
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_secuencia_sesion_insert
+        AFTER INSERT ON sesiones_realizadas
+        WHEN NEW.numero_sesion IS NOT NULL
+        BEGIN
+            INSERT INTO secuencias_sesion (tratamiento_asignado_id, nombre_componente, ultimo_numero)
+            VALUES (NEW.tratamiento_asignado_id, IFNULL(NEW.nombre_componente, ''), NEW.numero_sesion)
+            ON CONFLICT (tratamiento_asignado_id, nombre_componente)
+            DO UPDATE SET ultimo_numero = MAX(ultimo_numero, excluded.ultimo_numero);
+        END
+        """,
+    ]),
+    (7, "Libro de comisiones y saldos por asistente", [
+        # Libro de comisiones: solo se agregan movimientos. Una corrección es
+        # un movimiento nuevo por la diferencia, nunca un cambio a uno anterior.
+        """
+        CREATE TABLE IF NOT EXISTS comisiones_movimientos (
+            id INTEGER PRIMARY KEY,
+            asistente_id INTEGER NOT NULL,
+            tratamiento_asignado_id INTEGER,
+            sesion_id INTEGER,
+            periodo TEXT NOT NULL,
+            monto REAL NOT NULL,
+            concepto TEXT NOT NULL,
+            registrado_en TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_comisiones_movimientos_sesion
+        ON comisiones_movimientos (sesion_id)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_comisiones_movimientos_asistente
+        ON comisiones_movimientos (asistente_id, periodo)
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_comisiones_movimientos_sin_update
+        BEFORE UPDATE ON comisiones_movimientos
+        BEGIN
+            SELECT RAISE(ABORT, 'comisiones_movimientos solo admite nuevos movimientos');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_comisiones_movimientos_sin_delete
+        BEFORE DELETE ON comisiones_movimientos
+        BEGIN
+            SELECT RAISE(ABORT, 'comisiones_movimientos solo admite nuevos movimientos');
+        END
+        """,
+        # Saldo acumulado por asistente y periodo (AAAA-MM); periodo '' es el
+        # total histórico. Cada movimiento actualiza sus dos filas.
+        """
+        CREATE TABLE IF NOT EXISTS comisiones_saldos (
+            asistente_id INTEGER NOT NULL,
+            periodo TEXT NOT NULL,
+            total REAL NOT NULL,
+            movimientos INTEGER NOT NULL,
+            PRIMARY KEY (asistente_id, periodo)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_comisiones_saldos_periodo
+        ON comisiones_saldos (periodo)
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_comisiones_saldos_insert
+        AFTER INSERT ON comisiones_movimientos
+        BEGIN
+            INSERT INTO comisiones_saldos (asistente_id, periodo, total, movimientos)
+            VALUES (NEW.asistente_id, NEW.periodo, NEW.monto, 1)
+            ON CONFLICT (asistente_id, periodo)
+            DO UPDATE SET total = total + excluded.total, movimientos = movimientos + 1;
+            INSERT INTO comisiones_saldos (asistente_id, periodo, total, movimientos)
+            VALUES (NEW.asistente_id, '', NEW.monto, 1)
+            ON CONFLICT (asistente_id, periodo)
+            DO UPDATE SET total = total + excluded.total, movimientos = movimientos + 1;
+        END
+        """,
+        # Saldo inicial: la comisión de cada sesión que ya la tenía sumada
+        """
+        INSERT INTO comisiones_movimientos (
+            asistente_id, tratamiento_asignado_id, sesion_id, periodo, monto, concepto, registrado_en
+        )
+        SELECT
+            asistente_id,
+            tratamiento_asignado_id,
+            id,
+            IFNULL(substr(fecha_sesion, 1, 7), '0000-00'),
+            ROUND(monto_abonado * porcentaje_asistente / 100, 2),
+            'Saldo inicial',
+            datetime('now', 'localtime')
+        FROM sesiones_realizadas
+        WHERE comision_sumada = 1
+        AND asistente_id IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM comisiones_movimientos)
+        """,
+    ]),
+    (8, "Índices por fecha para exportaciones", [
+        # Rangos de fechas de exportar.py
+        """
+        CREATE INDEX IF NOT EXISTS idx_sesiones_fecha
+        ON sesiones_realizadas (fecha_sesion)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_pagos_asistentes_fecha
+        ON pagos_asistentes (fecha_pago)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_reportes_fecha
+        ON reportes (fecha)
+        """,
+    ]),
+    (9, "Resúmenes diarios y mensuales de sesiones, tratamientos y reportes", [
+        # asistente_id 0: sesiones sin asistente
+        """
+        CREATE TABLE IF NOT EXISTS resumen_sesiones (
+            periodo TEXT NOT NULL,
+            tratamiento_id INTEGER NOT NULL,
+            asistente_id INTEGER NOT NULL,
+            sesiones INTEGER NOT NULL,
+            sesiones_completas INTEGER NOT NULL,
+            monto_abonado REAL NOT NULL,
+            monto_cobrado REAL NOT NULL,
+            PRIMARY KEY (periodo, tratamiento_id, asistente_id)
+        ) WITHOUT ROWID
+        """,
+        # Por periodo de fecha_asignacion
+        """
+        CREATE TABLE IF NOT EXISTS resumen_tratamientos (
+            periodo TEXT NOT NULL,
+            tratamiento_id INTEGER NOT NULL,
+            tratamientos INTEGER NOT NULL,
+            costo_total REAL NOT NULL,
+            total_pagado REAL NOT NULL,
+            saldo_pendiente REAL NOT NULL,
+            PRIMARY KEY (periodo, tratamiento_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS resumen_reportes (
+            periodo TEXT NOT NULL,
+            concepto TEXT NOT NULL,
+            movimientos INTEGER NOT NULL,
+            ingreso REAL NOT NULL,
+            egreso REAL NOT NULL,
+            PRIMARY KEY (periodo, concepto)
+        ) WITHOUT ROWID
+        """,
+        *triggers_resumen("resumen_sesiones"),
+        *triggers_resumen("resumen_tratamientos"),
+        *triggers_resumen("resumen_reportes"),
+        reconstruir_resumenes,
+    ]),
+    (10, "Agenda de citas y horarios de asistentes", [
+        # Bloques de atención por día de la semana (0 = lunes); puede haber
+        # varios por día, por ejemplo mañana y tarde
+        """
+        CREATE TABLE IF NOT EXISTS horarios_asistentes (
+            asistente_id INTEGER NOT NULL,
+            dia_semana INTEGER NOT NULL CHECK (dia_semana BETWEEN 0 AND 6),
+            hora_inicio TEXT NOT NULL,
+            hora_fin TEXT NOT NULL,
+            PRIMARY KEY (asistente_id, dia_semana, hora_inicio),
+            CHECK (hora_fin > hora_inicio)
+        ) WITHOUT ROWID
+        """,
+        # inicio y fin en 'AAAA-MM-DD HH:MM', siempre dentro del mismo día
+        """
+        CREATE TABLE IF NOT EXISTS citas (
+            id INTEGER PRIMARY KEY,
+            asistente_id INTEGER NOT NULL,
+            tratamiento_asignado_id INTEGER,
+            nombre_componente TEXT,
+            inicio TEXT NOT NULL,
+            fin TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'PROGRAMADA',
+            creada_en TEXT NOT NULL,
+            CHECK (fin > inicio AND substr(fin, 1, 10) = substr(inicio, 1, 10))
+        )
+        """,
+        # Agenda y superposición por asistente: el rango de un día de un
+        # asistente es una sola búsqueda en el índice
+        """
+        CREATE INDEX IF NOT EXISTS idx_citas_asistente_inicio
+        ON citas (asistente_id, inicio, fin)
+        WHERE estado = 'PROGRAMADA'
+        """,
+        # Agenda del día de todos los asistentes
+        """
+        CREATE INDEX IF NOT EXISTS idx_citas_inicio
+        ON citas (inicio)
+        WHERE estado = 'PROGRAMADA'
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_citas_tratamiento
+        ON citas (tratamiento_asignado_id, inicio)
+        """,
+        # Dos citas programadas del mismo asistente nunca se superponen, la
+        # reserve quien la reserve
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_citas_sin_superposicion_insert
+        BEFORE INSERT ON citas
+        WHEN NEW.estado = 'PROGRAMADA'
+        BEGIN
+            SELECT RAISE(ABORT, 'El asistente ya tiene una cita en ese horario')
+            WHERE EXISTS (
+                SELECT 1
+                FROM citas
+                WHERE asistente_id = NEW.asistente_id
+                AND estado = 'PROGRAMADA'
+                AND inicio >= substr(NEW.inicio, 1, 10)
+                AND inicio < NEW.fin
+                AND fin > NEW.inicio
+            );
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_citas_sin_superposicion_update
+        BEFORE UPDATE OF asistente_id, inicio, fin, estado ON citas
+        WHEN NEW.estado = 'PROGRAMADA'
+        BEGIN
+            SELECT RAISE(ABORT, 'El asistente ya tiene una cita en ese horario')
+            WHERE EXISTS (
+                SELECT 1
+                FROM citas
+                WHERE asistente_id = NEW.asistente_id
+                AND estado = 'PROGRAMADA'
+                AND inicio >= substr(NEW.inicio, 1, 10)
+                AND inicio < NEW.fin
+                AND fin > NEW.inicio
+                AND id <> NEW.id
+            );
+        END
+        """,
+    ]),
+    (11, "Fechas normalizadas y estado de inicio de los tratamientos", [
+        normalizar_fechas,
+        # Solo fechas 'AAAA-MM-DD' válidas: date(x, '+0 days') devuelve otro
+        # texto (o NULL) para cualquier otro valor; sin el modificador,
+        # date('2024-02-30') devuelve el mismo texto.
+        # 'Sin iniciar' se sigue aceptando al escribir y se convierte abajo.
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_ta_fecha_valida_insert
+        BEFORE INSERT ON tratamientos_asignados
+        WHEN NEW.fecha_asignacion IS NOT NULL
+        AND NEW.fecha_asignacion IS NOT 'Sin iniciar'
+        AND NEW.fecha_asignacion IS NOT date(NEW.fecha_asignacion, '+0 days')
+        BEGIN
+            SELECT RAISE(ABORT, 'fecha_asignacion debe tener el formato AAAA-MM-DD');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_ta_fecha_valida_update
+        BEFORE UPDATE OF fecha_asignacion ON tratamientos_asignados
+        WHEN NEW.fecha_asignacion IS NOT NULL
+        AND NEW.fecha_asignacion IS NOT 'Sin iniciar'
+        AND NEW.fecha_asignacion IS NOT date(NEW.fecha_asignacion, '+0 days')
+        BEGIN
+            SELECT RAISE(ABORT, 'fecha_asignacion debe tener el formato AAAA-MM-DD');
+        END
+        """,
+        # estado_inicio sigue a fecha_asignacion: sin fecha, el tratamiento
+        # no se inició
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_ta_estado_inicio_insert
+        AFTER INSERT ON tratamientos_asignados
+        WHEN NEW.fecha_asignacion IS NULL OR NEW.fecha_asignacion = 'Sin iniciar'
+        BEGIN
+            UPDATE tratamientos_asignados
+            SET fecha_asignacion = NULL, estado_inicio = 'SIN_INICIAR'
+            WHERE id = NEW.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_ta_estado_inicio_update
+        AFTER UPDATE OF fecha_asignacion ON tratamientos_asignados
+        WHEN NEW.fecha_asignacion IS 'Sin iniciar'
+        OR (NEW.fecha_asignacion IS NULL) <> (NEW.estado_inicio = 'SIN_INICIAR')
+        BEGIN
+            UPDATE tratamientos_asignados
+            SET fecha_asignacion = NULLIF(NEW.fecha_asignacion, 'Sin iniciar'),
+                estado_inicio = CASE
+                    WHEN NULLIF(NEW.fecha_asignacion, 'Sin iniciar') IS NULL THEN 'SIN_INICIAR'
+                    ELSE 'INICIADO'
+                END
+            WHERE id = NEW.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_sesiones_fechas_validas_insert
+        BEFORE INSERT ON sesiones_realizadas
+        WHEN NEW.fecha_sesion IS NOT date(NEW.fecha_sesion, '+0 days')
+        OR (NEW.proxima_cita IS NOT NULL AND NEW.proxima_cita IS NOT date(NEW.proxima_cita, '+0 days'))
+        BEGIN
+            SELECT RAISE(ABORT, 'Las fechas de la sesión deben tener el formato AAAA-MM-DD');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_sesiones_fechas_validas_update
+        BEFORE UPDATE OF fecha_sesion, proxima_cita ON sesiones_realizadas
+        WHEN NEW.fecha_sesion IS NOT date(NEW.fecha_sesion, '+0 days')
+        OR (NEW.proxima_cita IS NOT NULL AND NEW.proxima_cita IS NOT date(NEW.proxima_cita, '+0 days'))
+        BEGIN
+            SELECT RAISE(ABORT, 'Las fechas de la sesión deben tener el formato AAAA-MM-DD');
+        END
+        """,
+        # Próximas citas por rango de fechas
+        """
+        CREATE INDEX IF NOT EXISTS idx_sesiones_proxima_cita
+        ON sesiones_realizadas (proxima_cita)
+        WHERE proxima_cita IS NOT NULL
+        """,
+    ]),
+    (12, "Versión de los datos de referencia", [
+        """
+        CREATE TABLE IF NOT EXISTS version_referencia (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO version_referencia (id, version) VALUES (1, 0)",
+        *(trigger for tabla in TABLAS_REFERENCIA for trigger in triggers_referencia(tabla)),
+    ]),
+    (13, "Progreso de los componentes de promoción", [
+        agregar_progreso_componentes,
+        *triggers_progreso(),
+    ]),
+]
+
+
+def version_actual(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS version_esquema (
+            version INTEGER PRIMARY KEY,
+            descripcion TEXT NOT NULL,
+            aplicada_en TEXT NOT NULL
+        )
+    """)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM version_esquema").fetchone()[0]
+
+
+def aplicar_migraciones(ruta_bd=RUTA_BD):
+    # La conexión no abre transacciones implícitas: cada migración se aplica
+    # completa dentro de su propio BEGIN IMMEDIATE o no se aplica
+    conn = abrir_conexion(ruta_bd)
+    try:
+        actual = version_actual(conn)
+        for version, descripcion, pasos in MIGRACIONES:
+            if version <= actual:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for paso in pasos:
+                    if callable(paso):
+                        paso(conn)
+                    else:
+                        conn.execute(paso)
+                conn.execute(
+                    "INSERT INTO version_esquema (version, descripcion, aplicada_en) VALUES (?, ?, ?)",
+                    (version, descripcion, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.close()
+
+
+def explicar_consultas(ruta_bd=RUTA_BD):
+    # Muestra el plan de ejecución de cada consulta de Control de Sesiones y
+    # marca las que recorren una tabla completa
+    from consultas_sesiones import CONSULTAS
+
+    conn = abrir_conexion(ruta_bd)
+    escaneos = []
+    try:
+        for nombre, sql in CONSULTAS.items():
+            print(f"== {nombre}")
+            params = (None,) * sql.count("?")
+            for fila in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params):
+                detalle = fila[3]
+                completo = (detalle.startswith("SCAN") and "USING" not in detalle
+                            and "VIRTUAL TABLE" not in detalle)
+                if completo:
+                    escaneos.append((nombre, detalle))
+                print(f"   {'!!' if completo else '  '} {detalle}")
+    finally:
+        conn.close()
+
+    print()
+    if escaneos:
+        print("Consultas con recorrido completo de tabla:")
+        for nombre, detalle in escaneos:
+            print(f"   {nombre}: {detalle}")
+    else:
+        print("Ninguna consulta recorre una tabla completa")
+    return escaneos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migraciones de spa_database.db")
+    parser.add_argument("--bd", default=RUTA_BD, help="Ruta de la base de datos")
+    parser.add_argument("--recalcular-pendientes", action="store_true",
+                        help="Recalcular tratamientos_asignados.componentes_pendientes")
+    parser.add_argument("--explicar", action="store_true",
+                        help="Mostrar EXPLAIN QUERY PLAN de todas las consultas")
+    args = parser.parse_args()
+
+    aplicar_migraciones(args.bd)
+    conn = abrir_conexion(args.bd)
+    print(f"Esquema en la versión {version_actual(conn)}")
+    conn.close()
+
+    if args.recalcular_pendientes:
+        conn = abrir_conexion(args.bd)
+        try:
+            recalcular_componentes_pendientes(conn)
+        finally:
+            conn.close()
+        print("Componentes pendientes recalculados")
+
+    if args.explicar:
+        explicar_consultas(args.bd)
@@ -0,0 +1,34 @@
+import threading
+
+
+class RegistroCambios:
+    # Registro en memoria de los tratamientos asignados que se modificaron
+    # desde este proceso. Cada escritura sube la versión; quien muestra una
+    # lista guarda la versión con la que la cargó y después pide solo los ids
+    # que cambiaron desde entonces, en lugar de recargar todo.
+    def __init__(self):
+        self._version = 0
+        self._cambios = {}
+        self._candado = threading.Lock()
+
+    @property
+    def version(self):
+        with self._candado:
+            return self._version
+
+    def marcar(self, *ids):
+        with self._candado:
+            self._version += 1
+            for id_ in ids:
+                self._cambios[id_] = self._version
+
+    def version_de(self, id_):
+        # Versión de la última escritura sobre id_ (0 si nunca cambió)
+        with self._candado:
+            return self._cambios.get(id_, 0)
+
+    def cambios_desde(self, version):
+        # Devuelve (ids modificados después de version, versión actual)
+        with self._candado:
+            ids = {id_ for id_, v in self._cambios.items() if v > version}
+            return ids, self._version
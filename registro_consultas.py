@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+
+from conexion import obtener_conexion
+
+# Límites superiores (ms) de cada barra del histograma de latencias; la última
+# barra acumula todo lo que supere el último límite
+LIMITES_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class RegistroConsultas:
+    def __init__(self, consultas):
+        # nombre -> SQL. Se ejecuta siempre el mismo objeto de texto, así la
+        # caché de sentencias de sqlite3 (cached_statements) lo reconoce y no
+        # vuelve a preparar la consulta en cada llamada
+        self.consultas = dict(consultas)
+        self._estadisticas = {}
+        self._candado = threading.Lock()
+        # Función (nombre, sql, params, segundos, filas) que se llama después
+        # de cada consulta (ver instrumentacion); con None no cuesta nada
+        self.observador = None
+
+    def ejecutar(self, nombre, params=(), conn=None):
+        sql = self.consultas[nombre]
+        conn = conn or obtener_conexion()
+        inicio = time.perf_counter()
+        cursor = None
+        try:
+            cursor = conn.execute(sql, params)
+            return cursor
+        finally:
+            self._medir(nombre, time.perf_counter() - inicio, sql, params, cursor)
+
+    def ejecutar_lote(self, nombre, lista_params, conn=None):
+        # executemany: la sentencia se prepara una vez para todo el lote y la
+        # medición cuenta el lote como una sola llamada
+        sql = self.consultas[nombre]
+        conn = conn or obtener_conexion()
+        inicio = time.perf_counter()
+        cursor = None
+        try:
+            cursor = conn.executemany(sql, lista_params)
+            return cursor
+        finally:
+            self._medir(nombre, time.perf_counter() - inicio, sql, "(lote)", cursor)
+
+    def consultar(self, nombre, params=(), conn=None):
+        sql = self.consultas[nombre]
+        conn = conn or obtener_conexion()
+        inicio = time.perf_counter()
+        filas = None
+        try:
+            filas = conn.execute(sql, params).fetchall()
+            return filas
+        finally:
+            self._medir(nombre, time.perf_counter() - inicio, sql, params, filas)
+
+    def consultar_uno(self, nombre, params=(), conn=None):
+        sql = self.consultas[nombre]
+        conn = conn or obtener_conexion()
+        inicio = time.perf_counter()
+        fila = None
+        try:
+            fila = conn.execute(sql, params).fetchone()
+            return fila
+        finally:
+            self._medir(nombre, time.perf_counter() - inicio, sql, params, [] if fila is None else [fila])
+
+    def _medir(self, nombre, segundos, sql, params, resultado):
+        if self.observador is not None:
+            # resultado: lista de filas o cursor (filas afectadas; -1 si no aplica)
+            if isinstance(resultado, list):
+                filas = len(resultado)
+            else:
+                filas = resultado.rowcount if resultado is not None and resultado.rowcount >= 0 else None
+            self.observador(nombre, sql, params, segundos, filas)
+        ms = segundos * 1000
+        with self._candado:
+            est = self._estadisticas.get(nombre)
+            if est is None:
+                est = self._estadisticas[nombre] = {
+                    "llamadas": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "histograma": [0] * (len(LIMITES_MS) + 1),
+                }
+            est["llamadas"] += 1
+            est["total_ms"] += ms
+            est["max_ms"] = max(est["max_ms"], ms)
+            est["histograma"][bisect_left(LIMITES_MS, ms)] += 1
+
+    def estadisticas(self):
+        with self._candado:
+            return {
+                nombre: dict(est, histograma=list(est["histograma"]))
+                for nombre, est in self._estadisticas.items()
+            }
+
+    def reiniciar_estadisticas(self):
+        with self._candado:
+            self._estadisticas.clear()
+
+    def resumen(self):
+        # Una línea por consulta, de la que más tiempo acumula a la que menos
+        lineas = []
+        etiquetas = [f"<={limite}ms" for limite in LIMITES_MS] + [f">{LIMITES_MS[-1]}ms"]
+        estadisticas = self.estadisticas()
+        for nombre, est in sorted(estadisticas.items(), key=lambda e: e[1]["total_ms"], reverse=True):
+            promedio = est["total_ms"] / est["llamadas"]
+            barras = " ".join(f"{etiqueta}:{n}" for etiqueta, n in zip(etiquetas, est["histograma"]) if n)
+            lineas.append(
+                f"{nombre}: {est['llamadas']} llamadas, total {est['total_ms']:.1f} ms, "
+                f"promedio {promedio:.2f} ms, máx {est['max_ms']:.1f} ms [{barras}]")
+        return "\n".join(lineas)
+
+    def guardar_estadisticas(self, ruta):
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            json.dump({"limites_ms": LIMITES_MS, "consultas": self.estadisticas()},
+                      archivo, ensure_ascii=False, indent=2)
@@ -0,0 +1,174 @@
+import json
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+from conexion import transaccion
+from consultas_sesiones import consultas, cambios_tratamientos, reservar_numeros_sesion
+from comisiones import calcular_comision
+from datos_referencia import cache_referencia
+from agenda import agendar_proxima_cita
+
+ESTADOS_PAGO = ("PAGADO", "Pendiente")
+
+# Una sesión a registrar. nombre_componente solo para promociones.
+NuevaSesion = namedtuple(
+    "NuevaSesion",
+    "tratamiento_id asistente_id fecha porcentaje estado_pago realizada nombre_componente",
+    defaults=(None,))
+
+
+def validar_sesiones(sesiones, conn):
+    # Revisa todo el lote antes de escribir. Devuelve el monto de cada sesión
+    # y las sesiones que quedan por tratamiento o componente después del
+    # lote. Los errores se juntan en un solo ValueError con la posición de
+    # cada sesión en el lote.
+    ids = sorted({s.tratamiento_id for s in sesiones})
+    ids_json = json.dumps(ids)
+    tratamientos = {fila[0]: fila for fila in consultas.consultar("lote_tratamientos", (ids_json,), conn)}
+    componentes = {(fila[0], fila[1]): fila for fila in consultas.consultar("lote_componentes", (ids_json,), conn)}
+    asistentes = cache_referencia.obtener(conn).nombre_asistente
+
+    restantes = {(id_, ""): fila[2] for id_, fila in tratamientos.items() if not fila[1]}
+    restantes.update(((id_, nombre), fila[2]) for (id_, nombre), fila in componentes.items())
+    errores = []
+    montos = []
+    for posicion, sesion in enumerate(sesiones, 1):
+        monto = None
+        try:
+            tratamiento = tratamientos.get(sesion.tratamiento_id)
+            if tratamiento is None:
+                raise ValueError(f"no existe el tratamiento {sesion.tratamiento_id}")
+            if sesion.asistente_id not in asistentes:
+                raise ValueError(f"no existe el asistente {sesion.asistente_id}")
+            try:
+                datetime.strptime(sesion.fecha, '%Y-%m-%d')
+            except (TypeError, ValueError):
+                raise ValueError(f"fecha inválida: {sesion.fecha}")
+            if not 0 <= float(sesion.porcentaje) <= 100:
+                raise ValueError("el porcentaje debe estar entre 0 y 100")
+            if sesion.estado_pago not in ESTADOS_PAGO:
+                raise ValueError(f"estado de pago inválido: {sesion.estado_pago}")
+
+            if tratamiento[1]:
+                if not sesion.nombre_componente:
+                    raise ValueError("debe indicar el componente de la promoción")
+                componente = componentes.get((sesion.tratamiento_id, sesion.nombre_componente))
+                if componente is None:
+                    raise ValueError(f"la promoción no incluye '{sesion.nombre_componente}'")
+                if restantes[(sesion.tratamiento_id, sesion.nombre_componente)] <= 0:
+                    raise ValueError("No quedan sesiones disponibles para este componente")
+                monto = componente[3]
+            else:
+                if sesion.nombre_componente:
+                    raise ValueError("el tratamiento no es una promoción")
+                if restantes[(sesion.tratamiento_id, "")] <= 0:
+                    raise ValueError("Todas las sesiones del tratamiento han sido completadas")
+                monto = tratamiento[3]
+            # Una sesión realizada y pagada descuenta de las restantes
+            if sesion.realizada and sesion.estado_pago == 'PAGADO':
+                restantes[(sesion.tratamiento_id, sesion.nombre_componente or "")] -= 1
+        except ValueError as e:
+            errores.append(f"Sesión {posicion}: {e}")
+        montos.append(monto)
+
+    if errores:
+        raise ValueError("\n".join(errores))
+    return montos, restantes
+
+
+def registrar_sesiones(sesiones):
+    # Registra un lote de sesiones (tratamientos individuales y componentes
+    # de promoción) en una sola transacción, con los mismos efectos que
+    # registrarlas una por una: número de sesión, sesiones restantes, pagos,
+    # comisiones y el libro de comisiones. Todo o nada.
+    # Devuelve (tratamiento_id, nombre_componente, numero_sesion) por sesión.
+    sesiones = [s if isinstance(s, NuevaSesion) else NuevaSesion(**s) for s in sesiones]
+    if not sesiones:
+        return []
+
+    with transaccion() as conn:
+        montos, restantes = validar_sesiones(sesiones, conn)
+
+        # Numeración: un solo UPSERT por tratamiento o componente del lote
+        grupos = defaultdict(list)
+        for indice, sesion in enumerate(sesiones):
+            grupos[(sesion.tratamiento_id, sesion.nombre_componente or "")].append(indice)
+        numeros = [None] * len(sesiones)
+        for (tratamiento_id, componente), indices in grupos.items():
+            primero = reservar_numeros_sesion(conn, tratamiento_id, componente, len(indices))
+            for desplazamiento, indice in enumerate(indices):
+                numeros[indice] = primero + desplazamiento
+
+        normales, promociones, pagos, comisiones = [], [], [], []
+        comisiones_tratamientos, pagos_asistentes = [], []
+        registrado_en = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for sesion, monto, numero in zip(sesiones, montos, numeros):
+            porcentaje = float(sesion.porcentaje)
+            realizada = 1 if sesion.realizada else 0
+            estado_sesion = 'Realizada' if realizada else 'Pendiente'
+            comision = calcular_comision(monto, porcentaje, realizada, sesion.estado_pago)
+            debe_sumar_comision = realizada and sesion.estado_pago == 'PAGADO'
+
+            if sesion.nombre_componente:
+                promociones.append((
+                    sesion.tratamiento_id, sesion.nombre_componente, sesion.asistente_id, sesion.fecha,
+                    numero, monto, sesion.estado_pago, estado_sesion, porcentaje, sesion.fecha, realizada
+                ))
+                concepto = f"Comisión por sesión {numero} - {sesion.nombre_componente}"
+            else:
+                normales.append((
+                    sesion.tratamiento_id, sesion.asistente_id, sesion.fecha, numero, monto,
+                    sesion.estado_pago, estado_sesion, porcentaje, sesion.fecha,
+                    1 if debe_sumar_comision else 0, realizada
+                ))
+                concepto = f"Comisión por sesión {numero}"
+                # Solo actualizar comisión y sesiones restantes si está pagada Y realizada.
+                # Los mismos contadores que modificar_sesion descuenta si deja de estarlo.
+                if debe_sumar_comision:
+                    pagos.append((monto, monto, sesion.tratamiento_id))
+                    comisiones_tratamientos.append((comision, sesion.tratamiento_id))
+                    pagos_asistentes.append((
+                        sesion.asistente_id, sesion.tratamiento_id, sesion.tratamiento_id, numero,
+                        comision, sesion.fecha, concepto
+                    ))
+
+            if comision:
+                comisiones.append((
+                    sesion.asistente_id, sesion.tratamiento_id,
+                    sesion.tratamiento_id, sesion.nombre_componente or "", numero,
+                    sesion.fecha[:7], comision, concepto, registrado_en
+                ))
+
+        # En este orden: los pagos y el libro buscan la sesión recién
+        # insertada. Los lotes vacíos no se preparan.
+        for nombre, lote in (
+            ("insertar_sesion", normales),
+            ("insertar_sesion_promocion", promociones),
+            ("registrar_pago_sesion", pagos),
+            ("sumar_comision_tratamiento", comisiones_tratamientos),
+            ("insertar_pago_sesion_nueva", pagos_asistentes),
+            ("insertar_comision_sesion_nueva", comisiones),
+        ):
+            if lote:
+                consultas.ejecutar_lote(nombre, lote, conn)
+        # Los componentes de promoción que quedan con todas sus sesiones
+        # realizadas y pagadas los completa trg_progreso_componente_insert
+
+        # Próxima cita: una por tratamiento o componente al que le quedan
+        # sesiones, en el primer hueco del asistente desde una semana después
+        # de la última sesión del lote. Si el asistente no tiene horario
+        # cargado queda la fecha + 7 días de siempre, sin reservar.
+        for (tratamiento_id, componente), indices in grupos.items():
+            if restantes[(tratamiento_id, componente)] <= 0:
+                continue
+            ultima = max(indices, key=lambda i: (sesiones[i].fecha, i))
+            sesion = sesiones[ultima]
+            desde = max(datetime.strptime(sesion.fecha, '%Y-%m-%d') + timedelta(days=7),
+                        datetime.now().replace(second=0, microsecond=0))
+            inicio = agendar_proxima_cita(conn, sesion.asistente_id, tratamiento_id, componente or None, desde)
+            if inicio is not None:
+                consultas.ejecutar("actualizar_proxima_cita", (
+                    inicio[:10], tratamiento_id, componente, numeros[ultima]), conn)
+
+    cambios_tratamientos.marcar(*{s.tratamiento_id for s in sesiones})
+    return [(s.tratamiento_id, s.nombre_componente, numero) for s, numero in zip(sesiones, numeros)]
@@ -0,0 +1,73 @@
+import argparse
+
+from conexion import RUTA_BD, abrir_conexion
+from consultas_sesiones import consultas
+from migraciones import aplicar_migraciones, reconstruir_resumenes
+
+
+def rango(desde, hasta=None):
+    # 'AAAA-MM' lee los resúmenes mensuales y 'AAAA-MM-DD' los diarios
+    hasta = hasta or desde
+    if len(desde) not in (7, 10) or len(hasta) != len(desde):
+        raise ValueError("Los periodos deben ser ambos AAAA-MM o ambos AAAA-MM-DD")
+    return desde, hasta, len(desde)
+
+
+def resumen_sesiones(desde, hasta=None, conn=None):
+    # (periodo, tratamiento, asistente, sesiones, completas, abonado, cobrado)
+    return consultas.consultar("resumen_sesiones", rango(desde, hasta), conn)
+
+
+def resumen_tratamientos(desde, hasta=None, conn=None):
+    # (periodo, tratamiento, tratamientos, costo_total, total_pagado, saldo_pendiente)
+    return consultas.consultar("resumen_tratamientos", rango(desde, hasta), conn)
+
+
+def resumen_reportes(desde, hasta=None, conn=None):
+    # (periodo, concepto, movimientos, ingreso, egreso)
+    return consultas.consultar("resumen_reportes", rango(desde, hasta), conn)
+
+
+def imprimir_periodo(desde, hasta, conn):
+    print("Sesiones")
+    for periodo, tratamiento, asistente, sesiones, completas, abonado, cobrado in resumen_sesiones(desde, hasta, conn):
+        print(f"  {periodo}  {tratamiento or '-'} / {asistente or 'Sin asistente'}: "
+              f"{sesiones} sesiones, {completas} completas, ${abonado:.2f} abonado, ${cobrado:.2f} cobrado")
+
+    print("Tratamientos asignados")
+    for periodo, tratamiento, cantidad, costo, pagado, saldo in resumen_tratamientos(desde, hasta, conn):
+        print(f"  {periodo}  {tratamiento or '-'}: {cantidad} tratamientos, ${costo:.2f} total, "
+              f"${pagado:.2f} pagado, ${saldo:.2f} pendiente")
+
+    print("Reportes")
+    for periodo, concepto, movimientos, ingreso, egreso in resumen_reportes(desde, hasta, conn):
+        print(f"  {periodo}  {concepto}: {movimientos} movimientos, "
+              f"${ingreso:.2f} ingreso, ${egreso:.2f} egreso")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resúmenes diarios y mensuales")
+    parser.add_argument("desde", nargs="?", help="Periodo AAAA-MM (mensual) o AAAA-MM-DD (diario)")
+    parser.add_argument("hasta", nargs="?", help="Periodo final, del mismo tipo que el inicial")
+    parser.add_argument("--bd", default=RUTA_BD, help="Ruta de la base de datos")
+    parser.add_argument("--reconstruir", action="store_true",
+                        help="Recalcular los resúmenes desde las tablas de origen")
+    args = parser.parse_args()
+
+    aplicar_migraciones(args.bd)
+    conn = abrir_conexion(args.bd)
+    try:
+        if args.reconstruir:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                reconstruir_resumenes(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            print("Resúmenes reconstruidos")
+
+        if args.desde:
+            imprimir_periodo(args.desde, args.hasta, conn)
+    finally:
+        conn.close()
@@ -0,0 +1,157 @@
+import json
+from datetime import date, datetime
+
+from conexion import transaccion
+from consultas_sesiones import (consultas, cambios_tratamientos, obtener_pagina_tratamientos,
+                                obtener_tratamientos_por_id)
+from comisiones import calcular_comision, ajustar_comision_sesion
+from detalle_sesiones import cache_detalles, cargar_detalle
+from registro_sesiones import ESTADOS_PAGO, NuevaSesion, registrar_sesiones
+
+# Operaciones de Control de Sesiones sin Tk: la ventana solo arma los
+# formularios y muestra resultados, y lo mismo se puede llamar desde scripts,
+# procesos de trabajo o mediciones. Las escrituras marcan el tratamiento en
+# cambios_tratamientos, igual que registrar_sesiones.
+
+
+def listar_tratamientos(despues_de=None, limite=None, nombre=None, fecha_desde=None, fecha_hasta=None):
+    # (filas, clave de la página siguiente); ver obtener_pagina_tratamientos
+    filtros = {"nombre": nombre, "fecha_desde": fecha_desde, "fecha_hasta": fecha_hasta}
+    if limite is not None:
+        filtros["limite"] = limite
+    return obtener_pagina_tratamientos(despues_de, **filtros)
+
+
+def tratamientos_por_id(ids):
+    return obtener_tratamientos_por_id(ids)
+
+
+def detalle_tratamiento(tratamiento_id, usar_cache=True):
+    # DetalleTratamiento (ver detalle_sesiones) o None si no existe
+    if usar_cache:
+        return cache_detalles.obtener(tratamiento_id)
+    return cargar_detalle(tratamiento_id)
+
+
+def registrar_sesion(tratamiento_id, asistente_id, fecha, porcentaje, estado_pago, realizada,
+                     nombre_componente=None):
+    # Una sesión nueva (nombre_componente solo en promociones); devuelve su
+    # número. Para varias a la vez, registrar_sesiones con NuevaSesion.
+    sesion = NuevaSesion(tratamiento_id, asistente_id, fecha, porcentaje, estado_pago, realizada,
+                         nombre_componente)
+    return registrar_sesiones([sesion])[0][2]
+
+
+def validar_cambios(fecha, porcentaje, estado_pago):
+    try:
+        date.fromisoformat(fecha)
+    except (TypeError, ValueError):
+        raise ValueError(f"Fecha inválida: {fecha}")
+    porcentaje = float(porcentaje)
+    if not 0 <= porcentaje <= 100:
+        raise ValueError("El porcentaje debe estar entre 0 y 100")
+    if estado_pago not in ESTADOS_PAGO:
+        raise ValueError(f"Estado de pago inválido: {estado_pago}")
+    return porcentaje
+
+
+def modificar_sesion(tratamiento_id, numero_sesion, fecha, asistente_id, porcentaje, estado_pago, realizada):
+    # Cambia una sesión de un tratamiento individual y ajusta lo que depende
+    # de que esté realizada y pagada: sesiones restantes, comisión del
+    # tratamiento, pago al asistente y libro de comisiones. El estado
+    # anterior se lee dentro de la misma transacción.
+    porcentaje = validar_cambios(fecha, porcentaje, estado_pago)
+    realizada = 1 if realizada else 0
+    estado_sesion = 'Realizada' if realizada else 'Pendiente'
+    debe_sumar_comision = bool(realizada) and estado_pago == 'PAGADO'
+
+    with transaccion() as conn:
+        sesion_actual = consultas.consultar_uno("estado_sesion", (tratamiento_id, numero_sesion), conn)
+        if sesion_actual is None:
+            raise ValueError(f"No existe la sesión {numero_sesion} del tratamiento {tratamiento_id}")
+        _, porcentaje_anterior, comision_sumada, sesion_id, _ = sesion_actual
+        monto = consultas.consultar_uno("info_tratamiento_sesion", (tratamiento_id,), conn)[3]
+
+        comision_calculada = calcular_comision(monto, porcentaje, realizada, estado_pago)
+        # Lo que se sumó a comision_asistente al registrar o modificar la
+        # sesión, redondeado igual; 0 si no estaba sumada
+        comision_anterior = calcular_comision(monto, porcentaje_anterior, comision_sumada, 'PAGADO')
+
+        if comision_sumada and not debe_sumar_comision:
+            consultas.ejecutar("restar_comision_tratamiento", (comision_anterior, tratamiento_id), conn)
+        elif not comision_sumada and debe_sumar_comision:
+            consultas.ejecutar("sumar_comision_tratamiento", (comision_calculada, tratamiento_id), conn)
+            consultas.ejecutar("insertar_pago_asistente", (
+                asistente_id, tratamiento_id, sesion_id, comision_calculada, fecha,
+                'Sesion', f'Comisión por sesión {numero_sesion}'
+            ), conn)
+        elif comision_sumada and comision_calculada != comision_anterior:
+            # Cambio de porcentaje con la comisión ya sumada: solo la diferencia
+            consultas.ejecutar("sumar_comision_tratamiento", (
+                round(comision_calculada - comision_anterior, 2), tratamiento_id), conn)
+
+        # Sesiones restantes: solo si la sesión cambia de completada a no
+        # completada o al revés
+        if not comision_sumada and debe_sumar_comision:
+            consultas.ejecutar("descontar_sesion_restante", (tratamiento_id,), conn)
+        elif comision_sumada and not debe_sumar_comision:
+            consultas.ejecutar("devolver_sesion_restante", (tratamiento_id,), conn)
+
+        consultas.ejecutar("actualizar_sesion", (
+            fecha, asistente_id, monto, estado_pago, realizada, estado_sesion, porcentaje,
+            1 if debe_sumar_comision else 0, tratamiento_id, numero_sesion
+        ), conn)
+
+        # Libro de comisiones: registrar solo la diferencia
+        ajustar_comision_sesion(conn, sesion_id, tratamiento_id, asistente_id, fecha,
+                                comision_calculada, f'Comisión por sesión {numero_sesion}')
+    cambios_tratamientos.marcar(tratamiento_id)
+
+
+def modificar_sesion_promocion(tratamiento_id, nombre_componente, numero_sesion, fecha, asistente_id,
+                               porcentaje, estado_pago, realizada):
+    # Cambia una sesión de un componente de promoción. El monto es el precio
+    # del componente; si con el cambio todas las sesiones del componente
+    # quedan realizadas y pagadas, trg_progreso_componente_update lo completa.
+    porcentaje = validar_cambios(fecha, porcentaje, estado_pago)
+    realizada = 1 if realizada else 0
+
+    with transaccion() as conn:
+        componentes = {fila[1]: fila for fila in consultas.consultar(
+            "lote_componentes", (json.dumps([tratamiento_id]),), conn)}
+        if nombre_componente not in componentes:
+            raise ValueError(f"La promoción no incluye '{nombre_componente}'")
+        precio = componentes[nombre_componente][3]
+
+        consultas.ejecutar("actualizar_sesion_promocion", (
+            fecha, asistente_id, estado_pago, porcentaje, precio, fecha, realizada,
+            'Realizada' if realizada else 'Pendiente', tratamiento_id, nombre_componente, numero_sesion
+        ), conn)
+
+        # Las promociones también generan comisión
+        fila = consultas.consultar_uno("id_sesion_componente", (tratamiento_id, nombre_componente, numero_sesion), conn)
+        if fila is None:
+            raise ValueError(f"No existe la sesión {numero_sesion} de '{nombre_componente}'")
+        ajustar_comision_sesion(conn, fila[0], tratamiento_id, asistente_id, fecha,
+                                calcular_comision(precio, porcentaje, realizada, estado_pago),
+                                f'Comisión por sesión {numero_sesion} - {nombre_componente}')
+    cambios_tratamientos.marcar(tratamiento_id)
+
+
+def completar_tratamiento(tratamiento_id):
+    # Marca el tratamiento como INACTIVO y registra el ingreso en reportes
+    with transaccion() as conn:
+        consultas.ejecutar("inactivar_tratamiento", (tratamiento_id,), conn)
+
+        tratamiento_info = consultas.consultar_uno("info_reporte_tratamiento", (tratamiento_id,), conn)
+        if tratamiento_info is None:
+            raise ValueError(f"No existe el tratamiento {tratamiento_id}")
+
+        consultas.ejecutar("insertar_reporte", (
+            datetime.now().strftime("%Y-%m-%d"),
+            "Tratamiento completado",
+            tratamiento_info[2],  # Precio del tratamiento
+            0,
+            f"Tratamiento completado - {tratamiento_info[1]} - {tratamiento_info[0]}"
+        ), conn)
+    cambios_tratamientos.marcar(tratamiento_id)